@@ -1,25 +1,16 @@
-import geopandas as gpd
-import pandas as pd
 import numpy as np
 import os
 from pyproj import Transformer
 from tqdm import tqdm
-import json
+from kriging_engine import degenerate_frames
+from frame_store import FrameStoreWriter
+from kriging_parallel import ParallelKriging
+from region_mask import apply_region_mask, china_grid_spec, china_mask
+from station_store import StationStore
 
 HERE = os.path.dirname(__file__)
-ChinaGeoJsonPath = os.path.join(HERE, 'exampleData', 'chinaGeoJson.json')
-exampleAQIPath = os.path.join(HERE, 'exampleData', 'data_merged', 'LOC_AQI_0.csv')
-# 保存在本地的geoJson数据
-chinaGeoData = gpd.read_file(ChinaGeoJsonPath)
-chinaGeoData = chinaGeoData.set_crs("EPSG:4326", allow_override=True)
-
-# EPSG转换器
-transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
-
-js = chinaGeoData
-js_box = js.geometry.total_bounds
-js_box[0],js_box[1] = transformer.transform(js_box[0],js_box[1])
-js_box[2],js_box[3] = transformer.transform(js_box[2],js_box[3])
+# 由 exampleData/0_exampleDataMerge.py 生成的站点时间序列（时间 x 站点）
+exampleAQIPath = os.path.join(HERE, 'exampleData', 'data_merged', 'LOC_AQI.stations')
 
 width = 175
 height = 175
@@ -28,128 +19,111 @@ startTime = 0
 endTime = 1
 variogram_model = 'linear'
 
-grid_lon = np.linspace(js_box[0], js_box[2], width)
-grid_lat = np.linspace(js_box[1], js_box[3], height)
-
 # AQI数据中最大值为 500 ，最小值为 12。
 MAX_VAL= 500
 MIN_VAL = 12
 
-target_val = pd.read_csv(exampleAQIPath)
-location_np = target_val.to_numpy()[:, 0:2]
-np_lng, np_lat = transformer.transform(np.array(target_val['lng'].values), np.array(target_val['lat'].values))
-
-
-prev_z1 = []
-MAX_NP_LNG = max(np_lng)
-MIN_NP_LNG = min(np_lng)
-print(MIN_NP_LNG)
-
-temp_min_val_after_interpolation = 10000
-temp_max_val_after_interpolation = -10000
-
-def Kriging(vals):
-    from pykrige.ok import OrdinaryKriging    
-    OK = OrdinaryKriging(np_lng, np_lat, np.array(vals),  
-                                        variogram_model=variogram_model, 
-                                        exact_values=False)
-    z1, ss1 = OK.execute('grid', grid_lon, grid_lat)
-    mean_kriging = np.mean(z1)
-    max_kriging = np.max(z1)
-    if(max_kriging == mean_kriging):
-        z1 = []
-        # print('Error! max_kriging == mean_kriging')
-    return z1
-
-for slice in range(0,8):
-    res = []
-    print(slice)
-    startTime = 0 + 552 * slice
-    endTime = 0 + 552 * (slice+1)
-    for i in tqdm(range(startTime, endTime)):
-        targetAQIPath = os.path.join(HERE, 'exampleData', 'data_merged', f'LOC_AQI_{i}.csv')
-        vals = pd.read_csv(targetAQIPath)
-        temp_res = Kriging(vals['val'].values)
-        if(len(temp_res) == 0):
-            temp_res = prev_z1
-        prev_z1 = temp_res
-        # 加速计算并降低准度：等比放大，175*175 扩展为 350*350
-        temp_res = np.kron(temp_res, np.ones((expand_ratio, expand_ratio)))
-        res.append(temp_res)
-
-    temp_res = np.array(res).flatten()
-
-    ChinaInCompJsonPath = os.path.join(HERE, 'exampleData', 'chinaChange.json')
-    china = gpd.read_file(ChinaInCompJsonPath, crs='EPSG:4326')  # 非完整的中国地图，排除南海诸岛等GeoJson中未封闭区域
-
-    china_total = gpd.GeoSeries([china.iloc[:-1, :].unary_union], crs='EPSG:4326')
-    china_total_new = china_total.to_crs(epsg=3857)
-
-    grid_lon_for_clip = np.linspace(js_box[0], js_box[2], width * expand_ratio)
-    grid_lat_for_clip = np.linspace(js_box[1], js_box[3], height * expand_ratio)
-
-    # 转换成网格
-    xgrid, ygrid = np.meshgrid(grid_lon_for_clip, grid_lat_for_clip)
-
-    df_grid = pd.DataFrame(dict(long=xgrid.flatten(), lat=ygrid.flatten()))
-    df_grid_geo = gpd.GeoDataFrame(df_grid, geometry=gpd.points_from_xy(df_grid["long"], df_grid["lat"]),
-                                crs='EPSG:3857')
-    js_kde_clip = gpd.clip(df_grid_geo, china_total_new)
-
-    china = None
-    china_total = None
-    grid_lon_for_clip = None
-    grid_lat_for_clip = None
-    xgrid = None
-    ygrid = None
-    df_grid = None
-
-    js_kde_clip['val'] = False
-    df_grid_geo['val'] = True
-    df_grid_geo.update(js_kde_clip)
-
-    # 开始裁切
-    temp_res[np.tile(df_grid_geo['val'].to_numpy(), (endTime - startTime)).tolist()] = 0.0
-    df_grid_geo = None
-    js_kde_clip = None
-
-    ##################################################################
-
-    # 我们发现，转换为3D材质后，Unity坐标系设置不同，需要反转Res
-
-    # 将列表分为 timeRange 组
-    sub_arrays = np.array_split(temp_res, endTime - startTime)
-
-    # 反转分组后的sub_arrays
-    sub_arrays.reverse()
-
-    # 连接反转后的数组
-    temp_res = np.concatenate(sub_arrays)
-
-    sub_arrays = None
-
-    ##################################################################
-    # 导出
-
-    print('Start Output')
-
-    jsonRes = {
-        'xLength': width * expand_ratio,
-        'yLength': height * expand_ratio,
-        'zLength': endTime - startTime,
-        'data': temp_res.tolist()
-    }
-    temp_res = []
-
-    jsonResStr = json.dumps(jsonRes)
-    jsonRes = {}
-
-    if(not os.path.exists(os.path.join(HERE, 'InterpolateResult'))):
-        os.makedirs(os.path.join(HERE, 'InterpolateResult'))
-
-    OutputPath = os.path.join(HERE, 'InterpolateResult', f'volume_{variogram_model}_timeWidth_{startTime}_{endTime}_definition_{width}_{height}_expand_ratio_{expand_ratio}_sill_test.json')
-    f = open(OutputPath, 'w')
-    f.write(jsonResStr)
-    jsonResStr = ''
-    f.close()
-
+# 批量克里金：站点坐标不变，每个时间窗口只拟合一次变差函数、分解一次克里金矩阵
+# variogram_parameters 为 None 时按窗口拟合；也可以固定为 pykrige 参数列表，如 linear 的 [slope, nugget]
+variogram_parameters = None
+kriging_tile_size = 4096
+# 站点缺测（NaN）时，按可用站点组合缓存的克里金系统数量
+kriging_cache_entries = 16
+# 局部邻域克里金：None 为全局克里金；站点很多（如 2000+）时设为每个网格块使用的最近站点数，如 32
+kriging_neighbours = None
+kriging_block_size = 8
+# 并行插值：worker 进程数（None 为 CPU 核数，1 为单进程，结果逐字节一致）与每批帧数
+kriging_workers = None
+kriging_batch_size = 24
+# 只对中国境内的网格点做插值（境外网格最终会被裁切为 0）
+kriging_mask_cells = True
+# 工作精度：插值结果、网格权重缓存与帧存储的类型（克里金求解始终为 float64）。
+# 最终产品为 uint8，float32 已足够，误差见 check_precision.py；需要对照时改为 np.float64
+working_dtype = np.float32
+
+
+if __name__ == '__main__':
+    # EPSG转换器
+    transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+
+    # 网格范围取自本地 geoJson 数据的总范围（EPSG:3857）
+    grid_spec = china_grid_spec(width, height)
+    js_box = [grid_spec.x0, grid_spec.y0, grid_spec.x1, grid_spec.y1]
+
+    grid_lon = np.linspace(js_box[0], js_box[2], width)
+    grid_lat = np.linspace(js_box[1], js_box[3], height)
+
+    station_store = StationStore(exampleAQIPath)
+    np_lng, np_lat = transformer.transform(station_store.lng, station_store.lat)
+
+
+    prev_z1 = []
+    MAX_NP_LNG = max(np_lng)
+    MIN_NP_LNG = min(np_lng)
+    print(MIN_NP_LNG)
+
+    temp_min_val_after_interpolation = 10000
+    temp_max_val_after_interpolation = -10000
+
+    # 中国地图裁切掩膜与时间无关，在所有时间窗口之前只计算一次（栅格化结果缓存在 MaskCache）
+    # True 为中国境内的网格点，形状与放大后的帧一致
+    china_mask_2d = china_mask(width * expand_ratio, height * expand_ratio)
+
+    # 插值只计算中国境内的网格：放大前的网格点只要有一个放大后的子格在境内就需要计算
+    kriging_cell_mask = None
+    if kriging_mask_cells:
+        kriging_cell_mask = china_mask_2d.reshape(height, expand_ratio, width, expand_ratio).any(axis=(1, 3))
+
+    with ParallelKriging(np_lng, np_lat, grid_lon, grid_lat,
+                         variogram_model=variogram_model,
+                         variogram_parameters=variogram_parameters,
+                         tile_size=kriging_tile_size,
+                         cache_entries=kriging_cache_entries,
+                         n_neighbours=kriging_neighbours,
+                         block_size=kriging_block_size,
+                         cell_mask=kriging_cell_mask,
+                         workers=kriging_workers,
+                         batch_size=kriging_batch_size,
+                         dtype=working_dtype) as kriging:
+        for slice in range(0,8):
+            print(slice)
+            startTime = 0 + 552 * slice
+            endTime = 0 + 552 * (slice+1)
+            zLength = endTime - startTime
+            # 一次切片读取整个时间窗口的站点观测值 (zLength, 站点数)
+            window_vals = station_store.window(startTime, endTime)
+
+            if(not os.path.exists(os.path.join(HERE, 'InterpolateResult'))):
+                os.makedirs(os.path.join(HERE, 'InterpolateResult'))
+
+            # 二进制帧存储（working_dtype，可内存映射按帧读取），预先分配，插值结果逐帧直接写入
+            OutputPath = os.path.join(HERE, 'InterpolateResult', f'volume_{variogram_model}_timeWidth_{startTime}_{endTime}_definition_{width}_{height}_expand_ratio_{expand_ratio}_sill_test.frames')
+            with FrameStoreWriter(OutputPath,
+                                  xLength=width * expand_ratio,
+                                  yLength=height * expand_ratio,
+                                  zLength=zLength,
+                                  dtype=working_dtype,
+                                  grid=china_grid_spec(width * expand_ratio, height * expand_ratio),
+                                  startTime=startTime,
+                                  endTime=endTime,
+                                  timeReversed=True) as writer:
+                # 按批并行插值，结果按时间顺序返回；退化帧回退到上一帧（跨批次、跨窗口）
+                t = 0
+                for z_batch in tqdm(kriging.iter_batches(window_vals),
+                                    total=-(-zLength // kriging_batch_size)):
+                    degenerate = degenerate_frames(z_batch, kriging_cell_mask)
+                    for temp_res, is_degenerate in zip(z_batch, degenerate):
+                        if(is_degenerate):
+                            temp_res = prev_z1
+                        prev_z1 = temp_res
+
+                        # 我们发现，转换为3D材质后，Unity坐标系设置不同，需要反转时间顺序：
+                        # 第 t 帧直接写到反转后的位置 zLength - 1 - t。
+                        # 加速计算并降低准度：写入时等比放大，175*175 扩展为 350*350
+                        frame = writer.write(zLength - 1 - t, temp_res, upsample=expand_ratio)
+
+                        # 裁切（只作用于刚写入的这一帧）
+                        apply_region_mask(frame, china_mask_2d, 0.0)
+                        t += 1
+            window_vals = None
+            print('Output', OutputPath)
@@ -1,148 +1,118 @@
 # -*- coding: utf-8 -*-
-import pandas as pd
 import numpy as np
 from tqdm import *
 import os
-from pyproj import Transformer
 import time
-import geopandas as gpd
+from contextlib import nullcontext
+from frame_store import FrameStore
+from smooth_engine import load_halo
+from smooth_kernels import kernel_halo, smooth3d
+from smooth_parallel import ParallelBoxSmoother
+from quantize import quantize_mapping, quantize_to_file, scan_range
+from region_mask import apply_region_mask, china_mask
 
 HERE = os.path.dirname(__file__)
-for index in range(0,8):
-    print(f'index:{index + 1}/8')
-    interpolateFileName = f"volume_linear_timeWidth_{0 + index * 552}_{0 + (index+1) * 552}_definition_175_175_expand_ratio_2_sill_test"
-    # fileName = 'volume_linear_timeWidth_0_512_definition_175_175_expand_ratio_2_sill'
-    importDataPath = os.path.join(HERE, 'InterpolateResult', f'{interpolateFileName}.json')
 
-    pd_test_pred = pd.read_json(importDataPath)
-    data = pd_test_pred['data']
-    xLength = pd_test_pred['xLength'].values[0]
-    yLength = pd_test_pred['yLength'].values[0]
-    zLength = pd_test_pred['zLength'].values[0]
-    spatial_window_radius = 2
-    temporal_window_radius = 24
-
-    if(index != 0):
-        prevFileName = f"volume_linear_timeWidth_{0 + (index-1) * 552}_{0 + (index) * 552}_definition_175_175_expand_ratio_2_sill_test"
-        prevDataPath = os.path.join(HERE, 'InterpolateResult',  f'{prevFileName}.json')
-        prev_pd_test_pred = pd.read_json(prevDataPath)
-    if(index != 7):
-        nextFileName = f"volume_linear_timeWidth_{0 + (index+1) * 552}_{0 + (index+2) * 552}_definition_175_175_expand_ratio_2_sill_test"
-        nextDataPath = os.path.join(HERE, 'InterpolateResult', f'{nextFileName}.json')
-        next_pd_test_pred = pd.read_json(nextDataPath)
-
-    # TODO: 优化
-    def smooth3d_mean(zLength,xLength,yLength):
-        _data3d = np.array(data).reshape(zLength,xLength,yLength)
-        temp_data = np.array(data).reshape(zLength,xLength,yLength)
-        _spatial_window_radius = spatial_window_radius
-        _temporal_window_radius = temporal_window_radius
-        for t in tqdm(range(zLength)):
-            start_t = max(0, t - _temporal_window_radius)
-            end_t = min(zLength, t + _temporal_window_radius)
-            if(index != 0 and end_t != t + _temporal_window_radius):
-                prev_data = np.array(prev_pd_test_pred['data']).reshape(zLength,xLength,yLength)
-            if(index != 7 and start_t != t - _temporal_window_radius):
-                next_data = np.array(next_pd_test_pred['data']).reshape(zLength,xLength,yLength)
-            for x in range(xLength):
-                start_x = max(0, x - _spatial_window_radius)
-                end_x = min(xLength, x + _spatial_window_radius)
-                for y in range(yLength):
-                    start_y = max(0, y - _spatial_window_radius)
-                    end_y = min(yLength, y + _spatial_window_radius)
-                    window = temp_data[start_t:end_t, start_x:end_x, start_y:end_y]
-                    if(index != 7 and start_t != t - _temporal_window_radius):
-                        window = np.append(window.flatten(), next_data[zLength - temporal_window_radius + t: zLength, start_x:end_x, start_y:end_y].flatten(), axis=0)
-                    if(index != 0 and end_t != t + _temporal_window_radius):
-                        window = np.append(window.flatten(), prev_data[0: t + _temporal_window_radius - zLength, start_x:end_x, start_y:end_y].flatten(), axis=0)
-                    _data3d[t][x][y] = window.mean()
-        return _data3d
-
-    def clipedChinaFrame(data):
-        # 裁切中国地图
-        temp_res = data
-
-        ChinaInCompJsonPath = os.path.join(HERE, 'exampleData', 'chinaChange.json')
-        ChinaGeoJsonPath = os.path.join(HERE, 'exampleData', 'chinaGeoJson.json')
-        china = gpd.read_file(ChinaInCompJsonPath, crs='EPSG:4326')  # 非完整的中国地图，排除南海诸岛等GeoJson中未封闭区域
-        # 使用本地geoJson数据
-        chinaGeoData = gpd.read_file(ChinaGeoJsonPath, crs='EPSG:4326')
-        china_total = gpd.GeoSeries([china.iloc[:-1, :].unary_union], crs='EPSG:4326')
-        china_total_new = china_total.to_crs(epsg=3857)
-
-        js = chinaGeoData
-        transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
-        js_box = js.geometry.total_bounds
-        js_box[0],js_box[1] = transformer.transform(js_box[0],js_box[1])
-        js_box[2],js_box[3] = transformer.transform(js_box[2],js_box[3])
-        china = None
-        grid_lon_for_clip = np.linspace(js_box[0], js_box[2], xLength)
-        grid_lat_for_clip = np.linspace(js_box[1], js_box[3], yLength)
-        # 转换成网格
-        xgrid, ygrid = np.meshgrid(grid_lon_for_clip, grid_lat_for_clip)
-
-        df_grid = pd.DataFrame(dict(long=xgrid.flatten(), lat=ygrid.flatten()))
-        df_grid_geo = gpd.GeoDataFrame(df_grid, geometry=gpd.points_from_xy(df_grid["long"], df_grid["lat"]),
-                                    crs='EPSG:3857')
-        js_kde_clip = gpd.clip(df_grid_geo, china_total_new)
-
-
-        js_kde_clip['val'] = False
-        df_grid_geo['val'] = True
-
-        # df_grid_geo中为True的部分会被裁切
-        # df_grid_geo中为False的部分表示中国地图
-        df_grid_geo.update(js_kde_clip)
-
-
-        # 裁切
-        temp_res[np.tile(df_grid_geo['val'].to_numpy(), (zLength)).tolist()] = 0.0
-
-        return temp_res
-
-    # 三维均值滤波
-    startTime = time.time()
-    smoooth_res = smooth3d_mean(zLength,xLength,yLength).reshape(xLength * yLength * zLength)
-    timeCost = time.time() - startTime
-    print(f'timeCost per timestamp:{timeCost / zLength}')
-
-    smoooth_res = clipedChinaFrame(smoooth_res)
-
-    smoooth_res = np.array(smoooth_res)
-
-    def map_values_with_condition(input_array):
-        min_value = 1
-        max_value = 500
-
-        # 归一化到0~255
-        mapped_array = np.where(input_array == 0, 1, ((input_array - min_value) / (max_value - min_value)) * 249 + 5)
-
-        # 将数据类型转换为整数
-        mapped_array = np.round(mapped_array).astype(int)
-
-        return mapped_array
-    smoooth_res = map_values_with_condition(smoooth_res)
-    smoooth_res = smoooth_res.astype(np.uint8)
-
-    ##################################################################
-    # 导出
-
-    if(not os.path.exists(os.path.join(HERE, 'UnityRawData'))):
-        os.makedirs(os.path.join(HERE, 'UnityRawData'))
-
-    fileName = f'{interpolateFileName}_smooth_s_{spatial_window_radius}_t_{temporal_window_radius}_smooth_correct.raw'
-    outputRawPath = os.path.join(HERE, 'UnityRawData', fileName)
-    smoooth_res.tofile(outputRawPath)
-    # xLength = json_res_pd['xLength'].values[0]
-    # yLength = json_res_pd['yLength'].values[0]
-    # zLength = json_res_pd['zLength'].values[0]
-    json_res_pd = None
-    print(f'x:{xLength}')
-    print(f'y:{yLength}')
-    print(f'z:{zLength}')
-
-    # 编写并导出配置文件ini
-    outputIniPath = os.path.join(HERE, 'UnityRawData', f'{fileName}.ini')
-    with open(outputIniPath, 'w') as f:
-        ini = f'dimx:{xLength} \n' + f'dimy:{yLength} \n' + f'dimz:{zLength} \n' + 'skip:0 \nformat:uint8'
-        f.write(ini)
\ No newline at end of file
+# 平滑核：'box'（盒式均值）、'gaussian'（递归高斯）、'exponential'（对称指数）、'median'（可分离中值）
+# 下面两个尺度相互独立：box / median 为窗口半径，gaussian 为 σ，exponential 为衰减长度 τ
+smooth_kernel = 'box'
+spatial_window_radius = 2
+temporal_window_radius = 24
+# 归一化卷积：只让中国境内（未被裁切为 0）的网格参与平均，sum(v * m) / sum(m)，避免海岸附近的低值边缘
+smooth_mask_normalized = False
+# 并行平滑（只用于 'box'）：worker 进程数（None 为 CPU 核数，1 为单进程，结果逐字节一致）
+smooth_workers = None
+# 量化：输出格式 'uint8' / 'uint16'（Unity 均可读取）/ 'float16'；
+# 量程为固定的 (min, max)（默认与原映射相同），或 'minmax' / 'percentile'（每个切片分块扫描得到）
+quantize_format = 'uint8'
+quantize_range = (1, 500)
+# 工作精度：整卷数据、光晕与共享缓冲区的类型（前缀和在分块内始终为 float64），
+# float32 时内存与带宽减半，误差见 check_precision.py
+working_dtype = np.float32
+
+
+if __name__ == '__main__':
+    # 进程池与 /dev/shm 中的共享缓冲区只在 'box' 时创建，其他平滑核在普通数组中计算
+    if(smooth_kernel == 'box'):
+        smootherContext = ParallelBoxSmoother(spatial_window_radius, temporal_window_radius,
+                                              workers=smooth_workers, dtype=working_dtype)
+    else:
+        smootherContext = nullcontext()
+    with smootherContext as smoother:
+        for index in range(0,8):
+            print(f'index:{index + 1}/8')
+            interpolateFileName = f"volume_linear_timeWidth_{0 + index * 552}_{0 + (index+1) * 552}_definition_175_175_expand_ratio_2_sill_test"
+            # fileName = 'volume_linear_timeWidth_0_512_definition_175_175_expand_ratio_2_sill'
+            importDataPath = os.path.join(HERE, 'InterpolateResult', f'{interpolateFileName}.frames')
+
+            # 二进制帧存储：文件头给出维度，数据区内存映射
+            frame_store = FrameStore(importDataPath)
+            xLength = frame_store.header['xLength']
+            yLength = frame_store.header['yLength']
+            zLength = frame_store.header['zLength']
+            # 切片直接读入工作缓冲区（working_dtype，'box' 时为共享缓冲区），平滑在其中原地进行
+            if(smoother is not None):
+                data = smoother.volume((zLength, xLength, yLength))
+            else:
+                data = np.empty((zLength, xLength, yLength), dtype=working_dtype)
+            data[...] = frame_store.data.reshape(zLength, xLength, yLength)
+
+            # 相邻切片只读取时间窗口需要的光晕帧（box 为各 temporal_window_radius 帧），每个切片读一次：
+            # 起点一侧取下一个切片的最后 r 帧，终点一侧取上一个切片的最前 r 帧
+            prevDataPath = None
+            nextDataPath = None
+            if(index != 0):
+                prevFileName = f"volume_linear_timeWidth_{0 + (index-1) * 552}_{0 + (index) * 552}_definition_175_175_expand_ratio_2_sill_test"
+                prevDataPath = os.path.join(HERE, 'InterpolateResult',  f'{prevFileName}.frames')
+            if(index != 7):
+                nextFileName = f"volume_linear_timeWidth_{0 + (index+1) * 552}_{0 + (index+2) * 552}_definition_175_175_expand_ratio_2_sill_test"
+                nextDataPath = os.path.join(HERE, 'InterpolateResult', f'{nextFileName}.frames')
+            halo_length = kernel_halo(smooth_kernel, temporal_window_radius)
+            prev_halo = load_halo(prevDataPath, halo_length, tail=False, shape=(xLength, yLength), dtype=working_dtype)
+            next_halo = load_halo(nextDataPath, halo_length, tail=True, shape=(xLength, yLength), dtype=working_dtype)
+
+            smooth_mask = china_mask(xLength, yLength) if smooth_mask_normalized else None
+
+            def smooth3d_mean(zLength,xLength,yLength):
+                # 三维盒式均值（前缀和实现，窗口 [t-r, t+r) x [x-s, x+s) x [y-s, y+s)，边缘截断）
+                # 多进程时按空间行 / 时间帧块分给 worker，结果与单进程逐字节一致
+                if(smooth_kernel == 'box'):
+                    return smoother.smooth(data, pre=next_halo, post=prev_halo, mask=smooth_mask)
+                # 其他平滑核（递归滤波，代价与尺度无关），在工作缓冲区中原地计算
+                return smooth3d(data, smooth_kernel, spatial_window_radius, temporal_window_radius,
+                                pre=next_halo, post=prev_halo, out=data, mask=smooth_mask)
+
+            def clipedChinaFrame(data):
+                # 裁切中国地图：栅格化掩膜缓存在 MaskCache 中，2D 掩膜按时间广播
+                # china_mask 中为 False 的部分会被裁切，为 True 的部分表示中国地图
+                return apply_region_mask(data, china_mask(xLength, yLength), 0.0)
+
+            # 三维均值滤波
+            startTime = time.time()
+            smoooth_res = smooth3d_mean(zLength,xLength,yLength).reshape(xLength * yLength * zLength)
+            timeCost = time.time() - startTime
+            print(f'timeCost per timestamp:{timeCost / zLength}')
+
+            smoooth_res = clipedChinaFrame(smoooth_res)
+
+            ##################################################################
+            # 导出
+
+            if(not os.path.exists(os.path.join(HERE, 'UnityRawData'))):
+                os.makedirs(os.path.join(HERE, 'UnityRawData'))
+
+            kernelName = '' if smooth_kernel == 'box' else f'_{smooth_kernel}'
+            if(smooth_mask_normalized):
+                kernelName += '_masked'
+            fileName = f'{interpolateFileName}_smooth{kernelName}_s_{spatial_window_radius}_t_{temporal_window_radius}_smooth_correct.raw'
+            outputRawPath = os.path.join(HERE, 'UnityRawData', fileName)
+
+            # 分块量化，直接写出 .raw 与配置文件 .ini（附带映射参数）
+            value_range = quantize_range
+            if(isinstance(value_range, str)):
+                value_range = scan_range(smoooth_res, value_range)
+            mapping = quantize_mapping(value_range, quantize_format)
+            quantize_to_file(smoooth_res, outputRawPath, mapping, (xLength, yLength, zLength))
+            print(f'x:{xLength}')
+            print(f'y:{yLength}')
+            print(f'z:{zLength}')
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+流式数据平滑脚本
+输出与 2_Smooth.py 相同的 UnityRawData，但不再按切片整体载入，而是把全部切片视为一条连续时间线逐帧平滑
+
+主要改进：
+1. 插值结果在每个切片内部已按 Unity 坐标系反转时间，按切片倒序（7, 6, ..., 0）依次读取帧，
+   就得到整条反转后的时间线；2_Smooth.py 中跨切片的光晕即为这条时间线上的相邻帧，不再有切片接缝
+2. 滑动窗口只保留 2r 帧的环形缓冲与时间方向的滑动和，窗口完整的帧立即输出
+3. 输出帧逐帧裁切、量化（quantize_chunk）并写入对应切片 .raw 的内存映射，内存与时间线长度无关
+"""
+
+import numpy as np
+from tqdm import tqdm
+import os
+import time
+from frame_store import FrameStore
+from smooth_engine import stream_box_smooth
+from region_mask import apply_region_mask, china_mask
+from quantize import quantize_chunk, quantize_mapping, write_quantized_ini
+
+HERE = os.path.dirname(__file__)
+
+slice_count = 8
+slice_length = 552
+spatial_window_radius = 2
+temporal_window_radius = 24
+# 归一化卷积：只让中国境内的网格参与平均（同 2_Smooth.py）
+smooth_mask_normalized = False
+# 量化输出格式与量程（见 2_Smooth.py）；逐帧输出，只支持固定量程
+quantize_format = 'uint8'
+quantize_range = (1, 500)
+# 工作精度：环形缓冲与输出帧的类型（见 2_Smooth.py）
+working_dtype = np.float32
+
+
+mapping = quantize_mapping(quantize_range, quantize_format)
+
+if(not os.path.exists(os.path.join(HERE, 'UnityRawData'))):
+    os.makedirs(os.path.join(HERE, 'UnityRawData'))
+
+# 按时间线顺序（切片倒序）排列输入与输出
+timeline = []
+for index in reversed(range(slice_count)):
+    interpolateFileName = f"volume_linear_timeWidth_{0 + index * slice_length}_{0 + (index+1) * slice_length}_definition_175_175_expand_ratio_2_sill_test"
+    frame_store = FrameStore(os.path.join(HERE, 'InterpolateResult', f'{interpolateFileName}.frames'))
+    xLength = frame_store.header['xLength']
+    yLength = frame_store.header['yLength']
+    zLength = frame_store.header['zLength']
+
+    kernelName = '_masked' if smooth_mask_normalized else ''
+    fileName = f'{interpolateFileName}_smooth{kernelName}_s_{spatial_window_radius}_t_{temporal_window_radius}_smooth_correct.raw'
+    outputRawPath = os.path.join(HERE, 'UnityRawData', fileName)
+    output = np.memmap(outputRawPath, dtype=mapping.format, mode='w+', shape=(zLength, xLength, yLength))
+
+    # 编写并导出配置文件ini（附带映射参数）
+    write_quantized_ini(outputRawPath, (xLength, yLength, zLength), mapping)
+
+    timeline.append((frame_store, output))
+
+offsets = np.cumsum([0] + [store.zLength for store, _ in timeline])
+china_mask_2d = china_mask(xLength, yLength)
+scratch = np.empty(xLength * yLength, dtype=working_dtype)
+
+
+def timeline_frames():
+    for frame_store, _ in timeline:
+        for k in range(frame_store.zLength):
+            yield frame_store.frame(k).reshape(xLength, yLength)
+
+
+startTime = time.time()
+smooth_mask = china_mask_2d if smooth_mask_normalized else None
+for t, frame in tqdm(stream_box_smooth(timeline_frames(), spatial_window_radius, temporal_window_radius,
+                                       mask=smooth_mask, dtype=working_dtype),
+                     total=int(offsets[-1])):
+    # 第 t 帧属于时间线上的第 position 个切片
+    position = int(np.searchsorted(offsets, t, side='right')) - 1
+    output = timeline[position][1]
+
+    # 裁切中国地图（2D 掩膜），量化后直接写入输出帧
+    apply_region_mask(frame, china_mask_2d, 0.0)
+    quantize_chunk(frame.reshape(-1), mapping, output[t - offsets[position]].reshape(-1), scratch)
+timeCost = time.time() - startTime
+print(f'timeCost per timestamp:{timeCost / offsets[-1]}')
+
+for frame_store, output in timeline:
+    output.flush()
+print(f'x:{xLength}')
+print(f'y:{yLength}')
+print(f'z:{offsets[-1]}')
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+平滑参数扫描脚本
+一次运行输出多组平滑半径 / 平滑核 / 边界处理方法的 .raw / .ini，便于在 Unity 中对比
+
+主要改进：
+1. 输入切片与光晕帧只读取一次
+2. 盒式均值的所有半径共用一张三维累加和表，只建表一次
+3. 每个变体单独计时，汇总写入 sweep_timing.json
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from frame_store import FrameStore
+from quantize import quantize_mapping, quantize_to_file
+from region_mask import china_mask
+from smooth_engine import load_halo
+from smooth_sweep import SmoothSweep, sweep_halo, sweep_variants
+
+HERE = os.path.dirname(__file__)
+
+# 扫描的切片与参数（所有组合都会输出）
+sweep_slice = 0
+sweep_kernels = ['box']
+sweep_spatial_radii = [1, 2, 3]
+sweep_temporal_radii = [12, 24, 48]
+# 'none' / 'masked'（归一化卷积）/ 'neumann' / 'gaussian' / 'reflect' / 'selective' /
+# 'coastline' / 'coastline_gaussian'（只混合海岸线附近的网格）
+sweep_boundary_methods = ['none', 'masked', 'neumann']
+# 量化输出格式与固定量程（见 2_Smooth.py），所有变体相同，便于对比
+quantize_format = 'uint8'
+quantize_range = (1, 500)
+# 工作精度（见 2_Smooth.py；累加和表始终为 float64）
+working_dtype = np.float32
+
+
+def sliceFileName(index):
+    return f"volume_linear_timeWidth_{0 + index * 552}_{0 + (index+1) * 552}_definition_175_175_expand_ratio_2_sill_test"
+
+
+if __name__ == '__main__':
+    variants = sweep_variants(sweep_kernels, sweep_spatial_radii, sweep_temporal_radii, sweep_boundary_methods)
+    print(f'variants:{len(variants)}')
+
+    # 1. 读取一次输入与光晕帧
+    loadStartTime = time.time()
+    interpolateFileName = sliceFileName(sweep_slice)
+    frame_store = FrameStore(os.path.join(HERE, 'InterpolateResult', f'{interpolateFileName}.frames'))
+    xLength = frame_store.header['xLength']
+    yLength = frame_store.header['yLength']
+    zLength = frame_store.header['zLength']
+    data = frame_store.read(dtype=working_dtype).reshape(zLength, xLength, yLength)
+
+    halo_length = sweep_halo(variants)
+    prevDataPath = None
+    nextDataPath = None
+    if(sweep_slice != 0):
+        prevDataPath = os.path.join(HERE, 'InterpolateResult', f'{sliceFileName(sweep_slice - 1)}.frames')
+    if(sweep_slice != 7):
+        nextDataPath = os.path.join(HERE, 'InterpolateResult', f'{sliceFileName(sweep_slice + 1)}.frames')
+    prev_halo = load_halo(prevDataPath, halo_length, tail=False, shape=(xLength, yLength), dtype=working_dtype)
+    next_halo = load_halo(nextDataPath, halo_length, tail=True, shape=(xLength, yLength), dtype=working_dtype)
+
+    sweep = SmoothSweep(data, pre=next_halo, post=prev_halo, mask=china_mask(xLength, yLength))
+    print(f'load timeCost:{time.time() - loadStartTime}')
+
+    mapping = quantize_mapping(quantize_range, quantize_format)
+    outputDir = os.path.join(HERE, 'UnityRawData', 'Sweep')
+    if(not os.path.exists(outputDir)):
+        os.makedirs(outputDir)
+
+    # 2. 依次计算每个变体并导出
+    timing = []
+    for variant in variants:
+        startTime = time.time()
+        smooth_res = sweep.smooth(variant)
+        smoothTime = time.time() - startTime
+        smooth_res = sweep.finish(smooth_res, variant)
+
+        fileName = (f'{interpolateFileName}_smooth_{variant.kernel}_s_{variant.spatial_scale}'
+                    f'_t_{variant.temporal_scale}_{variant.boundary_method}.raw')
+        outputRawPath = os.path.join(outputDir, fileName)
+        quantize_to_file(smooth_res, outputRawPath, mapping, (xLength, yLength, zLength))
+
+        timeCost = time.time() - startTime
+        timing.append(dict(variant._asdict(), file=fileName, smoothTime=smoothTime, totalTime=timeCost))
+        print(f'{fileName} smooth:{smoothTime:.2f}s total:{timeCost:.2f}s')
+
+    with open(os.path.join(outputDir, 'sweep_timing.json'), 'w') as f:
+        json.dump(timing, f, indent=2)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+时间汇总脚本
+把 2_Smooth.py 输出的 8 个按小时的切片汇总为按天 / 按周的均值、最大值、最小值体数据，
+写到 UnityRawData/Rollup/，体积为原来的 1/24 ~ 1/168，可以直接在 Unity 中浏览整个时间段
+"""
+
+import os
+import time
+
+from temporal_rollup import temporal_rollup
+
+HERE = os.path.dirname(__file__)
+
+# 输入切片：2_Smooth.py 输出文件名中平滑参数之后的部分（与 2_Smooth.py 的设置一致）
+rollup_source_suffix = '_smooth_s_2_t_24_smooth_correct'
+# 时间步长（小时）：24 为按天，168 为按周；跨越切片边界的窗口会正确合并
+rollup_strides = [24, 168]
+# 统计量：'mean' / 'max' / 'min'
+rollup_stats = ['mean', 'max', 'min']
+
+
+def sliceFileName(index):
+    return f"volume_linear_timeWidth_{0 + index * 552}_{0 + (index+1) * 552}_definition_175_175_expand_ratio_2_sill_test"
+
+
+if __name__ == '__main__':
+    iniPaths = [os.path.join(HERE, 'UnityRawData', f'{sliceFileName(index)}{rollup_source_suffix}.raw.ini')
+                for index in range(0, 8)]
+    outputDir = os.path.join(HERE, 'UnityRawData', 'Rollup')
+
+    startTime = time.time()
+    paths = temporal_rollup(iniPaths, outputDir, f'volume_linear_timeWidth_0_{8 * 552}{rollup_source_suffix}',
+                            strides=rollup_strides, stats=rollup_stats)
+    timeCost = time.time() - startTime
+
+    for (stride, stat), path in paths.items():
+        print(f'{stride}h {stat}: {os.path.basename(path)}')
+    print(f'timeCost:{timeCost:.2f}s')
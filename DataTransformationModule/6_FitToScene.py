@@ -1,6 +1,8 @@
-import numpy as np
 import os
 
+from volume_crop import box_shape, fit_box, stream_crop
+from volume_io import open_volume
+
 def fit_to_scene(ini_path, unity_size):
     print(f"--- 开始适配场景数据 ---")
     
@@ -11,57 +13,28 @@ def fit_to_scene(ini_path, unity_size):
     print(f"目标水平比例 (X/Z): {target_ratio:.3f}")
 
     # 1. 读取原始数据
-    params = {}
-    with open(ini_path, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if ':' in line:
-                key, value = line.split(':', 1)
-                params[key.strip().lower()] = value.strip()
-    
-    width = int(params['dimx'])   # Data X
-    height = int(params['dimy'])  # Data Y (对应 Unity Z)
-    depth = int(params['dimz'])   # Data Z (对应 Unity Y)
-    fmt = params.get('format', 'uint8')
+    source = open_volume(ini_path)
+    width, height, depth = source.dims  # Data X / Data Y (对应 Unity Z) / Data Z (对应 Unity Y)
+    fmt = source.format
     
     print(f"原始数据尺寸: X={width}, Y={height}, Z={depth}")
     data_ratio = width / height
     print(f"原始数据比例 (X/Y): {data_ratio:.3f}")
 
-    # 读取二进制
-    type_map = {'uint8': np.uint8, 'uchar': np.uint8}
-    dtype = type_map.get(fmt, np.uint8)
-    raw_path = os.path.splitext(ini_path)[0]
-    if not os.path.exists(raw_path) and not raw_path.endswith('.raw'): raw_path += ".raw"
-    data = np.fromfile(raw_path, dtype=dtype)
-    volume = data.reshape((depth, height, width)) # (Z, Y, X)
-
     # 2. 计算裁剪范围 (保持中心裁剪)
     # 我们需要让 New_X / New_Y = target_ratio
-    
+    box = fit_box(source.shape, unity_size)
     if data_ratio > target_ratio:
         # 数据太宽，需要裁掉 X 轴两边
-        new_width = int(height * target_ratio)
-        new_height = height
-        start_x = (width - new_width) // 2
-        crop_slice = (slice(None), slice(None), slice(start_x, start_x + new_width))
-        print(f"策略: 裁剪 X 轴。保留 X: [{start_x} : {start_x + new_width}]")
+        print(f"策略: 裁剪 X 轴。保留 X: [{box.x0} : {box.x1}]")
     else:
         # 数据太长，需要裁掉 Y 轴两边
-        new_width = width
-        new_height = int(width / target_ratio)
-        start_y = (height - new_height) // 2
-        crop_slice = (slice(None), slice(start_y, start_y + new_height), slice(None))
-        print(f"策略: 裁剪 Y 轴。保留 Y: [{start_y} : {start_y + new_height}]")
-
-    cropped_vol = volume[crop_slice]
+        print(f"策略: 裁剪 Y 轴。保留 Y: [{box.y0} : {box.y1}]")
 
     # 3. 降采样 (解决卡顿的关键)
-    # 强制进行 2 倍降采样
+    # 强制进行 2 倍降采样，Z, Y, X 都降
     downsample_factor = 2
-    final_vol = cropped_vol[::downsample_factor, ::downsample_factor, ::downsample_factor] # Z, Y, X 都降
-    
-    d_depth, d_height, d_width = final_vol.shape
+    d_depth, d_height, d_width = box_shape(box, downsample_factor)
     
     print(f"--------------------------------")
     print(f"处理后最终尺寸: {d_width} x {d_height} x {d_depth}")
@@ -74,15 +47,9 @@ def fit_to_scene(ini_path, unity_size):
     base_dir = os.path.dirname(ini_path)
     output_name = "Scene_Adapted_Data"
     out_raw = os.path.join(base_dir, f"{output_name}.raw")
-    out_ini = os.path.join(base_dir, f"{output_name}.raw.ini")
 
-    final_vol.tofile(out_raw)
-    with open(out_ini, 'w') as f:
-        f.write(f"dimx:{d_width}\n")
-        f.write(f"dimy:{d_height}\n")
-        f.write(f"dimz:{d_depth}\n")
-        f.write(f"skip:0\n")
-        f.write(f"format:{fmt}\n")
+    # 流式裁剪与降采样：从内存映射中分块复制，不读入整个文件
+    stream_crop(source, box, out_raw, step=downsample_factor, fmt=fmt)
 
     print(f"✅ 文件已生成: {out_raw}")
     print(f"💡 Unity 设置提示: 请将 Volume Object 的 Scale 设置为 ({u_x}, {u_y}, {u_z})")
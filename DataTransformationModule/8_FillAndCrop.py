@@ -1,11 +1,14 @@
-import numpy as np
 import os
-import sys
+import time
+import tracemalloc
 
-def fill_and_crop(ini_path, unity_size):
+from volume_crop import box_shape, box_slices, perfect_box
+from volume_io import open_volume
+
+def fill_and_crop(ini_path, unity_size, method='nearest'):
     # 检查 scipy
     try:
-        from scipy import ndimage
+        from volume_inpaint import inpaint_volume
     except ImportError:
         print("❌ 错误: 缺少 scipy 库。请运行: pip install scipy")
         return
@@ -20,77 +23,38 @@ def fill_and_crop(ini_path, unity_size):
     print(f"目标比例 (X:Z:Y) = {ratio_x:.2f} : {ratio_z:.2f} : 1.0")
 
     # 1. 读取数据
-    params = {}
-    with open(ini_path, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if ':' in line:
-                key, value = line.split(':', 1)
-                params[key.strip().lower()] = value.strip()
-    
-    raw_w = int(params['dimx'])
-    raw_h = int(params['dimy'])
-    raw_d = int(params['dimz'])
-    fmt = params.get('format', 'uint8')
-    
-    type_map = {'uint8': np.uint8, 'uchar': np.uint8}
-    dtype = type_map.get(fmt, np.uint8)
-    raw_path = os.path.splitext(ini_path)[0]
-    if not os.path.exists(raw_path) and not raw_path.endswith('.raw'): raw_path += ".raw"
-    
-    data = np.fromfile(raw_path, dtype=dtype)
-    volume = data.reshape((raw_d, raw_h, raw_w)) # Z, Y, X
-
-    # 2. 计算裁剪尺寸 (保持 7_PerfectCrop 的逻辑)
-    base_size = raw_d
-    target_x = int(base_size * ratio_x)
-    target_y = int(base_size * ratio_z)
-    target_z = base_size
+    source = open_volume(ini_path)
+    fmt = source.format
 
-    # 防止越界
-    if target_x > raw_w or target_y > raw_h:
-        scale = min(raw_w / ratio_x, raw_h / ratio_z, raw_d / 1.0)
-        target_x = int(scale * ratio_x)
-        target_y = int(scale * ratio_z)
-        target_z = int(scale)
+    # 2. 计算裁剪尺寸 (与 7_PerfectCrop 相同的中心裁剪)
+    box = perfect_box(source.shape, unity_size)
+    target_z, target_y, target_x = box_shape(box)
 
-    # 中心裁剪
-    start_z = (raw_d - target_z) // 2
-    start_y = (raw_h - target_y) // 2
-    start_x = (raw_w - target_x) // 2
-    
-    cropped_vol = volume[
-        start_z : start_z + target_z,
-        start_y : start_y + target_y,
-        start_x : start_x + target_x
-    ]
+    # 裁剪范围内的内存映射视图，补全时按块读取
+    cropped_vol = source.data[box_slices(box)] # Z, Y, X
     
     print(f"裁剪完成，尺寸: {target_x} x {target_y} x {target_z}")
 
-    # 3. 执行智能补全 (Inpainting)
-    print("⏳ 正在执行智能补全 (填补空缺)... 这可能需要几秒钟...")
+    # 3. 执行智能补全 (Inpainting)，边补全边写出
+    print(f"⏳ 正在执行智能补全 (填补空缺，{method})...")
     
     # 假设 0 是空值
-    # 计算每个 0 点到最近非 0 点的索引
-    # indices[0] 是 Z 轴索引, indices[1] 是 Y 轴, indices[2] 是 X 轴
-    indices = ndimage.distance_transform_edt(cropped_vol == 0, return_distances=False, return_indices=True)
-    
-    # 使用索引映射，把最近的有效值填入空位
-    filled_vol = cropped_vol[tuple(indices)]
-    
-    # 4. 保存
+    # 空值掩膜沿某个轴不变时只计算一个二维截面的最近索引，否则按带 halo 的块计算 int32 索引
     base_dir = os.path.dirname(ini_path)
     output_name = "Scene_Full_Filled"
     out_raw = os.path.join(base_dir, f"{output_name}.raw")
-    out_ini = os.path.join(base_dir, f"{output_name}.raw.ini")
 
-    filled_vol.tofile(out_raw)
-    with open(out_ini, 'w') as f:
-        f.write(f"dimx:{target_x}\n")
-        f.write(f"dimy:{target_y}\n")
-        f.write(f"dimz:{target_z}\n")
-        f.write(f"skip:0\n")
-        f.write(f"format:{fmt}\n")
+    tracemalloc.start()
+    startTime = time.time()
+    report = inpaint_volume(cropped_vol, out_raw, method, empty_value=0, fmt=fmt, endianness=source.endianness)
+    timeCost = time.time() - startTime
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    mode = '分块计算' if report['axis'] is None else f"二维截面沿 {'ZYX'[report['axis']]} 轴广播"
+    print(f"补全体素: {report['empty']} ({mode})，耗时 {timeCost:.2f}s")
+    # 原来整体 EDT 的索引为 3 个 int64，即每个体素 24 字节
+    print(f"峰值内存: {peak / 2**20:.1f} MB (整体计算的索引约 {cropped_vol.size * 24 / 2**20:.1f} MB)")
 
     print(f"✅ 处理完成！")
     print(f"文件已生成: {out_raw}")
@@ -99,5 +63,7 @@ def fill_and_crop(ini_path, unity_size):
 if __name__ == "__main__":
     INPUT_FILE = "OneDayData/volume_oxygen_data_time_0_255.raw.ini"
     UNITY_SCENE_SIZE = (200, 100, 300) # X, Y, Z
+    # 补全方式: 'nearest' (最近的有效值) 或 'diffusion' (最近值基础上在水平面内扩散，过渡更平滑)
+    FILL_METHOD = 'nearest'
     
-    fill_and_crop(INPUT_FILE, UNITY_SCENE_SIZE)
\ No newline at end of file
+    fill_and_crop(INPUT_FILE, UNITY_SCENE_SIZE, FILL_METHOD)
\ No newline at end of file
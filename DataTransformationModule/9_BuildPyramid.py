@@ -0,0 +1,42 @@
+import os
+import time
+
+from volume_io import open_volume
+from volume_pyramid import build_pyramid
+
+def build_lod_pyramid(ini_path, factors, method, empty_value, output_name):
+    print(f"--- 开始生成多分辨率金字塔: {ini_path} ---")
+
+    # 1. 打开源数据（内存映射，按 Z 分块读取一遍）
+    source = open_volume(ini_path)
+    width, height, depth = source.dims
+    print(f"原始尺寸: {width} (X) x {height} (Y) x {depth} (Z/深度), 格式: {source.format}")
+    print(f"级别: {', '.join(f'{f}x' for f in factors)}  池化: {method}  空值: {empty_value}")
+
+    # 2. 块池化（而不是 [::2, ::2, ::2] 隔点抽取），所有级别一次生成
+    startTime = time.time()
+    base_dir = os.path.dirname(ini_path)
+    manifest = build_pyramid(source, base_dir, output_name, factors=factors,
+                             method=method, empty_value=empty_value)
+    timeCost = time.time() - startTime
+
+    for level in manifest['levels']:
+        w, h, d = level['dims']
+        print(f"  {level['factor']}x: {w} x {h} x {d} -> {level['file']}")
+    print(f"✅ 完成，耗时 {timeCost:.2f}s")
+    print(f"清单: {os.path.join(base_dir, f'{output_name}_pyramid.json')}")
+    print(f"💡 Unity 中可以先加载最粗的级别浏览，再换成精细的级别（Scale 保持不变）")
+
+if __name__ == "__main__":
+    INPUT_FILE = "OneDayData/volume_oxygen_data_time_0_255.raw.ini"
+
+    # 降采样倍数，每一级单独输出 .raw / .ini
+    FACTORS = (2, 4, 8)
+    # 'mean'（块均值，抗混叠）/ 'max'（保留峰值）/ 'min'（保留谷值）
+    METHOD = 'mean'
+    # 不参与池化的空值（陆地裁切为 0）；None 表示所有体素都参与
+    EMPTY_VALUE = 0
+
+    OUTPUT_NAME = "Oxygen_Pyramid"
+
+    build_lod_pyramid(INPUT_FILE, FACTORS, METHOD, EMPTY_VALUE, OUTPUT_NAME)
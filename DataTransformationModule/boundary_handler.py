@@ -7,18 +7,198 @@
 1. Neumann 边界条件：边界用相邻值替代
 2. 高斯模糊平滑：边界逐渐过渡
 3. 反射填充：镜像复制内部数据到边界
+
+以上方法处理的是数组的边缘；海岸线模式（coastline_boundary）按地理掩膜的海岸线处理：
+由掩膜得到 2D 欧氏距离场（region_mask.coast_distance，与掩膜一起缓存），按时间广播，
+只对距海岸线 boundary_width 格以内的网格做 Neumann 或高斯混合
+
+实现方式（不生成整卷的掩膜或副本）：
+1. 每种方法只改变靠近体数据表面的一层"外壳"：时间方向两端的整帧，以及其余帧中
+   两个空间方向的边缘条带；内部体素保持原值，只计算和写回外壳
+2. 高斯淡出掩膜是三个一维淡出曲线的乘积，按外壳区域广播；选择性填充的混合因子为 2D，按时间广播
+3. 高斯模糊只对外壳区域（加上 4σ 的光晕）计算，与整卷 gaussian_filter 的结果一致
+4. 按时间分块处理，额外内存只有几帧；out=data 时原地处理：每块的结果延迟一块写回，
+   保证计算始终读取原始值
+5. 淡出掩膜与混合因子的类型跟随输入数据（float32 输入不会被提升为 float64）
 """
 
 import numpy as np
-from scipy import ndimage
-from scipy.ndimage import gaussian_filter
+from scipy.ndimage import distance_transform_edt, gaussian_filter
+
+from region_mask import coast_distance
+
+# gaussian_filter 默认的截断半径（truncate * sigma）
+GAUSSIAN_TRUNCATE = 4.0
+
+
+def _float_dtype(data):
+    """掩膜 / 混合因子的类型：float32 输入保持 float32，其余为 float64"""
+    return np.result_type(data.dtype, np.float32)
+
+
+def _clamp_index(n, width):
+    """Neumann 边界的下标映射：前 width 个与后 width 个位置取相邻的内层位置"""
+    return np.clip(np.arange(n), width, n - 1 - width)
+
+
+def fade_profile(n, fade_width, dtype=np.float64):
+    """
+    一维淡出曲线：距两端第 i 层的系数为 (fade_width - i) / fade_width，内部为 1
+
+    与原实现中逐层相乘的整卷掩膜相同，三维掩膜为三个轴上淡出曲线的乘积。
+    """
+    profile = np.ones(n, dtype=dtype)
+    for i in range(min(fade_width, n)):
+        fade = (fade_width - i) / fade_width
+        profile[i] *= fade
+        profile[-(i+1)] *= fade
+    return profile
+
+
+def edge_blend_factor(x, y, boundary_width, dtype=np.float64):
+    """
+    选择性填充的 2D 混合因子：到数组 x / y 边缘的距离除以 boundary_width（截断到 [0, 1]），
+    靠近边缘时为 0（用处理后的值），内部为 1（保留原值）
+    """
+    distance_to_edge = np.minimum(
+        np.minimum(np.arange(x), x - 1 - np.arange(x))[:, np.newaxis],
+        np.minimum(np.arange(y), y - 1 - np.arange(y))[np.newaxis, :]
+    )
+    return np.clip(distance_to_edge / boundary_width, 0, 1).astype(dtype)
+
+
+def coast_blend_factor(distance, boundary_width, dtype=np.float64):
+    """
+    海岸线模式的 2D 混合因子：紧邻海岸线（距离 1）为 0（用处理后的值），
+    距离不小于 boundary_width + 1 为 1（保留原值），之间线性过渡
+    """
+    return np.clip((distance - 1) / boundary_width, 0, 1).astype(dtype)
+
+
+def _coast_sources(distance, boundary_width):
+    """
+    海岸线 Neumann 的取值位置：每个网格点最近的、混合因子为 1 的内陆网格点
+
+    Returns:
+        (2, X, Y) 的下标数组
+    """
+    sources = distance >= boundary_width + 1
+    if not sources.any():
+        # 区域太窄时退化为离海岸线最远的网格点
+        sources = distance == distance.max()
+    return distance_transform_edt(~sources, return_distances=False, return_indices=True)
+
+
+def _coast_tiles(band, tile_size, halo):
+    """
+    把海岸带按 tile_size x tile_size 分块，只保留含有海岸带网格的块
+
+    Returns:
+        [(bx, by, (ex, ey)), ...]：块内海岸带网格的下标，以及高斯模糊读取的范围
+        （海岸带网格的外包框加上 halo）
+    """
+    x, y = band.shape
+    tiles = []
+    for x0 in range(0, x, tile_size):
+        for y0 in range(0, y, tile_size):
+            bx, by = np.nonzero(band[x0:x0 + tile_size, y0:y0 + tile_size])
+            if bx.size == 0:
+                continue
+            bx += x0
+            by += y0
+            extent = (slice(max(bx.min() - halo, 0), min(bx.max() + 1 + halo, x)),
+                      slice(max(by.min() - halo, 0), min(by.max() + 1 + halo, y)))
+            tiles.append((bx, by, extent))
+    return tiles
+
+
+def _shell_regions(shape, t0, t1, width, time_faces=True):
+    """
+    时间块 [t0, t1) 中需要处理的外壳区域（互不重叠的切片元组）
+
+    Args:
+        shape: (z, x, y)
+        width: 外壳厚度
+        time_faces: 是否包括时间方向两端的 width 帧（整帧）
+    """
+    z, x, y = shape
+    frames = slice(t0, t1)
+    if width <= 0:
+        return []
+    if 2 * width >= x or 2 * width >= y:
+        return [(frames, slice(0, x), slice(0, y))]
+
+    regions = []
+    middle = (t0, t1)
+    if time_faces:
+        head = (t0, min(t1, width))
+        tail = (max(t0, z - width, head[1]), t1)
+        middle = (max(t0, width), min(t1, z - width))
+        for lo, hi in (head, tail):
+            if lo < hi:
+                regions.append((slice(lo, hi), slice(0, x), slice(0, y)))
+    if middle[0] < middle[1]:
+        frames = slice(*middle)
+        regions += [(frames, slice(0, width), slice(0, y)),
+                    (frames, slice(x - width, x), slice(0, y)),
+                    (frames, slice(width, x - width), slice(0, width)),
+                    (frames, slice(width, x - width), slice(y - width, y))]
+    return regions
+
+
+def _neumann_values(data, region, boundary_width):
+    """Neumann 边界在 region 上的结果：data[cz(t), cx(x), cy(y)]"""
+    index = tuple(_clamp_index(n, boundary_width)[r] for n, r in zip(data.shape, region))
+    return data[np.ix_(*index)]
+
+
+def _gaussian_values(data, region, sigma, profiles):
+    """高斯淡出在 region 上的结果：data * mask + blurred * (1 - mask)"""
+    halo = int(GAUSSIAN_TRUNCATE * float(sigma) + 0.5)
+    extended = tuple(slice(max(r.start - halo, 0), min(r.stop + halo, n))
+                     for n, r in zip(data.shape, region))
+    # 只模糊区域及其光晕，光晕之外的截断只影响被裁掉的部分
+    blurred = gaussian_filter(data[extended], sigma=sigma)
+    blurred = blurred[tuple(slice(r.start - e.start, r.stop - e.start) for r, e in zip(region, extended))]
+    fz, fx, fy = (profile[r] for profile, r in zip(profiles, region))
+    mask = fz[:, None, None] * fx[None, :, None]
+    mask = mask * fy[None, None, :]
+    return data[region] * mask + blurred * (1 - mask)
+
+
+def _prepare_out(data_3d, out, dtype=None):
+    """out 为 None 时分配输出并复制数据；out 不是 data_3d 时先复制数据（外壳之外保持原值）"""
+    if out is None:
+        out = np.empty(data_3d.shape, dtype=data_3d.dtype if dtype is None else dtype)
+    if out is not data_3d:
+        out[...] = data_3d
+    return out
+
+
+def _write_regions(data_3d, out, chunk_size, compute):
+    """
+    按时间块计算外壳并写入 out
+
+    compute(t0, t1) 返回 [(区域, 值), ...]，只读取 data_3d 中 [t0 - chunk_size, t1 + chunk_size) 的帧。
+    每块的结果延迟一块写回：原地处理（out 就是 data_3d）时，计算读取到的始终是原始值。
+    """
+    z = data_3d.shape[0]
+    pending = []
+    for t0 in range(0, z, chunk_size):
+        results = compute(t0, min(t0 + chunk_size, z))
+        for region, values in pending:
+            out[region] = values
+        pending = results
+    for region, values in pending:
+        out[region] = values
+    return out
 
 
 class BoundaryHandler:
     """海洋数据边界处理类"""
     
     @staticmethod
-    def neumann_boundary(data_3d, boundary_width=2):
+    def neumann_boundary(data_3d, boundary_width=2, out=None, chunk_size=16):
         """
         Neumann 边界条件：用相邻内部值替代边界
         
@@ -28,35 +208,20 @@ class BoundaryHandler:
         Args:
             data_3d: (Z, X, Y) 的 3D 数据
             boundary_width: 边界宽度（像素数）
+            out: 可选的输出数组，可以就是 data_3d（原地处理）
+            chunk_size: 时间分块大小
         
         Returns:
             处理后的 3D 数据
         """
-        data = data_3d.copy()
-        z, x, y = data.shape
-        
-        # 处理前后面（Z 轴）
-        for i in range(boundary_width):
-            if i < z:
-                data[i, :, :] = data[boundary_width, :, :]     # 前面用内层替代
-                data[-(i+1), :, :] = data[-(boundary_width+1), :, :]  # 后面用内层替代
-        
-        # 处理左右面（X 轴）
-        for i in range(boundary_width):
-            if i < x:
-                data[:, i, :] = data[:, boundary_width, :]     # 左面
-                data[:, -(i+1), :] = data[:, -(boundary_width+1), :]  # 右面
-        
-        # 处理上下面（Y 轴）
-        for i in range(boundary_width):
-            if i < y:
-                data[:, :, i] = data[:, :, boundary_width]     # 上面
-                data[:, :, -(i+1)] = data[:, :, -(boundary_width+1)]  # 下面
-        
-        return data
+        out = _prepare_out(data_3d, out)
+        chunk_size = max(chunk_size, boundary_width + 1)
+        return _write_regions(data_3d, out, chunk_size, lambda t0, t1: [
+            (region, _neumann_values(data_3d, region, boundary_width))
+            for region in _shell_regions(data_3d.shape, t0, t1, boundary_width)])
     
     @staticmethod
-    def gaussian_smooth_boundary(data_3d, sigma=1.5, boundary_fade_width=5):
+    def gaussian_smooth_boundary(data_3d, sigma=1.5, boundary_fade_width=5, out=None, chunk_size=16):
         """
         高斯模糊平滑边界
         
@@ -67,67 +232,47 @@ class BoundaryHandler:
             data_3d: (Z, X, Y) 的 3D 数据
             sigma: 高斯模糊的标准差
             boundary_fade_width: 边界淡出宽度
+            out: 可选的输出数组，可以就是 data_3d（原地处理）
+            chunk_size: 时间分块大小
         
         Returns:
             处理后的 3D 数据
         """
-        # 先对整个数据应用高斯模糊
-        blurred = gaussian_filter(data_3d, sigma=sigma)
-        
-        # 创建边界淡出掩膜
-        z, x, y = data_3d.shape
-        mask = np.ones_like(data_3d, dtype=float)
-        
-        # 在边界附近逐渐从 1 变成 0
-        for i in range(boundary_fade_width):
-            fade = (boundary_fade_width - i) / boundary_fade_width
-            
-            mask[i, :, :] *= fade
-            mask[-(i+1), :, :] *= fade
-            mask[:, i, :] *= fade
-            mask[:, -(i+1), :] *= fade
-            mask[:, :, i] *= fade
-            mask[:, :, -(i+1)] *= fade
-        
-        # 在边界用模糊版本混合，内部用原始数据
-        result = data_3d * mask + blurred * (1 - mask)
-        
-        return result
+        dtype = _float_dtype(data_3d)
+        out = _prepare_out(data_3d, out, dtype)
+        # 淡出掩膜 = 三个轴上一维淡出曲线的乘积，只在外壳上 < 1
+        profiles = [fade_profile(n, boundary_fade_width, dtype) for n in data_3d.shape]
+        halo = int(GAUSSIAN_TRUNCATE * float(sigma) + 0.5)
+        chunk_size = max(chunk_size, halo)
+        return _write_regions(data_3d, out, chunk_size, lambda t0, t1: [
+            (region, _gaussian_values(data_3d, region, sigma, profiles))
+            for region in _shell_regions(data_3d.shape, t0, t1, boundary_fade_width)])
     
     @staticmethod
-    def reflect_boundary(data_3d, boundary_width=3):
+    def reflect_boundary(data_3d, boundary_width=3, out=None, chunk_size=16):
         """
         反射填充边界
         
         原理：用镜像的内部数据填充边界，保持数据连续性
         适用：周期性或对称数据
+
+        注意：原实现先按 'reflect' 模式填充 boundary_width 层再裁回原尺寸，
+        裁出的正是原始数据，因此结果与输入相同；这里直接复制（或原地时不做任何处理），
+        不再生成填充后的副本
         
         Args:
             data_3d: (Z, X, Y) 的 3D 数据
             boundary_width: 边界宽度
+            out: 可选的输出数组，可以就是 data_3d
+            chunk_size: 未使用（与其他方法的参数一致）
         
         Returns:
             处理后的 3D 数据
         """
-        data = data_3d.copy()
-        z, x, y = data.shape
-        
-        # 创建带边界的数据副本
-        padded = np.pad(data, 
-                       ((boundary_width, boundary_width), 
-                        (boundary_width, boundary_width), 
-                        (boundary_width, boundary_width)), 
-                       mode='reflect')
-        
-        # 提取反射后的完整数据
-        result = padded[boundary_width:boundary_width+z,
-                       boundary_width:boundary_width+x,
-                       boundary_width:boundary_width+y]
-        
-        return result
+        return _prepare_out(data_3d, out)
     
     @staticmethod
-    def selective_boundary_fill(data_3d, mask, boundary_width=3, method='neumann'):
+    def selective_boundary_fill(data_3d, mask, boundary_width=3, method='neumann', out=None, chunk_size=16):
         """
         选择性边界填充
         
@@ -140,49 +285,113 @@ class BoundaryHandler:
             mask: (X, Y) 的布尔掩膜，True 表示有效海洋区域
             boundary_width: 边界宽度
             method: 'neumann' 或 'gaussian' 或 'reflect'
+            out: 可选的输出数组，可以就是 data_3d（原地处理）
+            chunk_size: 时间分块大小
         
         Returns:
             处理后的 3D 数据
+
+        注意：混合因子只取决于到数组 x / y 边缘的距离，mask 并未使用；
+        按掩膜海岸线处理请用 coastline_boundary
         """
-        data = data_3d.copy()
-        z, x, y = data.shape
-        
-        # 扩展掩膜到 3D
-        mask_3d = np.tile(mask, (z, 1, 1))
-        
-        if method == 'neumann':
-            processed = BoundaryHandler.neumann_boundary(data, boundary_width)
-        elif method == 'gaussian':
-            processed = BoundaryHandler.gaussian_smooth_boundary(data, boundary_fade_width=boundary_width)
-        elif method == 'reflect':
-            processed = BoundaryHandler.reflect_boundary(data, boundary_width)
-        else:
+        if method not in ('neumann', 'gaussian', 'reflect'):
             raise ValueError(f"Unknown method: {method}")
+        dtype = _float_dtype(data_3d)
+        out = _prepare_out(data_3d, out, dtype)
+        z, x, y = data_3d.shape
+
+        # 淡出因子（靠近 x / y 边缘时为 0，内部为 1），2D，按时间广播；
+        # 只有距边缘不足 boundary_width 的条带需要混合
+        blend_factor = edge_blend_factor(x, y, boundary_width, dtype)
+        profiles = [fade_profile(n, boundary_width, dtype) for n in data_3d.shape]
+        halo = int(GAUSSIAN_TRUNCATE * 1.5 + 0.5) if method == 'gaussian' else 0
+        chunk_size = max(chunk_size, boundary_width + 1, halo)
+
+        def processed(region):
+            if method == 'neumann':
+                return _neumann_values(data_3d, region, boundary_width)
+            if method == 'gaussian':
+                return _gaussian_values(data_3d, region, 1.5, profiles)
+            return data_3d[region]
+
+        def compute(t0, t1):
+            results = []
+            for region in _shell_regions(data_3d.shape, t0, t1, boundary_width, time_faces=False):
+                factor = blend_factor[region[1:]]
+                results.append((region, data_3d[region] * factor + processed(region) * (1 - factor)))
+            return results
+
+        return _write_regions(data_3d, out, chunk_size, compute)
+
+    @staticmethod
+    def coastline_boundary(data_3d, mask, boundary_width=3, method='neumann', sigma=1.5,
+                           distance=None, out=None, chunk_size=16, tile_size=64):
+        """
+        海岸线边界混合
+
+        原理：由掩膜的 2D 欧氏距离场得到混合因子（紧邻海岸线为 0，距离 boundary_width + 1
+        及以上为 1），按时间广播；只处理区域内距海岸线不足 boundary_width + 1 的网格，
+        其余体素保持原值
+        - neumann：取最近的内陆网格点（混合因子为 1）的值，即海岸线法向梯度为 0
+        - gaussian：高斯模糊值，只在含有海岸带的 tile_size 分块（加上 4σ 的光晕）上计算
         
-        # 在边界附近混合：边界用处理版本，内部用原始版本
-        distance_to_edge = np.minimum(
-            np.minimum(
-                np.arange(x)[np.newaxis, :, np.newaxis],
-                (x - 1 - np.arange(x))[np.newaxis, :, np.newaxis]
-            ),
-            np.minimum(
-                np.arange(y)[np.newaxis, np.newaxis, :],
-                (y - 1 - np.arange(y))[np.newaxis, np.newaxis, :]
-            )
-        )
-        
-        # 创建淡出因子（靠近边界时为 0，内部为 1）
-        blend_factor = np.clip(distance_to_edge / boundary_width, 0, 1)
-        blend_factor_3d = np.tile(blend_factor, (z, 1, 1))
-        
-        # 混合
-        result = data * blend_factor_3d + processed * (1 - blend_factor_3d)
+        Args:
+            data_3d: (Z, X, Y) 的 3D 数据
+            mask: (X, Y) 的布尔掩膜，True 表示有效区域（保留的数据）
+            boundary_width: 海岸带宽度（网格数）
+            method: 'neumann' 或 'gaussian'
+            sigma: gaussian 的标准差
+            distance: 可选的 (X, Y) 距离场；None 时由 coast_distance(mask) 得到（磁盘缓存）
+            out: 可选的输出数组，可以就是 data_3d（原地处理）
+            chunk_size: 时间分块大小
+            tile_size: gaussian 的空间分块大小
         
-        return result
+        Returns:
+            处理后的 3D 数据
+        """
+        if method not in ('neumann', 'gaussian'):
+            raise ValueError(f"Unknown method: {method}")
+        dtype = _float_dtype(data_3d)
+        out = _prepare_out(data_3d, out, dtype)
+        if distance is None:
+            distance = coast_distance(mask)
+
+        factor = coast_blend_factor(distance, boundary_width, dtype)
+        band = (distance > 0) & (factor < 1)
+
+        if method == 'neumann':
+            bx, by = np.nonzero(band)
+            sx, sy = _coast_sources(distance, boundary_width)[:, bx, by]
+            f = factor[bx, by]
+
+            def compute(t0, t1):
+                frames = slice(t0, t1)
+                values = data_3d[frames, bx, by] * f + data_3d[frames, sx, sy] * (1 - f)
+                return [((frames, bx, by), values)]
+
+            return _write_regions(data_3d, out, chunk_size, compute)
+
+        z = data_3d.shape[0]
+        halo = int(GAUSSIAN_TRUNCATE * float(sigma) + 0.5)
+        tiles = _coast_tiles(band, tile_size, halo)
+        chunk_size = max(chunk_size, halo)
+
+        def compute(t0, t1):
+            frames = slice(t0, t1)
+            extended = slice(max(t0 - halo, 0), min(t1 + halo, z))
+            results = []
+            for bx, by, (ex, ey) in tiles:
+                blurred = gaussian_filter(data_3d[extended, ex, ey], sigma=sigma)
+                blurred = blurred[t0 - extended.start:t1 - extended.start, bx - ex.start, by - ey.start]
+                f = factor[bx, by]
+                results.append(((frames, bx, by), data_3d[frames, bx, by] * f + blurred * (1 - f)))
+            return results
+
+        return _write_regions(data_3d, out, chunk_size, compute)
 
 
 def apply_improved_boundary_handling(data_3d, china_mask_2d, method='neumann', 
-                                    boundary_width=3, clipping_value=1):
+                                    boundary_width=3, clipping_value=1, out=None, chunk_size=16):
     """
     改进的边界处理流程
     
@@ -191,34 +400,41 @@ def apply_improved_boundary_handling(data_3d, china_mask_2d, method='neumann',
     Args:
         data_3d: (Z, X, Y) 的原始 3D 数据
         china_mask_2d: (X, Y) 的布尔掩膜，True 表示陆地，False 表示海洋
-        method: 边界处理方法 ('neumann', 'gaussian', 'reflect', 'selective')
+        method: 边界处理方法 ('neumann', 'gaussian', 'reflect', 'selective',
+                'coastline'（海岸线 Neumann 混合）, 'coastline_gaussian'（海岸线高斯混合）)
         boundary_width: 边界处理宽度
         clipping_value: 陆地裁切值（默认 0，表示完全裁切；改为 1 保留边界）
+        out: 可选的输出数组；传入 data_3d 时原地处理，不复制整卷数据
+        chunk_size: 时间分块大小
     
     Returns:
         处理后的 3D 数据
     """
-    data = data_3d.copy()
-    z, x, y = data.shape
-    
     # 1. 首先应用边界处理
     if method == 'selective':
         # 选择性处理：在海洋边界用插值，陆地边界用标记值
         ocean_mask = ~china_mask_2d  # 反转掩膜：False 变成 True
         data = BoundaryHandler.selective_boundary_fill(
-            data, ocean_mask, boundary_width=boundary_width, method='neumann'
+            data_3d, ocean_mask, boundary_width=boundary_width, method='neumann',
+            out=out, chunk_size=chunk_size
+        )
+    elif method in ('coastline', 'coastline_gaussian'):
+        # 海岸线处理：只混合保留区域内距海岸线 boundary_width 格以内的网格
+        data = BoundaryHandler.coastline_boundary(
+            data_3d, ~china_mask_2d, boundary_width=boundary_width,
+            method='gaussian' if method == 'coastline_gaussian' else 'neumann',
+            out=out, chunk_size=chunk_size
         )
     else:
-        # 全局边界处理
+        # 全局边界处理（gaussian 的第二个参数为 sigma，与原实现相同）
         data = {
             'neumann': BoundaryHandler.neumann_boundary,
             'gaussian': BoundaryHandler.gaussian_smooth_boundary,
             'reflect': BoundaryHandler.reflect_boundary
-        }[method](data, boundary_width)
+        }[method](data_3d, boundary_width, out=out, chunk_size=chunk_size)
     
-    # 2. 然后应用地理裁切（陆地设为标记值，而非 0）
-    mask_3d = np.tile(china_mask_2d, (z, 1, 1))
-    data[mask_3d] = clipping_value
+    # 2. 然后应用地理裁切（陆地设为标记值，而非 0）；2D 掩膜按时间广播
+    data[:, china_mask_2d] = clipping_value
     
     return data
 
@@ -246,12 +462,14 @@ def clipedChinaFrame_improved(data, china_mask):
     # 选择以下任意一种方法：
     
     # 方法 A：Neumann 边界 + 智能陆地标记（推荐）
+    # out=data_3d 时原地处理，不再复制整卷数据
     data_3d = apply_improved_boundary_handling(
         data_3d, 
         china_mask, 
         method='selective',
         boundary_width=3,
-        clipping_value=1  # 改为 1，边界不会过度黑暗
+        clipping_value=1,  # 改为 1，边界不会过度黑暗
+        out=data_3d
     )
     
     # 方法 B：纯高斯平滑（最平滑）
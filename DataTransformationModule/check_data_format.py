@@ -1,5 +1,6 @@
 import os
-import numpy as np
+
+from volume_io import UNITY_FORMATS, normalize_format, raw_dtype, raw_path_for, read_ini
 
 def inspect_volume_data(ini_path):
     print(f"--- 正在检查文件: {ini_path} ---")
@@ -8,20 +9,13 @@ def inspect_volume_data(ini_path):
         print(f"错误: 找不到文件 {ini_path}")
         return
 
-    params = {}
     try:
         with open(ini_path, 'r') as f:
             print("\n[INI 文件内容预览]:")
             for line in f:
-                line = line.strip()
-                print(f"  {line}")
-                # 适配冒号分隔符
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    params[key.strip().lower()] = value.strip()
-                elif '=' in line:
-                    key, value = line.split('=', 1)
-                    params[key.strip().lower()] = value.strip()
+                print(f"  {line.strip()}")
+        # 适配冒号 / 等号分隔符
+        params = read_ini(ini_path)
     except Exception as e:
         print(f"读取 INI 文件失败: {e}")
         return
@@ -31,18 +25,12 @@ def inspect_volume_data(ini_path):
     height = int(params.get('dimy', 0))
     depth = int(params.get('dimz', 0))
     
-    # 尝试解析格式
+    # 尝试解析格式与字节序
     fmt = params.get('format', 'uint8').lower()
+    endianness = params.get('endianness', 'littleendian').lower()
     
-    # 尝试推断 raw 文件名 (通常同名，只是后缀不同)
-    # 假设 raw 文件名是把 .raw.ini 去掉 .ini 或者直接同名 .raw
-    base_name = os.path.splitext(ini_path)[0] # 去掉 .ini
-    # 如果文件名本身包含 .raw (例如 data.raw.ini -> data.raw)
-    raw_path_guess_1 = base_name 
-    # 如果文件名不包含 .raw (例如 data.ini -> data.raw)
-    raw_path_guess_2 = os.path.splitext(base_name)[0] + ".raw"
-    
-    raw_path = raw_path_guess_1 if os.path.exists(raw_path_guess_1) else raw_path_guess_2
+    # 推断 raw 文件名：data.raw.ini -> data.raw；data.ini -> data.raw
+    raw_path = raw_path_for(ini_path)
 
     if width == 0 or height == 0 or depth == 0:
         print("\n❌ 错误: 无法解析维度信息 (dimx, dimy, dimz)")
@@ -53,27 +41,17 @@ def inspect_volume_data(ini_path):
     print(f"  总像素点数: {width * height * depth:,}")
 
     # 解析数据类型
-    type_map = {
-        'uint8': (np.uint8, 1),
-        'uchar': (np.uint8, 1),
-        'uint16': (np.uint16, 2),
-        'ushort': (np.uint16, 2),
-        'int16': (np.int16, 2),
-        'short': (np.int16, 2),
-        'float': (np.float32, 4),
-        'float32': (np.float32, 4),
-        'double': (np.float64, 8)
-    }
-    
-    dtype_info = type_map.get(fmt)
-    if dtype_info:
-        dtype, bytes_per_pixel = dtype_info
+    try:
+        bytes_per_pixel = raw_dtype(fmt, endianness).itemsize
+    except ValueError:
+        print(f"  未知数据类型: {fmt} / 字节序: {endianness}")
+        expected_size = -1
+    else:
         expected_size = width * height * depth * bytes_per_pixel
-        print(f"  数据类型: {fmt} ({bytes_per_pixel} bytes/pixel)")
+        print(f"  数据类型: {fmt} ({bytes_per_pixel} bytes/pixel, {endianness})")
         print(f"  预期 RAW 文件大小: {expected_size:,} bytes ({expected_size/1024/1024:.2f} MB)")
-    else:
-        print(f"  未知数据类型: {fmt}")
-        expected_size = -1
+        if normalize_format(fmt) not in UNITY_FORMATS:
+            print(f"  ⚠️ 注意: Unity 的 DatasetIniReader 不支持 {fmt}，会按 uint8 读取")
 
     # 检查 RAW 文件
     if os.path.exists(raw_path):
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+精度诊断脚本：比较 float32 与 float64 工作精度
+
+对同一份输入分别用两种工作精度运行插值（可选）、平滑、边界处理与量化，报告：
+- 浮点结果的最大 / 均方根绝对误差
+- 量化后码值不同的体素数与最大码值差
+- 每个阶段的耗时与峰值内存（tracemalloc 统计的 numpy 分配，不含内存映射的页面）
+"""
+
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+from boundary_handler import apply_improved_boundary_handling
+from frame_store import FrameStore
+from quantize import quantize, quantize_mapping
+from region_mask import apply_region_mask, china_grid_spec, china_mask
+from smooth_engine import box_smooth3d, load_halo
+
+HERE = os.path.dirname(__file__)
+
+# 对照的切片与平滑参数（与 2_Smooth.py 相同）
+slice_index = 0
+slice_count = 8
+spatial_window_radius = 2
+temporal_window_radius = 24
+boundary_method = 'gaussian'
+quantize_format = 'uint8'
+quantize_range = (1, 500)
+# 克里金对照的帧数（需要 exampleData/data_merged/LOC_AQI.stations 与 pykrige；0 为跳过）
+kriging_frames = 48
+kriging_width = 175
+kriging_height = 175
+
+
+def sliceFileName(index):
+    return f"volume_linear_timeWidth_{0 + index * 552}_{0 + (index+1) * 552}_definition_175_175_expand_ratio_2_sill_test"
+
+
+def measure(function, *args):
+    """运行 function，返回 (结果, 耗时秒数, 峰值内存字节数)"""
+    tracemalloc.start()
+    startTime = time.time()
+    result = function(*args)
+    timeCost = time.time() - startTime
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, timeCost, peak
+
+
+def report(name, reference, result):
+    """打印一个阶段的误差、耗时与内存对比"""
+    (ref_values, ref_time, ref_peak), (values, timeCost, peak) = reference, result
+    error = np.abs(values.astype(np.float64) - ref_values)
+    print(f"\n[{name}]")
+    print(f"  最大绝对误差: {error.max():.3e}  均方根误差: {np.sqrt(np.mean(error ** 2)):.3e}")
+    print(f"  耗时: float64 {ref_time:.2f}s  float32 {timeCost:.2f}s")
+    print(f"  峰值内存: float64 {ref_peak / 2**20:.1f} MB  float32 {peak / 2**20:.1f} MB  "
+          f"({peak / max(ref_peak, 1):.2f}x)")
+
+
+def report_codes(reference, result):
+    """打印量化码值的差异"""
+    diff = np.abs(result.astype(np.int64) - reference.astype(np.int64))
+    changed = np.count_nonzero(diff)
+    print(f"\n[量化 {quantize_format}]")
+    print(f"  码值不同的体素: {changed:,} / {diff.size:,} ({changed / diff.size * 100:.4f}%)")
+    print(f"  最大码值差: {diff.max()}")
+
+
+def smooth_slice(dtype):
+    """读取切片与光晕帧并平滑，返回 (z, x, y) 数组"""
+    store = FrameStore(os.path.join(HERE, 'InterpolateResult', f'{sliceFileName(slice_index)}.frames'))
+    xLength, yLength, zLength = store.header['xLength'], store.header['yLength'], store.header['zLength']
+    data = store.read(dtype=dtype).reshape(zLength, xLength, yLength)
+    prevDataPath = None
+    nextDataPath = None
+    if(slice_index != 0):
+        prevDataPath = os.path.join(HERE, 'InterpolateResult', f'{sliceFileName(slice_index - 1)}.frames')
+    if(slice_index != slice_count - 1):
+        nextDataPath = os.path.join(HERE, 'InterpolateResult', f'{sliceFileName(slice_index + 1)}.frames')
+    prev_halo = load_halo(prevDataPath, temporal_window_radius, tail=False, shape=(xLength, yLength), dtype=dtype)
+    next_halo = load_halo(nextDataPath, temporal_window_radius, tail=True, shape=(xLength, yLength), dtype=dtype)
+    return box_smooth3d(data, spatial_window_radius, temporal_window_radius,
+                        pre=next_halo, post=prev_halo, out=data)
+
+
+def clip_and_boundary(volume):
+    """边界处理与裁切（境外网格为 0），原地进行"""
+    mask = china_mask(volume.shape[1], volume.shape[2])
+    if boundary_method == 'none':
+        return apply_region_mask(volume, mask, 0.0)
+    return apply_improved_boundary_handling(volume, ~mask, method=boundary_method,
+                                            boundary_width=3, clipping_value=0.0, out=volume)
+
+
+def interpolate_window(dtype):
+    """用 BatchKriging 插值一个窗口的前 kriging_frames 帧（变差函数按 float64 拟合）"""
+    from pyproj import Transformer
+    from kriging_engine import BatchKriging, fit_variogram
+    from station_store import StationStore
+
+    station_store = StationStore(os.path.join(HERE, 'exampleData', 'data_merged', 'LOC_AQI.stations'))
+    transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+    x, y = transformer.transform(station_store.lng, station_store.lat)
+    grid = china_grid_spec(kriging_width, kriging_height)
+    values = station_store.window(0, kriging_frames)
+    engine = BatchKriging(x, y, np.linspace(grid.x0, grid.x1, kriging_width),
+                          np.linspace(grid.y0, grid.y1, kriging_height),
+                          variogram_parameters=fit_variogram(x, y, values), dtype=dtype)
+    return engine.execute_masked(values)
+
+
+def main():
+    print("=" * 60)
+    print("float32 / float64 工作精度对照")
+    print("=" * 60)
+
+    stationPath = os.path.join(HERE, 'exampleData', 'data_merged', 'LOC_AQI.stations')
+    if kriging_frames and os.path.exists(stationPath):
+        reference = measure(interpolate_window, np.float64)
+        report(f'克里金插值（{kriging_frames} 帧）', reference, measure(interpolate_window, np.float32))
+    else:
+        print(f"\n跳过克里金对照：找不到 {stationPath}")
+
+    if not os.path.exists(os.path.join(HERE, 'InterpolateResult', f'{sliceFileName(slice_index)}.frames')):
+        print(f"\n跳过平滑对照：找不到切片 {slice_index} 的插值结果")
+        return
+
+    smoothed64 = measure(smooth_slice, np.float64)
+    smoothed32 = measure(smooth_slice, np.float32)
+    report(f'平滑 s={spatial_window_radius} t={temporal_window_radius}', smoothed64, smoothed32)
+
+    finished64 = measure(clip_and_boundary, smoothed64[0])
+    finished32 = measure(clip_and_boundary, smoothed32[0])
+    report(f'边界处理 {boundary_method}', finished64, finished32)
+
+    mapping = quantize_mapping(quantize_range, quantize_format)
+    report_codes(quantize(finished64[0], mapping), quantize(finished32[0], mapping))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,37 +6,40 @@
 import numpy as np
 import os
 
+from volume_io import open_volume
+
 HERE = os.path.dirname(__file__)
 
-def analyze_boundary(raw_path, dims, boundary_layers=10):
+def analyze_boundary(ini_path, boundary_layers=10):
     """分析边界和内部的数据分布"""
     
     print(f"\n{'='*60}")
     print(f"边界数据诊断分析")
     print(f"{'='*60}")
     
-    data = np.fromfile(raw_path, dtype=np.uint8)
-    data_3d = data.reshape(dims)  # (x, y, z)
+    # 内存映射，(z, y, x)，与 Unity 的读取顺序一致
+    volume = open_volume(ini_path)
+    data_3d = volume.data
     
-    x, y, z = dims
+    x, y, z = volume.dims
     
     print(f"\n[全局统计]")
     print(f"  总数据点: {x * y * z:,}")
     print(f"  范围: {data_3d.min()} ~ {data_3d.max()}")
     print(f"  平均值: {data_3d.mean():.2f}")
     print(f"  中位数: {np.median(data_3d):.2f}")
-    print(f"  零值个数: {(data_3d == 0).sum():,} ({(data_3d == 0).sum()/len(data)*100:.1f}%)")
+    print(f"  零值个数: {(data_3d == 0).sum():,} ({(data_3d == 0).sum()/data_3d.size*100:.1f}%)")
     
     print(f"\n[边界分析（靠近表面的层）]")
     
     # 分析各个边界
     edges = {
-        "前面 (x=0~{})".format(boundary_layers): data_3d[0:boundary_layers, :, :],
-        "后面 (x=-{}~)".format(boundary_layers): data_3d[-boundary_layers:, :, :],
+        "前面 (x=0~{})".format(boundary_layers): data_3d[:, :, 0:boundary_layers],
+        "后面 (x=-{}~)".format(boundary_layers): data_3d[:, :, -boundary_layers:],
         "左面 (y=0~{})".format(boundary_layers): data_3d[:, 0:boundary_layers, :],
         "右面 (y=-{}~)".format(boundary_layers): data_3d[:, -boundary_layers:, :],
-        "上面 (z=0~{})".format(boundary_layers): data_3d[:, :, 0:boundary_layers],
-        "下面 (z=-{}~)".format(boundary_layers): data_3d[:, :, -boundary_layers:],
+        "上面 (z=0~{})".format(boundary_layers): data_3d[0:boundary_layers, :, :],
+        "下面 (z=-{}~)".format(boundary_layers): data_3d[-boundary_layers:, :, :],
     }
     
     for edge_name, edge_data in edges.items():
@@ -57,7 +60,8 @@ def analyze_boundary(raw_path, dims, boundary_layers=10):
     print(f"  零值: {(inner_data == 0).sum():,} ({zero_pct:.1f}%)")
     
     print(f"\n[诊断建议]")
-    if (data_3d[0:5, :, :].mean() < 10) or ((data_3d[0:5, :, :] == 0).sum() > 0.3 * data_3d[0:5, :, :].size):
+    front = data_3d[:, :, 0:5]
+    if (front.mean() < 10) or ((front == 0).sum() > 0.3 * front.size):
         print("  ⚠️ 边界确实存在大量低值/零值")
         print("  原因: 陆地被裁切为 0，边界附近也是陆地")
         print("  建议:")
@@ -72,25 +76,25 @@ def analyze_boundary(raw_path, dims, boundary_layers=10):
 
 # 分析原始数据
 raw_file = os.path.join(HERE, 'OneDayData', 'volume_oxygen_data_time_0_255.raw')
-analyze_boundary(raw_file, (400, 441, 92), boundary_layers=10)
+analyze_boundary(raw_file + '.ini', boundary_layers=10)
 
 # 分析 Neumann 处理后的数据
 neumann_file = os.path.join(HERE, 'MyData', 'volume_oxygen_neumann_boundary.raw')
 if os.path.exists(neumann_file):
     print(f"\n\n")
-    analyze_boundary(neumann_file, (400, 441, 92), boundary_layers=10)
+    analyze_boundary(neumann_file + '.ini', boundary_layers=10)
     
     # 对比
     print(f"\n{'='*60}")
     print(f"处理前后对比")
     print(f"{'='*60}")
     
-    orig_data = np.fromfile(raw_file, dtype=np.uint8).reshape((400, 441, 92))
-    neu_data = np.fromfile(neumann_file, dtype=np.uint8).reshape((400, 441, 92))
+    orig_data = open_volume(raw_file + '.ini').data
+    neu_data = open_volume(neumann_file + '.ini').data
     
     # 检查边界是否改变
-    orig_edge = orig_data[0:3, :, :].mean()
-    neu_edge = neu_data[0:3, :, :].mean()
+    orig_edge = orig_data[:, :, 0:3].mean()
+    neu_edge = neu_data[:, :, 0:3].mean()
     
     print(f"\n  边界前 3 层平均值:")
     print(f"    原始: {orig_edge:.1f}")
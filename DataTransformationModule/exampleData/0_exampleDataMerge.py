@@ -1,25 +1,21 @@
-import pandas as pd
 import os
-from tqdm import *
-from tqdm import tqdm
+import sys
 
 # Run only once to merge the example data
 
 HERE = os.path.dirname(__file__)
+sys.path.append(os.path.join(HERE, '..'))
+from station_store import merge_station_data, write_station_store
+
 locationDataPath = os.path.join(HERE, 'locations.json')
 valueDataPath = os.path.join(HERE, 'timeseriesdata.json')
 
-locationData = pd.read_json(locationDataPath)
-valueData = pd.read_json(valueDataPath)
-
 dataMergedFilePath = os.path.join(HERE, 'data_merged')
 if not os.path.exists(dataMergedFilePath):
     os.makedirs(dataMergedFilePath)
 
-data = pd.DataFrame(locationData).drop(['x','y','order'],axis=1)
-
-for index in tqdm(range(8472)):
-    def mapValue(series, index):
-            return valueData[index:index+1].loc[:,[int(series['rid'])]].values[0][0]
-    data['val'] = data.apply(mapValue,args=[index],axis=1)
-    data.to_csv(f'{dataMergedFilePath}/LOC_AQI_{index}.csv',index=None)
\ No newline at end of file
+# 按 rid 一次性对齐所有时刻的观测值，得到 (时间, 站点) 矩阵与站点坐标，
+# 写入单个可内存映射的二进制文件（替代每小时一个的 LOC_AQI_{i}.csv）
+values, lng, lat, rid = merge_station_data(locationDataPath, valueDataPath)
+write_station_store(os.path.join(dataMergedFilePath, 'LOC_AQI.stations'), values, lng, lat, rid)
+print(f'Merged {values.shape[0]} time steps x {values.shape[1]} stations')
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+插值中间结果的二进制帧存储
+用于替代 InterpolateResult 中 temp_res.tolist() + json.dumps 写出的巨型 JSON
+
+文件格式（.frames）：
+    magic      4 字节  b'VRFS'
+    header_len 4 字节  小端 uint32
+    header     header_len 字节 UTF-8 JSON，包含：
+                 xLength / yLength / zLength  维度（与原 JSON 中的含义相同）
+                 dtype                        数据类型（默认 float32，小端）
+                 grid                         网格地理参考（EPSG:3857 范围）
+                 startTime / endTime          时间范围
+                 timeReversed                 帧是否已按 Unity 坐标系反转
+                 dataOffset                   数据起始字节（按 64 字节对齐）
+    data       (zLength, yLength, xLength) 的 C 顺序数组，每帧连续存放
+
+数据区可以直接 np.memmap，读取单帧或一段帧时只触及对应的页面，无需解析整个文件。
+"""
+
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b'VRFS'
+ALIGNMENT = 64
+
+
+def _build_header(xLength, yLength, zLength, dtype, grid=None, startTime=None,
+                  endTime=None, timeReversed=False, **extra):
+    header = {
+        'format': 'frame_store',
+        'version': 1,
+        'xLength': int(xLength),
+        'yLength': int(yLength),
+        'zLength': int(zLength),
+        'dtype': np.dtype(dtype).newbyteorder('<').str,
+        'startTime': startTime,
+        'endTime': endTime,
+        'timeReversed': bool(timeReversed),
+    }
+    if grid is not None:
+        # grid 为 region_mask.GridSpec
+        header['grid'] = {
+            'crs': 'EPSG:3857',
+            'x0': float(grid.x0), 'y0': float(grid.y0),
+            'x1': float(grid.x1), 'y1': float(grid.y1),
+            'nx': int(grid.nx), 'ny': int(grid.ny),
+        }
+    header.update(extra)
+    return header
+
+
+def _encode_header(header, magic=MAGIC):
+    """序列化文件头，并把数据起始位置对齐到 ALIGNMENT 字节"""
+    header = dict(header, dataOffset=0)
+    body = json.dumps(header).encode('utf-8')
+    offset = len(magic) + 4 + len(body) + 32  # 为 dataOffset 的数字位数留出余量
+    offset = (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+    header['dataOffset'] = offset
+    body = json.dumps(header).encode('utf-8')
+    body += b' ' * (offset - len(magic) - 4 - len(body))
+    return magic + struct.pack('<I', len(body)) + body, header
+
+
+def read_header(path, magic=MAGIC):
+    """只读取文件头"""
+    with open(path, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f"Not a {magic.decode()} file: {path}")
+        (length,) = struct.unpack('<I', f.read(4))
+        return json.loads(f.read(length).decode('utf-8'))
+
+
+class FrameStore:
+    """
+    只读的帧存储（内存映射）
+
+    用法：
+        store = FrameStore(path)
+        store.shape              # (zLength, yLength, xLength)
+        store.frame(0)           # 单帧 (yLength, xLength)
+        store.frames(10, 34)     # 帧范围，返回内存映射视图
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.header = read_header(path)
+        self.dtype = np.dtype(self.header['dtype'])
+        self.shape = (self.header['zLength'], self.header['yLength'], self.header['xLength'])
+        self.data = np.memmap(path, dtype=self.dtype, mode='r',
+                              offset=self.header['dataOffset'], shape=self.shape)
+
+    @property
+    def zLength(self):
+        return self.shape[0]
+
+    def frame(self, index):
+        return self.data[index]
+
+    def frames(self, start=0, stop=None):
+        return self.data[start:stop]
+
+    def read(self, start=0, stop=None, dtype=None):
+        """把一段帧读入内存（可选转换数据类型）"""
+        return np.array(self.data[start:stop], dtype=dtype)
+
+
+class FrameStoreWriter:
+    """
+    帧存储写入器
+
+    预先分配整个文件并以内存映射方式写入，可以按任意顺序逐帧或成段写入。
+
+    用法：
+        with FrameStoreWriter(path, xLength, yLength, zLength, grid=grid) as writer:
+            writer.write(t, frame)
+    """
+
+    def __init__(self, path, xLength, yLength, zLength, dtype=np.float32, **header):
+        self.path = path
+        encoded, self.header = _encode_header(
+            _build_header(xLength, yLength, zLength, dtype, **header))
+        self.dtype = np.dtype(self.header['dtype'])
+        self.shape = (int(zLength), int(yLength), int(xLength))
+
+        with open(path, 'wb') as f:
+            f.write(encoded)
+            f.truncate(self.header['dataOffset'] + self.dtype.itemsize * int(np.prod(self.shape)))
+        self.data = np.memmap(path, dtype=self.dtype, mode='r+',
+                              offset=self.header['dataOffset'], shape=self.shape)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, index, frame, upsample=1):
+        """
+        写入第 index 帧
+
+        Args:
+            index: 帧序号（可以按任意顺序写入，如反转时间时写到 zLength - 1 - t）
+            frame: (yLength, xLength) 或展平的一维数据；
+                   upsample > 1 时为 (yLength / upsample, xLength / upsample) 的低分辨率帧
+            upsample: 整数放大倍数，等价于 np.kron(frame, np.ones((upsample, upsample)))，
+                      直接按广播写入目标帧，不生成放大后的临时数组
+
+        Returns:
+            目标帧的内存映射视图 (yLength, xLength)，可以继续原地修改（如裁切）
+        """
+        target = self.data[index]
+        if upsample == 1:
+            target[...] = np.reshape(frame, self.shape[1:])
+            return target
+        ny, nx = self.shape[1] // upsample, self.shape[2] // upsample
+        frame = np.reshape(frame, (ny, nx))
+        target.reshape(ny, upsample, nx, upsample)[...] = frame[:, None, :, None]
+        return target
+
+    def write_frames(self, start, frames):
+        """从第 start 帧开始连续写入多帧"""
+        frames = np.reshape(frames, (-1,) + self.shape[1:])
+        self.data[start:start + len(frames)] = frames
+
+    def close(self):
+        if self.data is not None:
+            self.data.flush()
+            self.data = None
+
+
+def write_frame_store(path, data, xLength, yLength, zLength, **header):
+    """一次性写出整个体数据（展平或 (zLength, yLength, xLength)）"""
+    with FrameStoreWriter(path, xLength, yLength, zLength, **header) as writer:
+        writer.write_frames(0, data)
+    return path
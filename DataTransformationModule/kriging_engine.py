@@ -0,0 +1,563 @@
+# -*- coding: utf-8 -*-
+"""
+批量普通克里金插值引擎
+用于替代 1_KrigingInterpolation.py 中逐帧新建 pykrige.ok.OrdinaryKriging 的做法
+
+站点坐标 (np_lng, np_lat) 在所有时间帧中保持不变，因此：
+1. 变差函数在每个时间窗口内只拟合（或直接指定）一次
+2. 克里金矩阵只分解一次
+3. 网格权重按块（tile）求解，整个窗口的所有帧通过一次分块矩阵乘法得到结果
+
+与 pykrige 的关系：
+- 变差函数模型、经验变差函数分箱与拟合流程与 pykrige 保持一致
+- 窗口内的经验半方差为所有帧的平均值；窗口只有一帧时与 pykrige 的拟合结果相同
+- 对于 linear 模型，克里金权重只取决于 nugget / slope 的比值
+
+站点缺测（NaN）：
+- execute_masked 按每帧的站点可用性分组，同一可用性模式的帧共享一套克里金系统
+- 已分解的系统与网格权重保存在以可用性位掩码为键的 LRU 缓存中（KrigingSystemCache）
+
+大规模站点网络：
+- LocalKriging 为移动窗口（局部邻域）克里金，用 KD 树为每个网格块选取最近的 k 个站点
+- 邻域与分解结果预先计算一次，所有帧共享；计算量与内存随站点数线性增长
+
+工作精度（dtype）：
+- 克里金矩阵的组装、分解与求解始终使用 float64
+- 缓存的网格权重、站点值与插值结果使用 dtype（如 float32），
+  权重缓存与输出内存减半，矩阵乘法使用单精度 BLAS
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import scipy.linalg
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist, pdist
+
+
+def _variogram_function(variogram_model):
+    """返回 pykrige 中与模型名对应的变差函数"""
+    from pykrige.ok import OrdinaryKriging
+    if variogram_model not in OrdinaryKriging.variogram_dict:
+        raise ValueError(f"Unknown variogram model: {variogram_model}")
+    return OrdinaryKriging.variogram_dict[variogram_model]
+
+
+def pooled_semivariance(x, y, values, nlags=6):
+    """
+    计算一个时间窗口内的平均经验半方差
+
+    原理：sum_t (v_ti - v_tj)^2 = S_i + S_j - 2 G_ij，其中 G = V^T V，
+    因此只需一次 Gram 矩阵乘法，而不必逐帧计算所有站点对的差值。
+    分箱方式与 pykrige 相同（nlags 个等宽区间）。
+    NaN 视为缺测，每个站点对只在两者同时有值的帧上取平均。
+
+    Args:
+        x, y: (n,) 站点坐标
+        values: (T, n) 站点值，可包含 NaN
+        nlags: 分箱数
+
+    Returns:
+        lags, semivariance: 每个非空分箱的平均距离与平均半方差
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    present = ~np.isnan(values)
+    v = np.where(present, values, 0.0)
+    m = present.astype(np.float64)
+    n = values.shape[1]
+
+    # 缺测值不参与计算：只统计两个站点同时有值的帧
+    d = pdist(np.column_stack((x, y)), metric='euclidean')
+    cross = v.T @ v
+    sq_m = (v * v).T @ m
+    count = m.T @ m
+    i, j = np.triu_indices(n, k=1)  # 与 pdist 的压缩顺序一致
+    count = count[i, j]
+    paired = count > 0
+    g = 0.5 * (sq_m[i, j] + sq_m[j, i] - 2.0 * cross[i, j])[paired] / count[paired]
+    np.maximum(g, 0.0, out=g)
+    d = d[paired]
+
+    dmin, dmax = np.amin(d), np.amax(d)
+    dd = (dmax - dmin) / nlags
+    bins = [dmin + k * dd for k in range(nlags)]
+    bins.append(dmax + 0.001)
+
+    lags = np.full(nlags, np.nan)
+    semivariance = np.full(nlags, np.nan)
+    for k in range(nlags):
+        in_bin = (d >= bins[k]) & (d < bins[k + 1])
+        if in_bin.any():
+            lags[k] = np.mean(d[in_bin])
+            semivariance[k] = np.mean(g[in_bin])
+
+    valid = ~np.isnan(semivariance)
+    return lags[valid], semivariance[valid]
+
+
+def fit_variogram(x, y, values, variogram_model='linear', nlags=6):
+    """
+    用窗口内所有帧的平均经验半方差拟合变差函数参数
+
+    Returns:
+        pykrige 参数顺序的参数列表（linear 为 [slope, nugget]）
+    """
+    from pykrige.core import _calculate_variogram_model
+    lags, semivariance = pooled_semivariance(x, y, values, nlags=nlags)
+    return list(_calculate_variogram_model(
+        lags, semivariance, variogram_model,
+        _variogram_function(variogram_model), False
+    ))
+
+
+class KrigingSystemCache:
+    """
+    克里金系统 LRU 缓存
+
+    键为 (变差函数参数, 站点可用性位掩码)，值为已分解的克里金矩阵与网格权重。
+    共享同一可用性模式的帧直接复用缓存，跳过求解。
+    hits / misses 计数用于评估缓存大小是否合适。
+    """
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def key(params, present):
+        """由变差函数参数与 (n,) 布尔可用性数组生成缓存键"""
+        return tuple(params), np.packbits(present).tobytes()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+class BatchKriging:
+    """
+    批量普通克里金插值
+
+    用法：
+        engine = BatchKriging(np_lng, np_lat, grid_lon, grid_lat)
+        engine.fit(window_values)          # (T, n)，每个窗口一次
+        z = engine.execute(window_values)  # (T, len(grid_lat), len(grid_lon))
+
+    网格权重按 tile_size 个网格点分块求解，内存占用约为
+    (n + 1) * tile_size 个 float64；cache_weights=True 时会缓存全部权重
+    （n * 网格点数 个 dtype），在同一变差函数下重复调用 execute 时跳过求解。
+
+    站点值含 NaN 时使用 execute_masked：缺测站点的子系统缓存在
+    system_cache 中，最多保留 cache_entries 套。
+
+    给定 cell_mask（如陆地掩膜）时只求解和计算掩膜内的网格点，
+    计算量按被掩膜剔除的面积等比例减少，掩膜外输出 fill_value。
+    """
+
+    def __init__(self, x, y, grid_x, grid_y, variogram_model='linear',
+                 variogram_parameters=None, nlags=6, tile_size=4096,
+                 cache_weights=True, cache_entries=16, cell_mask=None, fill_value=0.0,
+                 dtype=np.float64):
+        """
+        Args:
+            x, y: (n,) 站点坐标（与网格使用相同投影）
+            grid_x, grid_y: 网格的 x / y 坐标向量（与 pykrige 'grid' 模式相同）
+            variogram_model: pykrige 支持的变差函数模型名
+            variogram_parameters: 固定的变差函数参数；None 表示调用 fit 拟合
+            nlags: 经验变差函数分箱数
+            tile_size: 每次求解的网格点数
+            cache_weights: 是否缓存全部网格权重
+            cache_entries: 缺测模式 LRU 缓存的最大条目数
+            cell_mask: 可选的 (ny, nx) 布尔掩膜，只计算 True 的网格点
+            fill_value: 掩膜外网格点的输出值
+            dtype: 网格权重、站点值与插值结果的工作精度（求解始终为 float64）
+        """
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.grid_x = np.asarray(grid_x, dtype=np.float64)
+        self.grid_y = np.asarray(grid_y, dtype=np.float64)
+        self.variogram_model = variogram_model
+        self.variogram_function = _variogram_function(variogram_model)
+        self.nlags = nlags
+        self.tile_size = tile_size
+        self.cache_weights = cache_weights
+        self.dtype = np.dtype(dtype)
+
+        self._stations = np.column_stack((self.x, self.y))
+        gx, gy = np.meshgrid(self.grid_x, self.grid_y)
+        self._points = np.column_stack((gx.ravel(), gy.ravel()))
+        # 只计算掩膜内的网格点，结果再散射回完整网格
+        self.cell_mask = None
+        self.fill_value = fill_value
+        self._cells = None
+        if cell_mask is not None:
+            self.cell_mask = np.asarray(cell_mask, dtype=bool)
+            if self.cell_mask.shape != self.grid_shape:
+                raise ValueError(f"cell_mask shape {self.cell_mask.shape} does not match grid {self.grid_shape}")
+            self._cells = np.flatnonzero(self.cell_mask)
+            self._points = self._points[self._cells]
+
+        self.variogram_parameters = None
+        self._lu = None
+        self._weights = None
+        self.system_cache = KrigingSystemCache(cache_entries)
+        if variogram_parameters is not None:
+            self.set_variogram(variogram_parameters)
+
+    @property
+    def grid_shape(self):
+        return len(self.grid_y), len(self.grid_x)
+
+    @property
+    def n_stations(self):
+        return len(self.x)
+
+    def fit(self, values):
+        """用 (T, n) 窗口数据拟合变差函数，并重新分解克里金矩阵"""
+        params = fit_variogram(self.x, self.y, values,
+                               variogram_model=self.variogram_model,
+                               nlags=self.nlags)
+        self.set_variogram(params)
+        return self.variogram_parameters
+
+    def set_variogram(self, params):
+        """指定变差函数参数，并分解克里金矩阵"""
+        params = [float(p) for p in params]
+        if params == self.variogram_parameters and self._lu is not None:
+            return
+        self.variogram_parameters = params
+        self._weights = None
+        self._lu = self._factor(self._stations)
+
+    def _factor(self, stations):
+        """组装并 LU 分解给定站点的克里金矩阵"""
+        n = len(stations)
+        d = cdist(stations, stations, 'euclidean')
+        a = np.zeros((n + 1, n + 1))
+        a[:n, :n] = -self.variogram_function(self.variogram_parameters, d)
+        np.fill_diagonal(a, 0.0)
+        a[n, :] = 1.0
+        a[:, n] = 1.0
+        a[n, n] = 0.0
+        if n > 1 and not np.any(a[:n, :n]):
+            raise ValueError(f"Degenerate variogram parameters: {self.variogram_parameters}")
+        return scipy.linalg.lu_factor(a, check_finite=False)
+
+    def _solve_tile(self, points, lu=None, stations=None):
+        """求解一块网格点的克里金权重，返回 (n, len(points))"""
+        if lu is None:
+            lu, stations = self._lu, self._stations
+        n = len(stations)
+        b = np.empty((n + 1, len(points)))
+        b[:n] = -self.variogram_function(self.variogram_parameters,
+                                         cdist(stations, points, 'euclidean'))
+        b[n] = 1.0
+        return scipy.linalg.lu_solve(lu, b, check_finite=False)[:n]
+
+    def iter_weights(self):
+        """按块生成 (网格切片, 权重矩阵)"""
+        if self._lu is None:
+            raise RuntimeError("Variogram is not set, call fit() or set_variogram() first")
+        n_points = len(self._points)
+        if self.cache_weights and self._weights is None:
+            # 先求出全部权重再统一从缓存中取块，保证首次调用与后续调用的计算路径一致
+            weights = np.empty((self.n_stations, n_points), dtype=self.dtype)
+            for start in range(0, n_points, self.tile_size):
+                stop = min(start + self.tile_size, n_points)
+                weights[:, start:stop] = self._solve_tile(self._points[start:stop])
+            self._weights = weights
+
+        for start in range(0, n_points, self.tile_size):
+            stop = min(start + self.tile_size, n_points)
+            if self._weights is not None:
+                yield slice(start, stop), self._weights[:, start:stop]
+            else:
+                yield slice(start, stop), self._solve_tile(self._points[start:stop]).astype(self.dtype)
+
+    def _prepare(self, values, out):
+        """
+        检查输入并准备输出
+
+        Returns:
+            values (T, n), out (T, ny, nx), 以及计算用的 (T, 网格点数) 数组；
+            设置了 cell_mask 时后者为只包含掩膜内网格点的紧凑数组
+        """
+        if self.variogram_parameters is None:
+            raise RuntimeError("Variogram is not set, call fit() or set_variogram() first")
+        values = np.atleast_2d(np.asarray(values, dtype=self.dtype))
+        if values.shape[1] != self.n_stations:
+            raise ValueError(f"Expected {self.n_stations} stations, got {values.shape[1]}")
+
+        ny, nx = self.grid_shape
+        if out is None:
+            out = np.empty((len(values), ny, nx), dtype=self.dtype)
+        if self._cells is None:
+            return values, out, out.reshape(len(values), ny * nx)
+        return values, out, np.empty((len(values), len(self._cells)), dtype=self.dtype)
+
+    def _finish(self, out, compact):
+        """把紧凑结果散射回完整网格，掩膜外的网格点填 fill_value"""
+        if self._cells is not None:
+            flat = out.reshape(len(out), -1)
+            flat[:] = self.fill_value
+            flat[:, self._cells] = compact
+        return out
+
+    def _execute_into(self, values, compact, rows):
+        """全部站点可用时，把 values 的插值结果写入 compact[rows]"""
+        for cells, w in self.iter_weights():
+            compact[rows, cells] = values @ w
+
+    def execute(self, values, out=None):
+        """
+        对窗口内所有帧执行插值
+
+        Args:
+            values: (T, n) 或 (n,) 站点值
+            out: 可选的 (T, ny, nx) 输出数组
+
+        Returns:
+            (T, ny, nx) 插值结果（输入为 (n,) 时返回 (ny, nx)）
+        """
+        single = np.ndim(values) == 1
+        values, out, compact = self._prepare(values, out)
+        self._execute_into(values, compact, slice(None))
+        out = self._finish(out, compact)
+        return out[0] if single else out
+
+    def _subset_system(self, present):
+        """取出（或建立并缓存）只包含 present 站点的克里金系统"""
+        key = self.system_cache.key(self.variogram_parameters, present)
+        entry = self.system_cache.get(key)
+        if entry is None:
+            entry = self._build_system(present)
+            self.system_cache.put(key, entry)
+        return entry
+
+    def _build_system(self, present):
+        """分解 present 站点的克里金矩阵，并按需求出全部网格权重"""
+        stations = self._stations[present]
+        lu = self._factor(stations)
+        weights = None
+        if self.cache_weights:
+            weights = np.empty((len(stations), len(self._points)), dtype=self.dtype)
+            for start in range(0, len(self._points), self.tile_size):
+                stop = min(start + self.tile_size, len(self._points))
+                weights[:, start:stop] = self._solve_tile(self._points[start:stop], lu, stations)
+        return lu, stations, weights
+
+    def _apply_system(self, entry, present, values, compact, rows):
+        """用子系统插值 rows 对应的帧；values 为这些帧的 (B, n) 全部站点值"""
+        lu, stations, weights = entry
+        group_values = values[:, present]
+        for start in range(0, len(self._points), self.tile_size):
+            stop = min(start + self.tile_size, len(self._points))
+            if weights is not None:
+                w = weights[:, start:stop]
+            else:
+                w = self._solve_tile(self._points[start:stop], lu, stations).astype(self.dtype)
+            compact[rows, start:stop] = group_values @ w
+
+    def execute_masked(self, values, out=None):
+        """
+        对含缺测（NaN）站点值的窗口执行插值
+
+        原理：按每帧的站点可用性模式分组；全部站点可用的帧走完整系统，
+        其余每种模式只求解一次（并进入 LRU 缓存），组内所有帧共用一次矩阵乘法。
+        没有任何站点可用的帧输出 NaN（由 degenerate_frames 判为退化帧）。
+
+        Args:
+            values: (T, n) 站点值，NaN 表示缺测
+            out: 可选的 (T, ny, nx) 输出数组
+
+        Returns:
+            (T, ny, nx) 插值结果
+        """
+        values, out, compact = self._prepare(values, out)
+        present = ~np.isnan(values)
+        complete = present.all(axis=1)
+        if complete.all():
+            self._execute_into(values, compact, slice(None))
+            return self._finish(out, compact)
+        if complete.any():
+            rows = np.flatnonzero(complete)
+            self._execute_into(values[rows], compact, rows)
+
+        rows = np.flatnonzero(~complete)
+        patterns, inverse = np.unique(present[rows], axis=0, return_inverse=True)
+        for k, pattern in enumerate(patterns):
+            group = rows[inverse.ravel() == k]
+            if not pattern.any():
+                compact[group] = np.nan
+                continue
+            self._apply_system(self._subset_system(pattern), pattern, values[group], compact, group)
+        return self._finish(out, compact)
+
+
+class LocalKriging(BatchKriging):
+    """
+    移动窗口（局部邻域）普通克里金
+
+    原理：网格按 block_size x block_size 分块，用站点坐标的 KD 树为每个块的中心
+    查询最近的 n_neighbours 个站点，块内所有网格点只用这些站点求解。
+    相邻块的邻域常常相同，相同邻域只分解一次。邻域、分解与权重在设置变差函数时
+    预先计算，之后所有帧只做 (T, k) x (k, 块内网格点数) 的矩阵乘法。
+
+    全局克里金的求解为 O(n^3)、权重内存为 O(n * 网格点数)；
+    局部克里金分别降为 O(块数 * k^3) 与 O(k * 网格点数)。
+    缺测模式下在可用站点上重建 KD 树与邻域，结果同样进入 LRU 缓存。
+    """
+
+    def __init__(self, x, y, grid_x, grid_y, n_neighbours=32, block_size=8, **kwargs):
+        """
+        Args:
+            n_neighbours: 每个网格块使用的最近站点数 k
+            block_size: 网格块边长（网格点数）
+            其余参数同 BatchKriging
+        """
+        self.n_neighbours = n_neighbours
+        self.block_size = block_size
+        self._local = None
+        variogram_parameters = kwargs.pop('variogram_parameters', None)
+        super().__init__(x, y, grid_x, grid_y, **kwargs)
+
+        # 网格块中的点使用计算点（紧凑）索引；完全落在 cell_mask 外的块被丢弃。
+        # 块中心按完整的块计算，邻域不受掩膜影响，掩膜内结果与不加掩膜时一致
+        ny, nx = self.grid_shape
+        point_index = np.full(ny * nx, -1)
+        if self._cells is None:
+            point_index[:] = np.arange(ny * nx)
+        else:
+            point_index[self._cells] = np.arange(len(self._cells))
+        point_index = point_index.reshape(ny, nx)
+        self._blocks = []
+        centers = []
+        for r in range(0, ny, block_size):
+            for c in range(0, nx, block_size):
+                cells = point_index[r:r + block_size, c:c + block_size].ravel()
+                cells = cells[cells >= 0]
+                if len(cells):
+                    self._blocks.append(cells)
+                    centers.append((self.grid_x[c:c + block_size].mean(),
+                                    self.grid_y[r:r + block_size].mean()))
+        self._centers = np.array(centers)
+        if variogram_parameters is not None:
+            self.set_variogram(variogram_parameters)
+
+    def set_variogram(self, params):
+        """指定变差函数参数，并预先计算全部站点可用时的局部系统"""
+        params = [float(p) for p in params]
+        if params == self.variogram_parameters and self._local is not None:
+            return
+        self.variogram_parameters = params
+        self._local = self._build_system(np.ones(self.n_stations, dtype=bool))
+
+    def _build_system(self, present):
+        """
+        为 present 站点建立局部邻域系统
+
+        Returns:
+            (neighbours, weights)：每个网格块的站点全局索引 (k,) 与权重 (k, 块内网格点数)
+        """
+        index = np.flatnonzero(present)
+        k = min(self.n_neighbours, len(index))
+        _, nearest = cKDTree(self._stations[index]).query(self._centers, k=k)
+        nearest = np.sort(index[nearest.reshape(len(self._centers), k)], axis=1)
+
+        factored = {}
+        neighbours, weights = [], []
+        for cells, nbr in zip(self._blocks, nearest):
+            key = nbr.tobytes()
+            if key not in factored:
+                factored[key] = self._factor(self._stations[nbr])
+            neighbours.append(nbr)
+            weights.append(self._solve_tile(self._points[cells], factored[key],
+                                            self._stations[nbr]).astype(self.dtype))
+        return neighbours, weights
+
+    def _apply_system(self, entry, present, values, compact, rows):
+        neighbours, weights = entry
+        for cells, nbr, w in zip(self._blocks, neighbours, weights):
+            if isinstance(rows, slice):
+                compact[rows, cells] = values[:, nbr] @ w
+            else:
+                compact[np.ix_(rows, cells)] = values[:, nbr] @ w
+
+    def _execute_into(self, values, compact, rows):
+        self._apply_system(self._local, None, values, compact, rows)
+
+    def iter_weights(self):
+        """
+        按网格块生成 (计算点索引, 权重矩阵)
+
+        与 BatchKriging.iter_weights 相同，权重为 (n, 块内网格点数)：块的邻域站点取
+        预先计算的权重，其余站点为 0，values @ w 即为该块的插值结果
+        """
+        if self._local is None:
+            raise RuntimeError("Variogram is not set, call fit() or set_variogram() first")
+        neighbours, weights = self._local
+        for cells, nbr, w in zip(self._blocks, neighbours, weights):
+            dense = np.zeros((self.n_stations, len(cells)), dtype=self.dtype)
+            dense[nbr] = w
+            yield cells, dense
+
+
+def make_engine(x, y, grid_x, grid_y, n_neighbours=None, block_size=8, **kwargs):
+    """n_neighbours 为 None 时返回全局 BatchKriging，否则返回 LocalKriging"""
+    if n_neighbours is None:
+        return BatchKriging(x, y, grid_x, grid_y, **kwargs)
+    return LocalKriging(x, y, grid_x, grid_y, n_neighbours=n_neighbours,
+                        block_size=block_size, **kwargs)
+
+
+def degenerate_frames(z, cell_mask=None):
+    """
+    判断哪些帧是退化的插值结果（整帧为常数）
+
+    与原脚本中 max(z1) == mean(z1) 的判断相同，但允许浮点舍入误差
+    （float32 插值结果按其精度放宽容差）；含 NaN 的帧（没有可用站点）同样视为退化帧。
+
+    Args:
+        z: (T, ny, nx) 插值结果
+        cell_mask: 可选的 (ny, nx) 布尔掩膜，只在掩膜内判断
+
+    Returns:
+        (T,) 布尔数组
+    """
+    flat = z.reshape(len(z), -1)
+    if cell_mask is not None:
+        flat = flat[:, np.asarray(cell_mask, dtype=bool).ravel()]
+    max_z = flat.max(axis=1).astype(np.float64)
+    mean_z = flat.mean(axis=1, dtype=np.float64)
+    tolerance = max(1e-9, 16 * np.finfo(flat.dtype).eps) if flat.dtype.kind == 'f' else 1e-9
+    return ~np.isfinite(max_z) | np.isclose(max_z, mean_z, rtol=tolerance, atol=tolerance)
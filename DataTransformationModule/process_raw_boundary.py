@@ -10,8 +10,13 @@ import numpy as np
 import os
 from scipy.ndimage import gaussian_filter
 
+from volume_io import open_volume, write_volume
+
 HERE = os.path.dirname(__file__)
 
+# 边界处理的浮点工作类型（输入输出均为 uint8，float32 已足够）
+working_dtype = np.float32
+
 
 def neumann_boundary(data_3d, boundary_width=2):
     """
@@ -50,10 +55,10 @@ def gaussian_smooth_boundary(data_3d, sigma=1.5, boundary_fade_width=5):
     """
     print(f"  应用高斯平滑 (sigma={sigma}, 淡出宽度={boundary_fade_width})...")
     
-    blurred = gaussian_filter(data_3d.astype(float), sigma=sigma)
+    blurred = gaussian_filter(data_3d.astype(working_dtype), sigma=sigma)
     
     z, x, y = data_3d.shape
-    mask = np.ones_like(data_3d, dtype=float)
+    mask = np.ones_like(data_3d, dtype=working_dtype)
     
     # 创建边界淡出掩膜
     for i in range(boundary_fade_width):
@@ -69,23 +74,22 @@ def gaussian_smooth_boundary(data_3d, sigma=1.5, boundary_fade_width=5):
     return result.astype(np.uint8)
 
 
-def process_raw_file(input_path, output_path, dims, boundary_method='neumann'):
+def process_raw_file(input_ini_path, output_path, boundary_method='neumann'):
     """
     处理 RAW 文件，应用边界改进
     
     Args:
-        input_path: 输入 .raw 文件路径
-        output_path: 输出 .raw 文件路径
-        dims: (x, y, z) 维度元组
+        input_ini_path: 输入 .raw 文件的 .ini 路径
+        output_path: 输出 .raw 文件路径（同时写出 .ini）
         boundary_method: 'neumann' 或 'gaussian'
     """
-    print(f"\n开始处理: {os.path.basename(input_path)}")
-    print(f"  尺寸: {dims[0]} × {dims[1]} × {dims[2]}")
+    volume = open_volume(input_ini_path)
+    print(f"\n开始处理: {os.path.basename(volume.raw_path)}")
+    print(f"  尺寸: {volume.dims[0]} × {volume.dims[1]} × {volume.dims[2]}")
     
-    # 1. 读取数据
+    # 1. 读取数据（(z, y, x)，与 Unity 的读取顺序一致；原来按 (x, y, z) reshape，轴是错的）
     print("  读取数据...")
-    data = np.fromfile(input_path, dtype=np.uint8)
-    data_3d = data.reshape((dims[0], dims[1], dims[2]))  # (x, y, z)
+    data_3d = volume.read()
     
     # 打印数据统计
     print(f"  数据范围: {data_3d.min()} ~ {data_3d.max()}")
@@ -102,7 +106,7 @@ def process_raw_file(input_path, output_path, dims, boundary_method='neumann'):
     
     # 3. 保存数据
     print("  保存数据...")
-    data_3d.astype(np.uint8).tofile(output_path)
+    write_volume(data_3d.astype(np.uint8), output_path, 'uint8')
     
     print(f"✓ 完成: {os.path.basename(output_path)}")
     return output_path
@@ -131,27 +135,15 @@ def main():
         return
     
     # 读取 INI 文件获取维度
-    dims = {}
-    with open(raw_ini_path, 'r') as f:
-        for line in f:
-            if ':' in line:
-                key, value = line.split(':')
-                key = key.strip().lower()
-                value = value.strip()
-                if key == 'dimx':
-                    dims['x'] = int(value)
-                elif key == 'dimy':
-                    dims['y'] = int(value)
-                elif key == 'dimz':
-                    dims['z'] = int(value)
-    
-    if len(dims) != 3:
+    try:
+        dimx, dimy, dimz = open_volume(raw_ini_path).dims
+    except (KeyError, ValueError):
         print(f"✗ 错误: 无法从 INI 文件读取完整的维度信息")
         return
     
     print(f"\n[输入数据信息]")
     print(f"  文件: {os.path.basename(raw_file_path)}")
-    print(f"  维度: X={dims['x']}, Y={dims['y']}, Z={dims['z']}")
+    print(f"  维度: X={dimx}, Y={dimy}, Z={dimz}")
     
     # 创建输出目录
     output_dir = os.path.join(HERE, 'MyData')
@@ -165,16 +157,10 @@ def main():
     print("\n[方案 A] Neumann 边界处理")
     output_path_neumann = os.path.join(output_dir, 'volume_oxygen_neumann_boundary.raw')
     process_raw_file(
-        raw_file_path,
+        raw_ini_path,
         output_path_neumann,
-        (dims['x'], dims['y'], dims['z']),
         boundary_method='neumann'
     )
-    
-    # 生成 INI 文件
-    ini_content = f"dimx:{dims['x']} \ndimy:{dims['y']} \ndimz:{dims['z']} \nskip:0 \nformat:uint8"
-    with open(output_path_neumann + '.ini', 'w') as f:
-        f.write(ini_content)
     print(f"  配置文件: {os.path.basename(output_path_neumann)}.ini")
     
     # ====================================================================
@@ -183,15 +169,10 @@ def main():
     print("\n[方案 B] 高斯平滑边界处理")
     output_path_gaussian = os.path.join(output_dir, 'volume_oxygen_gaussian_boundary.raw')
     process_raw_file(
-        raw_file_path,
+        raw_ini_path,
         output_path_gaussian,
-        (dims['x'], dims['y'], dims['z']),
         boundary_method='gaussian'
     )
-    
-    # 生成 INI 文件
-    with open(output_path_gaussian + '.ini', 'w') as f:
-        f.write(ini_content)
     print(f"  配置文件: {os.path.basename(output_path_gaussian)}.ini")
     
     # ====================================================================
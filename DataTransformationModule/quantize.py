@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+分块量化与导出
+用于替代各平滑脚本中的 map_values_with_condition（np.where -> np.round -> astype(int)
+-> astype(np.uint8) 共四个整卷临时数组），把平滑结果直接量化写入 .raw / .ini
+
+原理：
+1. 按固定大小的块处理：每块在一个复用的暂存区（与输入同为 float32 / float64）中原地完成
+   线性映射、舍入与截断，再转换为目标类型写入文件，额外内存只有一个块
+2. 码值布局（QuantizeMapping）：
+   - 0（被裁切的境外网格）映射为 code_zero
+   - [value_min, value_max] 线性映射到 [code_min, code_max]，超出量程的值截断到两端
+     （原实现在 uint8 转换时会回绕，如 600 -> 49）
+   - uint8 默认 (1, 5, 254)，与 map_values_with_condition 逐字节一致；
+     uint16 为 uint8 布局 x 257，按类型满量程归一化时传递函数的位置不变
+   - float16 不做线性映射，直接保存截断到量程内的原始值（0 仍为 0）
+3. 量程可以固定，也可以由 scan_range 分块扫描得到：
+   - 'minmax'：非零值的最小 / 最大值
+   - 'percentile'：先扫描最小 / 最大值，再扫描一遍直方图，由累计频数插值得到百分位数
+     （分辨率为 (max - min) / bins）
+4. 映射参数写入 .ini 的附加字段（value_min / value_max / code_zero / code_min / code_max），
+   Unity 的 DatasetIniReader 会忽略不认识的字段；mapping_from_ini / dequantize_chunk
+   由这些字段把码值还原为数值（如时间汇总）
+
+注意：Unity 的 DatasetIniReader 只支持 int8/16/32 与 uint8/16/32，float16 输出供其他工具使用。
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+QUANT_FORMATS = ('uint8', 'uint16', 'float16')
+
+# 每种整数格式的 (code_zero, code_min, code_max)
+CODE_LAYOUTS = {
+    'uint8': (1, 5, 254),
+    'uint16': (257, 1285, 65278),
+}
+
+# 默认的固定量程（与 map_values_with_condition 相同）
+DEFAULT_RANGE = (1.0, 500.0)
+
+QuantizeMapping = namedtuple('QuantizeMapping',
+                             ['format', 'value_min', 'value_max', 'code_zero', 'code_min', 'code_max'])
+
+
+def quantize_mapping(value_range=DEFAULT_RANGE, fmt='uint8'):
+    """
+    由量程与输出格式得到码值映射
+
+    Args:
+        value_range: (value_min, value_max)
+        fmt: 'uint8' / 'uint16' / 'float16'
+    """
+    if fmt not in QUANT_FORMATS:
+        raise ValueError(f"Unknown quantize format: {fmt}")
+    value_min, value_max = (float(v) for v in value_range)
+    if not value_max > value_min:
+        raise ValueError(f"Invalid value range: {value_range}")
+    if fmt == 'float16':
+        return QuantizeMapping(fmt, value_min, value_max, 0.0, value_min, value_max)
+    return QuantizeMapping(fmt, value_min, value_max, *CODE_LAYOUTS[fmt])
+
+
+def _scratch_dtype(values):
+    """暂存区类型：float32 输入用 float32 计算，其余用 float64"""
+    return np.result_type(values.dtype, np.float32)
+
+
+def _chunks(flat, chunk_elements):
+    for c0 in range(0, flat.size, chunk_elements):
+        yield flat[c0:c0 + chunk_elements]
+
+
+def scan_range(volume, method='minmax', percentiles=(0.5, 99.5), bins=4096, chunk_elements=1 << 22):
+    """
+    分块扫描数据得到量程（忽略 0 与非有限值）
+
+    Args:
+        volume: 任意形状的数组（可以是内存映射）
+        method: 'minmax' 或 'percentile'
+        percentiles: method 为 'percentile' 时的 (下百分位, 上百分位)
+        bins: 百分位直方图的分箱数
+
+    Returns:
+        (value_min, value_max)
+    """
+    if method not in ('minmax', 'percentile'):
+        raise ValueError(f"Unknown range method: {method}")
+    flat = volume.reshape(-1)
+    low, high = np.inf, -np.inf
+    for chunk in _chunks(flat, chunk_elements):
+        valid = chunk[(chunk != 0) & np.isfinite(chunk)]
+        if valid.size:
+            low = min(low, float(valid.min()))
+            high = max(high, float(valid.max()))
+    if low > high:
+        raise ValueError("volume contains no non-zero values")
+    if method == 'minmax' or low == high:
+        return low, high
+
+    counts = np.zeros(bins, dtype=np.int64)
+    for chunk in _chunks(flat, chunk_elements):
+        valid = chunk[(chunk != 0) & np.isfinite(chunk)]
+        counts += np.histogram(valid, bins=bins, range=(low, high))[0]
+    cdf = np.concatenate([[0], np.cumsum(counts)]) / counts.sum()
+    edges = np.linspace(low, high, bins + 1)
+    return tuple(float(np.interp(p / 100, cdf, edges)) for p in percentiles)
+
+
+def quantize_chunk(values, mapping, out, scratch=None):
+    """
+    量化一块数据
+
+    Args:
+        values: 一维 float 数组
+        mapping: QuantizeMapping
+        out: 与 values 等长的目标类型数组
+        scratch: 可选的浮点暂存区（长度不小于 values）
+    """
+    n = values.size
+    s = np.empty(n, dtype=_scratch_dtype(values)) if scratch is None else scratch[:n]
+    if mapping.format == 'float16':
+        np.clip(values, mapping.value_min, mapping.value_max, out=s)
+    else:
+        # 运算顺序与 map_values_with_condition 相同，量程内的结果逐字节一致
+        np.subtract(values, mapping.value_min, out=s)
+        s /= mapping.value_max - mapping.value_min
+        s *= mapping.code_max - mapping.code_min
+        s += mapping.code_min
+        np.rint(s, out=s)
+        np.clip(s, mapping.code_min, mapping.code_max, out=s)
+    s[values == 0] = mapping.code_zero
+    out[...] = s
+    return out
+
+
+def quantize(volume, mapping, chunk_elements=1 << 20):
+    """量化整个数组，返回同形状的目标类型数组"""
+    flat = volume.reshape(-1)
+    out = np.empty(flat.size, dtype=mapping.format)
+    scratch = np.empty(min(chunk_elements, flat.size), dtype=_scratch_dtype(flat))
+    for c0 in range(0, flat.size, chunk_elements):
+        chunk = slice(c0, c0 + chunk_elements)
+        quantize_chunk(flat[chunk], mapping, out[chunk], scratch)
+    return out.reshape(volume.shape)
+
+
+def mapping_from_ini(params):
+    """
+    由 .ini 字段（volume_io.read_ini 的结果）恢复码值映射；
+    没有映射字段的旧文件按默认的固定量程处理
+    """
+    fmt = params.get('format', 'uint8')
+    if 'value_min' not in params:
+        return quantize_mapping(DEFAULT_RANGE, fmt)
+    cast = float if fmt == 'float16' else int
+    return QuantizeMapping(fmt, float(params['value_min']), float(params['value_max']),
+                           *(cast(float(params[key])) for key in ('code_zero', 'code_min', 'code_max')))
+
+
+def dequantize_chunk(codes, mapping, out):
+    """
+    量化的逆映射：code_zero -> 0，其余码值线性映射回 [value_min, value_max]
+
+    Args:
+        codes: 一维码值数组
+        out: 与 codes 等长的 float 数组
+    """
+    if mapping.format == 'float16':
+        out[...] = codes
+        return out
+    np.subtract(codes, mapping.code_min, out=out)
+    out *= (mapping.value_max - mapping.value_min) / (mapping.code_max - mapping.code_min)
+    out += mapping.value_min
+    out[codes == mapping.code_zero] = 0
+    return out
+
+
+def write_quantized_ini(raw_path, dims, mapping):
+    """
+    写出 Unity 读取的 .ini（附带映射参数）
+
+    Args:
+        raw_path: .raw 文件路径，.ini 为 raw_path + '.ini'
+        dims: (dimx, dimy, dimz)
+    """
+    dimx, dimy, dimz = dims
+    with open(f'{raw_path}.ini', 'w') as f:
+        ini = f'dimx:{dimx} \n' + f'dimy:{dimy} \n' + f'dimz:{dimz} \n' + f'skip:0 \nformat:{mapping.format}\n'
+        ini += (f'value_min:{mapping.value_min}\n' + f'value_max:{mapping.value_max}\n' +
+                f'code_zero:{mapping.code_zero}\n' + f'code_min:{mapping.code_min}\n' +
+                f'code_max:{mapping.code_max}\n')
+        f.write(ini)
+
+
+def quantize_to_file(volume, raw_path, mapping, dims, chunk_elements=1 << 20):
+    """
+    分块量化并直接写出 .raw 与 .ini
+
+    Args:
+        volume: 任意形状的 float 数组（按内存顺序写出）
+        raw_path: 输出 .raw 路径
+        mapping: QuantizeMapping
+        dims: (dimx, dimy, dimz)，写入 .ini
+    """
+    flat = volume.reshape(-1)
+    n = min(chunk_elements, flat.size)
+    scratch = np.empty(n, dtype=_scratch_dtype(flat))
+    buffer = np.empty(n, dtype=mapping.format)
+    with open(raw_path, 'wb') as f:
+        for c0 in range(0, flat.size, chunk_elements):
+            values = flat[c0:c0 + chunk_elements]
+            quantize_chunk(values, mapping, buffer[:values.size], scratch).tofile(f)
+    write_quantized_ini(raw_path, dims, mapping)
+    return raw_path
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+区域掩膜栅格化模块
+用于替代 1_KrigingInterpolation.py、2_Smooth.py、2_Smooth_improved.py 中
+反复读取 GeoJSON、unary_union、构建 122,500 个点的 GeoDataFrame 再 gpd.clip 的裁切方式
+
+原理：
+1. 直接读取 GeoJSON 中的多边形，顶点投影到 EPSG:3857
+2. 用向量化的扫描线（偶奇规则）把每个多边形栅格化到网格上，再取并集
+3. 可选按子像素超采样得到每个网格点的覆盖率（柔和的海岸线）
+4. 结果按 (GeoJSON 内容哈希, 网格参数) 缓存到磁盘，之后直接读取
+5. 应用时 2D 掩膜按时间广播，不生成 3D 掩膜副本
+6. 海岸线距离场（coast_distance）由掩膜一次计算 2D 欧氏距离变换，与掩膜一起缓存，
+   供边界处理按距离海岸线的远近混合
+"""
+
+import functools
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+from pyproj import Transformer
+from scipy.ndimage import distance_transform_edt
+
+HERE = os.path.dirname(__file__)
+ChinaGeoJsonPath = os.path.join(HERE, 'exampleData', 'chinaGeoJson.json')
+ChinaInCompJsonPath = os.path.join(HERE, 'exampleData', 'chinaChange.json')
+MaskCachePath = os.path.join(HERE, 'MaskCache')
+
+# 网格定义：x / y 方向的网格点为 np.linspace(x0, x1, nx) 与 np.linspace(y0, y1, ny)，
+# 与各脚本中 grid_lon / grid_lat 的定义一致；掩膜形状为 (ny, nx)
+GridSpec = namedtuple('GridSpec', ['x0', 'y0', 'x1', 'y1', 'nx', 'ny'])
+
+_transformer = None
+
+
+def _to_3857(lng, lat):
+    global _transformer
+    if _transformer is None:
+        _transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+    return _transformer.transform(lng, lat)
+
+
+def _polygons(geojson):
+    """遍历 GeoJSON 中的多边形，每个多边形为环（(k, 2) 经纬度数组）的列表"""
+    features = geojson['features'] if geojson.get('type') == 'FeatureCollection' else [geojson]
+    for feature in features:
+        geometry = feature.get('geometry', feature)
+        if geometry['type'] == 'Polygon':
+            yield [np.asarray(ring, dtype=np.float64)[:, :2] for ring in geometry['coordinates']]
+        elif geometry['type'] == 'MultiPolygon':
+            for polygon in geometry['coordinates']:
+                yield [np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon]
+
+
+@functools.lru_cache(maxsize=None)
+def grid_spec_from_geojson(geojson_path, nx, ny):
+    """
+    由 GeoJSON 的总范围（投影到 EPSG:3857）生成网格定义
+
+    与脚本中 js.geometry.total_bounds 再逐角点投影得到 js_box 的做法相同
+    """
+    with open(geojson_path, 'r', encoding='utf-8') as f:
+        geojson = json.load(f)
+    rings = [ring for polygon in _polygons(geojson) for ring in polygon]
+    coords = np.concatenate(rings)
+    x0, y0 = _to_3857(coords[:, 0].min(), coords[:, 1].min())
+    x1, y1 = _to_3857(coords[:, 0].max(), coords[:, 1].max())
+    return GridSpec(float(x0), float(y0), float(x1), float(y1), int(nx), int(ny))
+
+
+def china_grid_spec(nx, ny):
+    """中国地图（chinaGeoJson.json）范围上的 nx x ny 网格"""
+    return grid_spec_from_geojson(ChinaGeoJsonPath, nx, ny)
+
+
+def _scanline_fill(rings, grid_x, grid_y):
+    """
+    偶奇规则扫描线填充单个多边形（含洞）
+
+    对每条边，只在它跨越的网格行上计算交点 x；每个交点翻转其右侧所有网格点的奇偶性，
+    用差分数组 + 行累加和一次完成。
+
+    Returns:
+        (ny, nx) 布尔数组
+    """
+    ny, nx = len(grid_y), len(grid_x)
+    diff = np.zeros((ny, nx + 1), dtype=np.int32)
+    y_ascending = grid_y[0] <= grid_y[-1]
+    for ring in rings:
+        x1, y1 = ring[:-1, 0], ring[:-1, 1]
+        x2, y2 = ring[1:, 0], ring[1:, 1]
+        lo, hi = np.minimum(y1, y2), np.maximum(y1, y2)
+        # 半开区间 [lo, hi)：顶点恰好落在扫描线上时只计一次，水平边自然被排除
+        if y_ascending:
+            r0 = np.searchsorted(grid_y, lo, side='left')
+            r1 = np.searchsorted(grid_y, hi, side='left')
+        else:
+            r0 = ny - np.searchsorted(grid_y[::-1], hi, side='left')
+            r1 = ny - np.searchsorted(grid_y[::-1], lo, side='left')
+        counts = np.maximum(r1 - r0, 0)
+        if not counts.any():
+            continue
+        edge = np.repeat(np.arange(len(counts)), counts)
+        rows = np.repeat(r0 - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        yr = grid_y[rows]
+        t = (yr - y1[edge]) / (y2[edge] - y1[edge])
+        xc = x1[edge] + t * (x2[edge] - x1[edge])
+        cols = np.searchsorted(grid_x, xc, side='right')
+        np.add.at(diff, (rows, cols), 1)
+    return (np.cumsum(diff[:, :nx], axis=1) & 1).astype(bool)
+
+
+def rasterize_polygons(polygons, grid):
+    """
+    把投影后的多边形栅格化到网格上（取并集）
+
+    Args:
+        polygons: 多边形列表，每个多边形为环（(k, 2) EPSG:3857 坐标）的列表
+        grid: GridSpec
+
+    Returns:
+        (ny, nx) 布尔数组，True 表示网格点落在任一多边形内
+    """
+    grid_x = np.linspace(grid.x0, grid.x1, grid.nx)
+    grid_y = np.linspace(grid.y0, grid.y1, grid.ny)
+    inside = np.zeros((grid.ny, grid.nx), dtype=bool)
+    for rings in polygons:
+        # 先用外包框跳过与网格无关的多边形
+        outer = rings[0]
+        if (outer[:, 0].max() < min(grid.x0, grid.x1) or outer[:, 0].min() > max(grid.x0, grid.x1)
+                or outer[:, 1].max() < min(grid.y0, grid.y1) or outer[:, 1].min() > max(grid.y0, grid.y1)):
+            continue
+        inside |= _scanline_fill(rings, grid_x, grid_y)
+    return inside
+
+
+def _supersampled_grid(grid, supersample):
+    """每个网格点周围 supersample x supersample 个子采样点组成的细网格"""
+    dx = (grid.x1 - grid.x0) / max(grid.nx - 1, 1)
+    dy = (grid.y1 - grid.y0) / max(grid.ny - 1, 1)
+    offset_x = dx / 2 - dx / (2 * supersample)
+    offset_y = dy / 2 - dy / (2 * supersample)
+    return GridSpec(grid.x0 - offset_x, grid.y0 - offset_y,
+                    grid.x1 + offset_x, grid.y1 + offset_y,
+                    grid.nx * supersample, grid.ny * supersample)
+
+
+def region_mask(geojson_path, grid, exclude_last_feature=False, supersample=1,
+                cache_dir=MaskCachePath):
+    """
+    区域掩膜（带磁盘缓存）
+
+    Args:
+        geojson_path: 区域多边形 GeoJSON（EPSG:4326）
+        grid: GridSpec
+        exclude_last_feature: 是否排除最后一个要素（与 china.iloc[:-1, :] 一致）
+        supersample: 1 时返回布尔掩膜；> 1 时返回 [0, 1] 的 float32 覆盖率
+        cache_dir: 缓存目录；None 表示不使用磁盘缓存
+
+    Returns:
+        (ny, nx) 掩膜，True / 覆盖率 > 0 表示区域内
+    """
+    with open(geojson_path, 'rb') as f:
+        content = f.read()
+
+    cache_path = None
+    if cache_dir is not None:
+        key = hashlib.sha1(content)
+        key.update(repr((tuple(grid), bool(exclude_last_feature), int(supersample))).encode())
+        cache_path = os.path.join(cache_dir, f'mask_{key.hexdigest()}.npy')
+        if os.path.exists(cache_path):
+            return np.load(cache_path)
+
+    geojson = json.loads(content.decode('utf-8'))
+    if exclude_last_feature:
+        geojson = dict(geojson, features=geojson['features'][:-1])
+    polygons = []
+    for rings in _polygons(geojson):
+        projected = []
+        for ring in rings:
+            x, y = _to_3857(ring[:, 0], ring[:, 1])
+            projected.append(np.column_stack((x, y)))
+        polygons.append(projected)
+
+    if supersample > 1:
+        fine = rasterize_polygons(polygons, _supersampled_grid(grid, supersample))
+        mask = fine.reshape(grid.ny, supersample, grid.nx, supersample).mean(axis=(1, 3), dtype=np.float32)
+    else:
+        mask = rasterize_polygons(polygons, grid)
+
+    if cache_path is not None:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        np.save(cache_path, mask)
+    return mask
+
+
+def china_mask(nx, ny, supersample=1, cache_dir=MaskCachePath):
+    """
+    中国地图掩膜（chinaChange.json，排除最后一个未封闭要素），网格范围取自 chinaGeoJson.json
+
+    Returns:
+        (ny, nx) 掩膜，True 表示中国境内；supersample > 1 时为覆盖率
+    """
+    return region_mask(ChinaInCompJsonPath, china_grid_spec(nx, ny),
+                       exclude_last_feature=True, supersample=supersample,
+                       cache_dir=cache_dir)
+
+
+def coast_distance(mask, cache_dir=MaskCachePath):
+    """
+    海岸线距离场（带磁盘缓存）：区域内每个网格点到最近的区域外网格点的欧氏距离（网格单位）
+
+    紧邻海岸线的网格点为 1，区域外为 0。按掩膜内容哈希缓存在 cache_dir 中，
+    与掩膜本身的缓存放在一起；距离场为 2D，使用时按时间广播。
+
+    Args:
+        mask: (ny, nx) 布尔掩膜（或覆盖率，> 0 视为区域内），True 表示区域内
+        cache_dir: 缓存目录；None 表示不使用磁盘缓存
+
+    Returns:
+        (ny, nx) float32 距离场
+    """
+    inside = np.ascontiguousarray(np.asarray(mask) > 0)
+
+    cache_path = None
+    if cache_dir is not None:
+        key = hashlib.sha1(np.packbits(inside).tobytes())
+        key.update(repr(inside.shape).encode())
+        cache_path = os.path.join(cache_dir, f'distance_{key.hexdigest()}.npy')
+        if os.path.exists(cache_path):
+            return np.load(cache_path)
+
+    # 整个网格都在区域内时没有海岸线，距离为无穷大
+    if inside.all():
+        distance = np.full(inside.shape, np.inf, dtype=np.float32)
+    else:
+        distance = distance_transform_edt(inside).astype(np.float32)
+
+    if cache_path is not None:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        np.save(cache_path, distance)
+    return distance
+
+
+def china_coast_distance(nx, ny, cache_dir=MaskCachePath):
+    """中国地图掩膜（china_mask）的海岸线距离场，(ny, nx)"""
+    return coast_distance(china_mask(nx, ny, cache_dir=cache_dir), cache_dir=cache_dir)
+
+
+def apply_region_mask(volume, mask, fill_value=0.0):
+    """
+    把 2D 掩膜按时间广播到 (T, ny, nx) 体数据上（原地修改）
+
+    布尔掩膜：区域外的网格点设为 fill_value；
+    覆盖率掩膜：按覆盖率在原值与 fill_value 之间线性混合。
+    不会生成 3D 掩膜。
+
+    Args:
+        volume: (T, ny, nx) 或可 reshape 为该形状的连续数组（如展平的 1D 数据）
+        mask: (ny, nx) 布尔掩膜或覆盖率
+
+    Returns:
+        volume
+    """
+    frames = volume.reshape(-1, *mask.shape)
+    if mask.dtype == bool:
+        frames[:, ~mask] = fill_value
+    else:
+        frames *= mask
+        if fill_value != 0:
+            frames += fill_value * (1 - mask)
+    return volume
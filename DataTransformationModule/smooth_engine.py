@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+三维均值平滑引擎
+用于替代 2_Smooth.py、2_Smooth_improved.py 中 smooth3d_mean 的逐体素 Python 循环
+
+原理：
+1. 盒式均值可分离：先沿时间轴求窗口和，再沿两个空间轴求窗口和，最后除以窗口体素数
+2. 每个轴上的窗口和由累加和（前缀和）相减得到，每个体素的代价与半径无关
+3. 窗口与原实现一致：
+   - 时间窗口为 [t - r, t + r)，空间窗口为 [x - s, x + s)（左闭右开，不对称）
+   - 到达数据边缘时窗口截断，只对窗口内实际存在的体素求平均
+   - 跨切片光晕：时间窗口在起点被截断时，用 pre 帧补齐（原实现中的 next_data[z - r + t : z]）；
+     在终点被截断时，用 post 帧补齐（原实现中的 prev_data[0 : t + r - z]）。
+     由于插值结果已按 Unity 坐标系反转时间，起点一侧的光晕来自下一个切片，终点一侧来自上一个切片
+4. 相邻切片只读取需要的 r 帧光晕（load_halo），每个切片读一次
+5. 时间方向按空间行分块、空间方向按帧分块处理，可以直接写回输入数组，峰值内存只多出一个分块
+6. 每个时间方向的行分块、每个空间方向的帧分块都互不依赖，多进程按同样的分块计算时结果逐字节一致
+   （见 smooth_parallel.py）
+7. 可选的归一化卷积：给出 2D 有效网格掩膜 m 时计算 sum(v * m) / sum(m)，
+   被裁切为 0 的境外网格不参与平均，海岸附近不会出现低值边缘，无需额外的边界修补
+8. 流式模式（StreamingBoxSmoother）：整条时间线逐帧输入，只保留 2r 帧的环形缓冲与滑动和，
+   窗口完整的帧立即输出，内存与时间线长度无关
+
+精度：
+    求和使用 float64，前缀和相减的舍入误差约为 eps * (窗口所在行的累加和)。
+    对 AQI 数据（0 ~ 500，350 x 350，r = 24）与逐体素求平均相比，最大绝对误差小于 1e-9；
+    映射到 uint8 后只有恰好落在 .5 舍入边界附近（1e-9 以内）的体素可能相差 1。
+
+工作精度（dtype）：
+    整卷数组（输入、输出、光晕、流式环形缓冲）的类型跟随输入数据（float32 / float64），
+    前缀和只在分块内用 float64 计算。float32 时整卷内存与带宽减半，误差来自两遍之间
+    以 float32 保存的时间窗口和（相对误差约 6e-8），见 check_precision.py。
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from frame_store import FrameStore
+
+
+def float_dtype(a):
+    """数组的浮点工作类型：浮点数组保持原类型，其余（整数、列表）为 float64"""
+    dtype = np.asarray(a).dtype
+    return dtype if dtype.kind == 'f' else np.dtype(np.float64)
+
+
+def window_bounds(n, radius, pre=0, post=0):
+    """
+    每个输出位置的窗口 [lo, hi)
+
+    Args:
+        n: 该轴上的输出长度
+        radius: 窗口半径，窗口为 [i - radius, i + radius)
+        pre, post: 拼接在数据前 / 后的光晕长度；返回的下标基于拼接后的数组
+
+    Returns:
+        (lo, hi) 两个长度为 n 的 int 数组
+    """
+    centre = np.arange(n) + pre
+    lo = np.maximum(centre - radius, 0)
+    hi = np.minimum(centre + radius, n + pre + post)
+    return lo, hi
+
+
+def load_halo(path, radius, tail, shape=None, dtype=np.float64):
+    """
+    从相邻切片的帧存储中只读取光晕帧
+
+    Args:
+        path: 相邻切片的 .frames 文件；None 表示没有相邻切片
+        radius: 时间窗口半径 r，最多读取 r 帧
+        tail: True 读取最后 r 帧（下一个切片，补齐起点），False 读取最前 r 帧（上一个切片，补齐终点）
+        shape: 可选，每帧 reshape 的形状，如 (xLength, yLength)
+        dtype: 光晕块的工作精度
+
+    Returns:
+        (k, ...) dtype 光晕块，k = min(r, 切片帧数)；没有相邻切片时为 None
+    """
+    if path is None or radius <= 0:
+        return None
+    store = FrameStore(path)
+    length = min(radius, store.zLength)
+    if tail:
+        halo = store.read(store.zLength - length, store.zLength, dtype=dtype)
+    else:
+        halo = store.read(0, length, dtype=dtype)
+    if shape is not None:
+        halo = halo.reshape((length,) + tuple(shape))
+    return halo
+
+
+def box_sum_axis(a, lo, hi, axis):
+    """
+    沿 axis 的窗口和：第 i 个输出为 a 在 [lo[i], hi[i]) 上的和
+
+    使用前缀和相减，代价与窗口长度无关。
+    """
+    a = np.moveaxis(np.asarray(a, dtype=np.float64), axis, 0)
+    prefix = np.empty((a.shape[0] + 1,) + a.shape[1:], dtype=np.float64)
+    prefix[0] = 0
+    np.cumsum(a, axis=0, out=prefix[1:])
+    return np.moveaxis(prefix[hi] - prefix[lo], 0, axis)
+
+
+def halo_frames(frames, length, tail):
+    """取光晕帧：tail 为 True 时取最后 length 帧，否则取最前 length 帧"""
+    if frames is None or length <= 0:
+        return None
+    length = min(length, len(frames))
+    return frames[len(frames) - length:] if tail else frames[:length]
+
+
+def spatial_counts(a_bounds, b_bounds, mask=None):
+    """
+    每个网格点空间窗口内参与平均的网格数
+
+    Args:
+        a_bounds, b_bounds: 两个空间轴的窗口 (lo, hi)
+        mask: 可选的 (a, b) 有效网格掩膜（布尔或权重）；给出时为窗口内掩膜之和（归一化卷积），
+              窗口内没有有效网格的位置记为 inf，平滑结果为 0
+
+    Returns:
+        (a, b) float64
+    """
+    if mask is None:
+        (a_lo, a_hi), (b_lo, b_hi) = a_bounds, b_bounds
+        return ((a_hi - a_lo)[:, None] * (b_hi - b_lo)[None, :]).astype(np.float64)
+    counts = box_sum_axis(box_sum_axis(mask, *a_bounds, axis=0), *b_bounds, axis=1)
+    counts[counts <= 0] = np.inf
+    return counts
+
+
+# 盒式平滑在一个体数据上的窗口划分：各轴窗口 [lo, hi)、窗口体素数与可选的有效网格权重
+BoxPlan = namedtuple('BoxPlan', ['t_bounds', 'a_bounds', 'b_bounds', 'counts', 't_counts', 'mask'])
+
+
+def box_plan(shape, spatial_radius, temporal_radius, n_pre=0, n_post=0, mask=None):
+    """由体数据形状 (z, a, b)、半径、光晕帧数与可选的 (a, b) 有效网格掩膜计算 BoxPlan"""
+    z, a, b = shape
+    t_lo, t_hi = window_bounds(z, temporal_radius, n_pre, n_post)
+    a_bounds = window_bounds(a, spatial_radius)
+    b_bounds = window_bounds(b, spatial_radius)
+    if mask is not None:
+        mask = np.asarray(mask, dtype=np.float64)
+    return BoxPlan((t_lo, t_hi), a_bounds, b_bounds, spatial_counts(a_bounds, b_bounds, mask),
+                   (t_hi - t_lo).astype(np.float64), mask)
+
+
+def box_temporal_pass(data, pre, post, out, rows, plan):
+    """
+    时间方向：对空间行 rows 拼接光晕后求窗口和，写入 out[:, rows]
+
+    先复制该分块，因此 out 可以与 data 相同；不同行之间互不依赖。
+    """
+    parts = [data[:, rows]]
+    if pre is not None:
+        parts.insert(0, pre[:, rows])
+    if post is not None:
+        parts.append(post[:, rows])
+    block = np.concatenate(parts, axis=0).astype(np.float64, copy=False)
+    if plan.mask is not None:
+        # 归一化卷积：只让有效网格参与求和
+        block *= plan.mask[rows]
+    out[:, rows] = box_sum_axis(block, *plan.t_bounds, axis=0)
+
+
+def box_spatial_pass(out, frames, plan):
+    """
+    空间方向：对帧 frames 求两个空间轴上的窗口和，再除以窗口体素数（原地写回 out）
+
+    需要在所有行的 box_temporal_pass 完成之后调用；不同帧之间互不依赖。
+    """
+    block = box_sum_axis(out[frames], *plan.a_bounds, axis=1)
+    block = box_sum_axis(block, *plan.b_bounds, axis=2)
+    block /= plan.counts
+    block /= plan.t_counts[frames, None, None]
+    out[frames] = block
+
+
+def box_smooth3d(data, spatial_radius, temporal_radius, pre=None, post=None,
+                 out=None, chunk_size=16, mask=None):
+    """
+    三维盒式均值平滑
+
+    Args:
+        data: (z, a, b) 体数据，第 0 轴为时间
+        spatial_radius: 空间窗口半径 s，窗口为 [x - s, x + s)
+        temporal_radius: 时间窗口半径 r，窗口为 [t - r, t + r)
+        pre: 可选，时间起点之前的光晕帧 (k, a, b)，只使用最后 r 帧（原实现中的 next_data）
+        post: 可选，时间终点之后的光晕帧 (k, a, b)，只使用最前 r 帧（原实现中的 prev_data）
+        out: 可选的 (z, a, b) 输出数组，可以就是 data 本身（原地平滑）；
+             默认与 data 同为 float32 / float64（见 float_dtype）
+        chunk_size: 分块大小（时间方向按行分块，空间方向按帧分块）
+        mask: 可选的 (a, b) 有效网格掩膜（如中国境内为 True）。给出时做归一化卷积
+              sum(v * m) / sum(m)：被裁切为 0 的网格不参与平均，海岸附近不会被拉低
+
+    Returns:
+        (z, a, b) 平滑结果
+    """
+    z, a, b = data.shape
+    pre = halo_frames(pre, temporal_radius, tail=True)
+    post = halo_frames(post, temporal_radius, tail=False)
+    plan = box_plan(data.shape, spatial_radius, temporal_radius,
+                    0 if pre is None else len(pre), 0 if post is None else len(post), mask)
+
+    if out is None:
+        out = np.empty((z, a, b), dtype=float_dtype(data))
+
+    for r0 in range(0, a, chunk_size):
+        box_temporal_pass(data, pre, post, out, slice(r0, min(r0 + chunk_size, a)), plan)
+    for f0 in range(0, z, chunk_size):
+        box_spatial_pass(out, slice(f0, min(f0 + chunk_size, z)), plan)
+    return out
+
+
+class StreamingBoxSmoother:
+    """
+    滑动窗口盒式均值（流式）
+
+    逐帧输入一条任意长的时间线，只保留 2r 帧的环形缓冲（每帧已求好空间窗口和）
+    与时间方向的滑动和；第 t 帧的窗口 [t - r, t + r) 完整后立即输出，
+    时间线两端的窗口与 box_smooth3d 一样截断。内存与时间线长度无关。
+
+    滑动和每经过 2r 帧由缓冲区重新求和一次，避免长时间线上加减累积的舍入误差。
+    环形缓冲使用 dtype（float32 时减半），滑动和始终为 float64。
+
+    用法：
+        smoother = StreamingBoxSmoother((a, b), spatial_radius=2, temporal_radius=24)
+        for frame in frames:
+            for t, smoothed in smoother.push(frame):
+                ...
+        for t, smoothed in smoother.finish():
+            ...
+    """
+
+    def __init__(self, frame_shape, spatial_radius, temporal_radius, mask=None, dtype=np.float64):
+        if temporal_radius < 1:
+            raise ValueError("temporal_radius must be at least 1")
+        a, b = frame_shape
+        self.spatial_radius = spatial_radius
+        self.temporal_radius = temporal_radius
+        self.a_bounds = window_bounds(a, spatial_radius)
+        self.b_bounds = window_bounds(b, spatial_radius)
+        # 可选的有效网格掩膜（归一化卷积，同 box_smooth3d 的 mask）
+        self.mask = None if mask is None else np.asarray(mask, dtype=np.float64)
+        self.counts = spatial_counts(self.a_bounds, self.b_bounds, self.mask)
+
+        self.length = 2 * temporal_radius
+        self.dtype = np.dtype(dtype)
+        self.ring = np.zeros((self.length, a, b), dtype=self.dtype)
+        self.total = np.zeros((a, b), dtype=np.float64)
+        self.pushed = 0
+
+    def _spatial_sum(self, frame):
+        if self.mask is not None:
+            frame = frame * self.mask
+        frame = box_sum_axis(frame, *self.a_bounds, axis=0)
+        return box_sum_axis(frame, *self.b_bounds, axis=1)
+
+    def _emit(self, t, lo, hi):
+        return t, (self.total / ((hi - lo) * self.counts)).astype(self.dtype, copy=False)
+
+    def push(self, frame):
+        """
+        输入下一帧
+
+        Returns:
+            窗口已完整的 (t, 平滑后的帧) 列表（最多一帧）
+        """
+        j = self.pushed
+        slot = j % self.length
+        if j >= self.length:
+            self.total -= self.ring[slot]
+        self.ring[slot] = self._spatial_sum(frame)
+        self.total += self.ring[slot]
+        self.pushed += 1
+        if slot == self.length - 1:
+            # 缓冲区恰好就是当前窗口，重新求和消除累积误差
+            np.sum(self.ring, axis=0, dtype=np.float64, out=self.total)
+
+        t = j - self.temporal_radius + 1
+        if t < 0:
+            return []
+        return [self._emit(t, max(0, t - self.temporal_radius), j + 1)]
+
+    def finish(self):
+        """
+        时间线结束：输出剩余窗口在终点被截断的帧
+
+        Returns:
+            (t, 平滑后的帧) 列表
+        """
+        n = self.pushed
+        r = self.temporal_radius
+        lo = max(0, n - self.length)
+        results = []
+        for t in range(max(0, n - r + 1), n):
+            new_lo = max(0, t - r)
+            for k in range(lo, new_lo):
+                self.total -= self.ring[k % self.length]
+            lo = new_lo
+            results.append(self._emit(t, lo, n))
+        return results
+
+
+def stream_box_smooth(frames, spatial_radius, temporal_radius, mask=None, dtype=None):
+    """
+    对帧序列做流式三维盒式均值
+
+    Args:
+        frames: 可迭代的 (a, b) 帧序列（如依次读取的内存映射帧）
+        mask: 可选的 (a, b) 有效网格掩膜（归一化卷积）
+        dtype: 环形缓冲与输出帧的工作精度；None 时跟随第一帧（见 float_dtype）
+
+    Yields:
+        (t, 平滑后的帧)，按时间顺序
+    """
+    smoother = None
+    for frame in frames:
+        if smoother is None:
+            smoother = StreamingBoxSmoother(np.shape(frame), spatial_radius, temporal_radius, mask,
+                                            float_dtype(frame) if dtype is None else dtype)
+        yield from smoother.push(frame)
+    if smoother is not None:
+        yield from smoother.finish()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+多进程并行三维盒式平滑
+用于把 2_Smooth.py 中 box_smooth3d 的计算分散到多个 CPU 核上
+
+原理：
+1. 体数据与光晕帧放在内存映射的共享缓冲区中（优先放在 /dev/shm），worker 按路径映射，
+   任务参数只有分块范围，不会 pickle 任何体数据
+2. 平滑分两个阶段，每个阶段内的分块互不依赖：
+   - 时间方向：按空间行切分，每个 worker 对自己的行沿整条时间轴（含光晕）求窗口和
+   - 空间方向：按时间切分为若干帧块，每个 worker 对自己的帧块求空间窗口和并归一化
+3. 每个分块的计算与 box_smooth3d 中完全相同，结果与单进程逐字节一致
+4. 体数据与光晕缓冲区使用 dtype（float32 时共享内存减半），掩膜缓冲区为 float64
+
+workers <= 1 时直接调用 box_smooth3d。
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+
+from smooth_engine import box_plan, box_smooth3d, box_spatial_pass, box_temporal_pass, halo_frames
+
+# 每个 worker 进程中已映射的共享缓冲区：路径 -> np.memmap
+_worker_buffers = {}
+# 每个 worker 进程中最近一次使用的 BoxPlan
+_worker_plan = (None, None)
+
+
+def _attach(spec):
+    """按 (路径, 形状, 类型) 映射共享缓冲区"""
+    if spec is None:
+        return None
+    path, shape, dtype = spec
+    if path not in _worker_buffers:
+        _worker_buffers[path] = np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+    return _worker_buffers[path]
+
+
+def _run_pass(kind, specs, radii, mask_token, start, stop, chunk_size):
+    """
+    worker 中执行一段分块：kind 为 'temporal'（按行）或 'spatial'（按帧）
+
+    mask_token 标识掩膜内容，掩膜变化时重新计算 BoxPlan
+    """
+    global _worker_plan
+    # 释放之前切片的缓冲区映射
+    current = {spec[0] for spec in specs.values() if spec is not None}
+    for path in list(_worker_buffers):
+        if path not in current:
+            del _worker_buffers[path]
+
+    data, pre, post = _attach(specs['data']), _attach(specs['pre']), _attach(specs['post'])
+    key = (data.shape, radii, 0 if pre is None else len(pre), 0 if post is None else len(post),
+           mask_token)
+    if _worker_plan[0] != key:
+        _worker_plan = (key, box_plan(data.shape, *radii, *key[2:4], mask=_attach(specs['mask'])))
+    plan = _worker_plan[1]
+
+    for c0 in range(start, stop, chunk_size):
+        chunk = slice(c0, min(c0 + chunk_size, stop))
+        if kind == 'temporal':
+            box_temporal_pass(data, pre, post, data, chunk, plan)
+        else:
+            box_spatial_pass(data, chunk, plan)
+
+
+class ParallelBoxSmoother:
+    """
+    多进程三维盒式平滑
+
+    用法：
+        with ParallelBoxSmoother(spatial_radius=2, temporal_radius=24, workers=8) as smoother:
+            volume = smoother.volume((z, a, b))   # 共享工作缓冲区，直接把切片读入其中
+            volume[...] = frame_store.data.reshape(z, a, b)   # 转换为 dtype
+            smoothed = smoother.smooth(volume, pre=next_halo, post=prev_halo)
+    """
+
+    def __init__(self, spatial_radius, temporal_radius, workers=None, chunk_size=16,
+                 tasks_per_worker=4, buffer_dir=None, dtype=np.float64):
+        """
+        Args:
+            spatial_radius, temporal_radius, chunk_size: 同 box_smooth3d
+            workers: worker 进程数；None 表示 CPU 核数，<= 1 表示单进程
+            tasks_per_worker: 每个阶段切分的任务数约为 workers * tasks_per_worker（负载均衡）
+            buffer_dir: 共享缓冲区所在目录；None 时优先使用 /dev/shm
+            dtype: 工作缓冲区（体数据与光晕）的类型，float32 或 float64
+        """
+        self.spatial_radius = spatial_radius
+        self.temporal_radius = temporal_radius
+        self.workers = os.cpu_count() if workers is None else workers
+        self.chunk_size = chunk_size
+        self.tasks_per_worker = tasks_per_worker
+        self.dtype = np.dtype(dtype)
+
+        if buffer_dir is None and os.path.isdir('/dev/shm'):
+            buffer_dir = '/dev/shm'
+        self._dir = tempfile.mkdtemp(prefix='smooth_', dir=buffer_dir)
+        self._buffers = {}
+        self._generation = 0
+        self._executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._buffers = {}
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _buffer(self, name, shape, dtype=None):
+        """取得（必要时重新创建）名为 name 的共享缓冲区（默认类型为 self.dtype）"""
+        shape = tuple(int(n) for n in shape)
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        current = self._buffers.get(name)
+        if current is not None and current[1].shape == shape and current[1].dtype == dtype:
+            return current
+        if current is not None:
+            os.remove(current[0])
+        # 形状变化时换一个文件名，worker 会释放旧的映射
+        self._generation += 1
+        path = os.path.join(self._dir, f'{name}_{self._generation}.buf')
+        self._buffers[name] = (path, np.memmap(path, dtype=dtype, mode='w+', shape=shape))
+        return self._buffers[name]
+
+    def volume(self, shape):
+        """共享工作缓冲区 (z, a, b)，类型为 dtype；smooth 在其中原地计算"""
+        return self._buffer('data', shape)[1]
+
+    def _spec(self, name, array, dtype=None):
+        if array is None:
+            return None
+        path, buffer = self._buffer(name, array.shape, dtype)
+        if array is not buffer:
+            buffer[...] = array
+        return (path, buffer.shape, buffer.dtype.str)
+
+    def smooth(self, data, pre=None, post=None, mask=None):
+        """
+        平滑一段体数据
+
+        Args:
+            data: (z, a, b) 体数据；不是 volume() 返回的缓冲区时会先复制进去
+            pre, post, mask: 同 box_smooth3d
+
+        Returns:
+            (z, a, b) 平滑结果（dtype 共享工作缓冲区，下一次 smooth 之前有效）
+        """
+        pre = halo_frames(pre, self.temporal_radius, tail=True)
+        post = halo_frames(post, self.temporal_radius, tail=False)
+        if self._executor is None:
+            out = self.volume(data.shape)
+            if data is not out:
+                out[...] = data
+            return box_smooth3d(out, self.spatial_radius, self.temporal_radius,
+                                pre=pre, post=post, out=out, chunk_size=self.chunk_size, mask=mask)
+
+        mask_token = None
+        if mask is not None:
+            mask = np.asarray(mask, dtype=np.float64)
+            mask_token = hashlib.sha1(mask.tobytes()).hexdigest()
+        specs = {'data': self._spec('data', data),
+                 'pre': self._spec('pre', pre),
+                 'post': self._spec('post', post),
+                 'mask': self._spec('mask', mask, np.float64)}
+        radii = (self.spatial_radius, self.temporal_radius)
+        z, a, _ = data.shape
+        for kind, length in (('temporal', a), ('spatial', z)):
+            futures = [self._executor.submit(_run_pass, kind, specs, radii, mask_token,
+                                             start, stop, self.chunk_size)
+                       for start, stop in self._slabs(length)]
+            wait(futures)
+            for future in futures:
+                future.result()
+        return self._buffers['data'][1]
+
+    def _slabs(self, length):
+        """把 [0, length) 切分为按 chunk_size 对齐的若干段"""
+        n_chunks = -(-length // self.chunk_size)
+        n_tasks = max(1, min(n_chunks, self.workers * self.tasks_per_worker))
+        bounds = np.linspace(0, n_chunks, n_tasks + 1).round().astype(int) * self.chunk_size
+        return [(int(lo), int(min(hi, length))) for lo, hi in zip(bounds[:-1], bounds[1:]) if lo < hi]
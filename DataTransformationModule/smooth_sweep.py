@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+平滑参数扫描
+用于替代为每组 spatial_window_radius / temporal_window_radius / 边界处理方法
+重新运行一次 2_Smooth.py 与 process_raw_boundary.py 的做法
+
+原理：
+1. 输入切片与光晕帧只读取一次（光晕长度取所有变体中最大的 kernel_halo）
+2. 盒式均值变体共用一张三维累加和表（summed-area table）：任意半径的窗口和都由
+   表中 8 个角点的容斥得到，建表一次后每个变体只需 O(1) / 体素
+3. 归一化卷积（'masked'）变体另用一张乘以掩膜后的累加和表，同样只建一次
+4. 其他平滑核（gaussian / exponential / median）直接在已读入的数据上调用 smooth3d
+5. 每个变体依次做边界处理、裁切，由调用方映射并写出 .raw / .ini
+
+精度：
+    累加和表的数值可达 体素数 x 最大值（一个 552 帧切片约 4e10），容斥相减的舍入误差约
+    eps * 4e10 ≈ 1e-5（窗口和），除以窗口体素数后与 box_smooth3d 的差异小于 1e-7，
+    映射到 uint8 后只有恰好落在 .5 舍入边界附近的体素可能相差 1。
+    因此累加和表始终为 float64（float32 的 ulp 在 4e10 处约为 4000），
+    只有输出跟随输入数据的工作类型（float32 / float64）。
+"""
+
+from collections import namedtuple
+from itertools import product
+
+import numpy as np
+
+from boundary_handler import apply_improved_boundary_handling
+from region_mask import apply_region_mask
+from smooth_engine import float_dtype, spatial_counts, window_bounds
+from smooth_kernels import KERNELS, kernel_halo, smooth3d
+
+# 'none'：只裁切；'masked'：归一化卷积平滑后裁切；其余为 boundary_handler 中的边界处理方法
+BOUNDARY_METHODS = ('none', 'masked', 'neumann', 'gaussian', 'reflect', 'selective',
+                    'coastline', 'coastline_gaussian')
+
+# 一个扫描变体：平滑核、空间 / 时间尺度与边界处理方法
+Variant = namedtuple('Variant', ['kernel', 'spatial_scale', 'temporal_scale', 'boundary_method'])
+
+
+def sweep_variants(kernels, spatial_scales, temporal_scales, boundary_methods):
+    """所有参数组合"""
+    for kernel in kernels:
+        if kernel not in KERNELS:
+            raise ValueError(f"Unknown kernel: {kernel}")
+    for method in boundary_methods:
+        if method not in BOUNDARY_METHODS:
+            raise ValueError(f"Unknown boundary method: {method}")
+    return [Variant(*combination) for combination in
+            product(kernels, spatial_scales, temporal_scales, boundary_methods)]
+
+
+def sweep_halo(variants):
+    """所有变体需要的最大光晕帧数"""
+    return max((kernel_halo(v.kernel, v.temporal_scale) for v in variants), default=0)
+
+
+class BoxSumTable:
+    """
+    三维累加和表
+
+    table[t, x, y] 为拼接光晕后的体数据在 [0, t) x [0, x) x [0, y) 上的和，
+    任意盒式窗口和由 8 个角点容斥得到。
+    """
+
+    def __init__(self, data, pre=None, post=None, mask=None, chunk_size=16):
+        """
+        Args:
+            data: (z, a, b) 体数据
+            pre, post: 可选的光晕帧（同 box_smooth3d，全部使用）
+            mask: 可选的 (a, b) 有效网格掩膜；给出时对 v * m 建表（归一化卷积）
+        """
+        z, a, b = data.shape
+        self.shape = (z, a, b)
+        self.dtype = float_dtype(data)
+        self.n_pre = 0 if pre is None else len(pre)
+        self.n_post = 0 if post is None else len(post)
+        self.mask = None if mask is None else np.asarray(mask, dtype=np.float64)
+
+        length = self.n_pre + z + self.n_post
+        self.table = np.zeros((length + 1, a + 1, b + 1), dtype=np.float64)
+        start = 1
+        for part in (pre, data, post):
+            if part is None:
+                continue
+            target = self.table[start:start + len(part), 1:, 1:]
+            target[...] = part
+            if self.mask is not None:
+                target *= self.mask
+            start += len(part)
+
+        # 沿两个空间轴按帧分块累加，再沿时间轴逐帧累加，避免整张表的临时副本
+        for f0 in range(1, length + 1, chunk_size):
+            block = self.table[f0:f0 + chunk_size]
+            np.cumsum(block, axis=1, out=block)
+            np.cumsum(block, axis=2, out=block)
+        for t in range(1, length + 1):
+            self.table[t] += self.table[t - 1]
+
+    def box_mean(self, spatial_radius, temporal_radius, chunk_size=16):
+        """
+        盒式均值，窗口与 box_smooth3d 相同（[t - r, t + r) x [x - s, x + s) x [y - s, y + s)，边缘截断）
+
+        Returns:
+            (z, a, b)，类型同输入数据
+        """
+        z, a, b = self.shape
+        t_lo, t_hi = window_bounds(z, temporal_radius, self.n_pre, self.n_post)
+        a_lo, a_hi = a_bounds = window_bounds(a, spatial_radius)
+        b_lo, b_hi = b_bounds = window_bounds(b, spatial_radius)
+        counts = spatial_counts(a_bounds, b_bounds, self.mask)
+        t_counts = (t_hi - t_lo).astype(np.float64)
+
+        out = np.empty((z, a, b), dtype=self.dtype)
+        for f0 in range(0, z, chunk_size):
+            frames = slice(f0, min(f0 + chunk_size, z))
+            block = self.table[t_hi[frames]] - self.table[t_lo[frames]]
+            block = block[:, a_hi] - block[:, a_lo]
+            block = block[:, :, b_hi] - block[:, :, b_lo]
+            block /= counts
+            block /= t_counts[frames, None, None]
+            out[frames] = block
+        return out
+
+
+class SmoothSweep:
+    """
+    在同一份输入上计算多个平滑变体
+
+    用法：
+        sweep = SmoothSweep(data, pre=next_halo, post=prev_halo, mask=china_mask_2d)
+        for variant in variants:
+            volume = sweep.smooth(variant)
+            sweep.finish(volume, variant)
+    """
+
+    def __init__(self, data, pre=None, post=None, mask=None):
+        """
+        Args:
+            data: (z, a, b) 体数据（只读，不会被修改）
+            pre, post: 光晕帧，长度至少为 sweep_halo(variants)
+            mask: (a, b) 布尔掩膜，True 为中国境内（用于裁切与归一化卷积）
+        """
+        self.data = data
+        self.pre = pre
+        self.post = post
+        self.mask = mask
+        self._tables = {}
+
+    def table(self, masked):
+        """盒式均值变体共用的累加和表（首次使用时建立）"""
+        if masked not in self._tables:
+            self._tables[masked] = BoxSumTable(self.data, self.pre, self.post,
+                                               mask=self.mask if masked else None)
+        return self._tables[masked]
+
+    def smooth(self, variant):
+        """计算一个变体的平滑结果（新数组）"""
+        masked = variant.boundary_method == 'masked'
+        if variant.kernel == 'box':
+            return self.table(masked).box_mean(variant.spatial_scale, variant.temporal_scale)
+        return smooth3d(self.data, variant.kernel, variant.spatial_scale, variant.temporal_scale,
+                        pre=self.pre, post=self.post, mask=self.mask if masked else None)
+
+    def finish(self, volume, variant, clipping_value=0.0):
+        """边界处理与裁切（境外网格设为 clipping_value），在 volume 中原地进行"""
+        if variant.boundary_method in ('none', 'masked'):
+            return apply_region_mask(volume, self.mask, clipping_value)
+        return apply_improved_boundary_handling(volume, ~self.mask, method=variant.boundary_method,
+                                                boundary_width=3, clipping_value=clipping_value, out=volume)
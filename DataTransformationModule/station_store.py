@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+站点时间序列的列式存储
+用于替代 exampleData/data_merged 中每小时一个的 LOC_AQI_{i}.csv（共 8,472 个）
+
+原理：
+1. locations.json 与 timeseriesdata.json 按 rid 一次性向量化对齐，
+   得到 (时间, 站点) 的观测矩阵与站点坐标
+2. 矩阵按时间优先（每个时刻的所有站点连续存放）写入单个二进制文件，
+   读取任意一段时间只是内存映射上的一次切片
+3. 站点坐标（lng / lat / rid）保存在文件头中，与观测值的列顺序一一对应
+
+文件格式（.stations）：
+    magic      4 字节  b'VRSS'
+    header_len 4 字节  小端 uint32
+    header     UTF-8 JSON：nTimes / nStations / dtype / lng / lat / rid / dataOffset
+    data       (nTimes, nStations) 的 C 顺序数组，NaN 表示缺测
+"""
+
+import numpy as np
+import pandas as pd
+
+from frame_store import _encode_header, read_header
+
+MAGIC = b'VRSS'
+
+
+def merge_station_data(locations_path, timeseries_path):
+    """
+    合并站点位置与观测时间序列
+
+    Args:
+        locations_path: 站点位置 JSON（每个站点含 lat / lng / rid）
+        timeseries_path: 观测值 JSON（pd.read_json 后以 rid 为列、时间为行）
+
+    Returns:
+        (values, lng, lat, rid)：values 为 (nTimes, nStations) 的 float64 矩阵，
+        列顺序与 locations.json 中的站点顺序一致；没有观测的站点为 NaN
+    """
+    locations = pd.read_json(locations_path)
+    timeseries = pd.read_json(timeseries_path)
+
+    rid = locations['rid'].to_numpy(dtype=np.int64)
+    lng = locations['lng'].to_numpy(dtype=np.float64)
+    lat = locations['lat'].to_numpy(dtype=np.float64)
+
+    # 与原来逐时刻 valueData[index:index+1].loc[:, [rid]] 取值相同：按行位置取时刻、按 rid 取列，
+    # 这里一次按 rid 重排所有列
+    timeseries.columns = [int(c) for c in timeseries.columns]
+    values = timeseries.reindex(columns=rid).to_numpy(dtype=np.float64)
+    return values, lng, lat, rid
+
+
+def write_station_store(path, values, lng, lat, rid, dtype=np.float64, **header):
+    """
+    写出站点时间序列
+
+    Args:
+        values: (nTimes, nStations) 观测值
+        lng, lat, rid: 每个站点的经纬度（EPSG:4326）与编号
+    """
+    values = np.asarray(values)
+    dtype = np.dtype(dtype).newbyteorder('<')
+    header = dict(header,
+                  format='station_store',
+                  version=1,
+                  nTimes=int(values.shape[0]),
+                  nStations=int(values.shape[1]),
+                  dtype=dtype.str,
+                  lng=[float(v) for v in lng],
+                  lat=[float(v) for v in lat],
+                  rid=[int(v) for v in rid])
+    encoded, header = _encode_header(header, magic=MAGIC)
+    with open(path, 'wb') as f:
+        f.write(encoded)
+        f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+    return path
+
+
+class StationStore:
+    """
+    只读的站点时间序列（内存映射）
+
+    用法：
+        store = StationStore(path)
+        store.lng, store.lat         # 站点坐标
+        store.window(0, 552)         # (552, nStations) 的观测值
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.header = read_header(path, magic=MAGIC)
+        self.dtype = np.dtype(self.header['dtype'])
+        self.shape = (self.header['nTimes'], self.header['nStations'])
+        self.lng = np.array(self.header['lng'], dtype=np.float64)
+        self.lat = np.array(self.header['lat'], dtype=np.float64)
+        self.rid = np.array(self.header['rid'], dtype=np.int64)
+        self.values = np.memmap(path, dtype=self.dtype, mode='r',
+                                offset=self.header['dataOffset'], shape=self.shape)
+
+    @property
+    def nTimes(self):
+        return self.shape[0]
+
+    @property
+    def nStations(self):
+        return self.shape[1]
+
+    def window(self, start=0, stop=None, dtype=np.float64):
+        """把 [start, stop) 时间段的观测值读入内存"""
+        return np.array(self.values[start:stop], dtype=dtype)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+时间汇总（roll-up）模块
+把 UnityRawData 中按小时的切片体数据汇总为按天 / 按周等时间步长的均值、最大值、最小值体数据，
+不需要把 8 个 552 帧的切片全部读入内存
+
+原理：
+1. 各切片的 .raw 按内存映射分块读取，整条时间线只读一遍；码值由 .ini 中的映射参数
+   （quantize.mapping_from_ini）还原为数值，被裁切的网格（code_zero）视为空值
+2. 切片内的帧按时间倒序存放（1_KrigingInterpolation.py 中为适配 Unity 坐标系反转了时间），
+   因此按切片从晚到早、切片内按文件顺序读取，就是一条从晚到早的连续时间线
+3. 第 h 小时（从整条时间线的起点计）属于第 h // stride 个窗口；每个步长维护一组单帧大小的
+   累加器（和、非空计数、最大值、最小值），窗口编号变化时输出上一个窗口并清零。
+   累加器跨切片保留，跨越切片边界的窗口（如 552 不是 168 的整数倍）与切片内的窗口一样处理；
+   时间线末尾不满一个步长的窗口按实际包含的小时汇总
+4. 输出窗口按从晚到早的顺序逐帧写出，与切片的时间倒序一致；
+   结果用与输入相同的映射重新量化，码值可以直接对比
+"""
+
+import os
+from contextlib import ExitStack
+
+import numpy as np
+
+from quantize import dequantize_chunk, mapping_from_ini, quantize_chunk
+from volume_io import RawVolumeWriter, open_volume
+
+ROLLUP_STATS = ('mean', 'max', 'min')
+
+
+class WindowAccumulator:
+    """
+    一个时间步长的单帧累加器
+
+    Args:
+        frame_size: 每帧的网格数
+        stats: 需要的统计量（'mean' / 'max' / 'min' 的子集）
+    """
+
+    def __init__(self, frame_size, stats=ROLLUP_STATS):
+        self.stats = tuple(stats)
+        self.total = np.zeros(frame_size, dtype=np.float64)
+        self.count = np.zeros(frame_size, dtype=np.int64)
+        self.maximum = np.full(frame_size, -np.inf)
+        self.minimum = np.full(frame_size, np.inf)
+        self.window = None
+
+    def add(self, values, valid):
+        """
+        累加同一窗口内的若干帧
+
+        Args:
+            values: (k, frame_size) 数值
+            valid: (k, frame_size) 非空掩膜
+        """
+        self.count += valid.sum(axis=0)
+        if 'mean' in self.stats:
+            self.total += np.where(valid, values, 0).sum(axis=0)
+        if 'max' in self.stats:
+            np.maximum(self.maximum, np.where(valid, values, -np.inf).max(axis=0), out=self.maximum)
+        if 'min' in self.stats:
+            np.minimum(self.minimum, np.where(valid, values, np.inf).min(axis=0), out=self.minimum)
+
+    def finish(self):
+        """
+        当前窗口的结果并清零
+
+        Returns:
+            {统计量: 单帧数值}，没有非空值的网格为 0（量化为 code_zero）
+        """
+        empty = self.count == 0
+        results = {}
+        for stat in self.stats:
+            if stat == 'mean':
+                values = self.total / np.maximum(self.count, 1)
+            else:
+                values = (self.maximum if stat == 'max' else self.minimum).copy()
+            values[empty] = 0
+            results[stat] = values
+        self.total[:] = 0
+        self.count[:] = 0
+        self.maximum[:] = -np.inf
+        self.minimum[:] = np.inf
+        return results
+
+
+def rollup_name(prefix, stride, stat):
+    """输出文件名：{prefix}_rollup_{stride}h_{stat}.raw"""
+    return f'{prefix}_rollup_{stride}h_{stat}.raw'
+
+
+def temporal_rollup(ini_paths, out_dir, prefix, strides=(24, 168), stats=ROLLUP_STATS,
+                    chunk_frames=24):
+    """
+    一遍读取所有切片，写出每个 (步长, 统计量) 的汇总体数据
+
+    Args:
+        ini_paths: 各切片的 .ini，按时间从早到晚排列；每个切片内的帧按时间倒序存放
+        out_dir: 输出目录
+        prefix: 输出文件名前缀
+        strides: 时间步长（小时），如 24（天）与 168（周）
+        stats: 'mean' / 'max' / 'min' 的子集
+        chunk_frames: 每次读取的帧数
+
+    Returns:
+        {(stride, stat): 输出 .raw 路径}
+    """
+    for stat in stats:
+        if stat not in ROLLUP_STATS:
+            raise ValueError(f"Unknown rollup stat: {stat}")
+    volumes = [open_volume(path) for path in ini_paths]
+    dimx, dimy, _ = volumes[0].dims
+    for volume in volumes:
+        if volume.dims[:2] != (dimx, dimy) or volume.format != volumes[0].format:
+            raise ValueError(f"{volume.ini_path}: dims / format differ from {volumes[0].ini_path}")
+    mapping = mapping_from_ini(volumes[0].params)
+    frame_size = dimx * dimy
+
+    # 每个切片第一个小时在整条时间线上的位置
+    starts = np.cumsum([0] + [volume.shape[0] for volume in volumes])
+    hours = int(starts[-1])
+
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    extra = {key: value for key, value in mapping._asdict().items() if key != 'format'}
+    paths = {}
+    with ExitStack() as stack:
+        writers = {}
+        for stride in strides:
+            windows = -(-hours // stride)
+            for stat in stats:
+                raw_path = os.path.join(out_dir, rollup_name(prefix, stride, stat))
+                writers[(stride, stat)] = stack.enter_context(
+                    RawVolumeWriter(raw_path, (dimx, dimy, windows), mapping.format, extra=extra))
+                paths[(stride, stat)] = raw_path
+        accumulators = {stride: WindowAccumulator(frame_size, stats) for stride in strides}
+        codes_out = np.empty(frame_size, dtype=mapping.format)
+
+        def emit(stride):
+            for stat, values in accumulators[stride].finish().items():
+                writers[(stride, stat)].write(quantize_chunk(values, mapping, codes_out))
+
+        values = np.empty(chunk_frames * frame_size, dtype=np.float64)
+        # 从最晚的切片开始，切片内按文件顺序（时间倒序）读取
+        for index in reversed(range(len(volumes))):
+            volume = volumes[index]
+            depth = volume.shape[0]
+            for f0 in range(0, depth, chunk_frames):
+                f1 = min(f0 + chunk_frames, depth)
+                codes = volume.read((slice(f0, f1),)).reshape(-1)
+                chunk_values = dequantize_chunk(codes, mapping, values[:codes.size]).reshape(f1 - f0, frame_size)
+                chunk_valid = (codes != mapping.code_zero).reshape(f1 - f0, frame_size)
+                # 文件第 f 帧对应第 starts[index] + depth - 1 - f 小时
+                chunk_hours = starts[index] + depth - 1 - np.arange(f0, f1)
+                for stride, accumulator in accumulators.items():
+                    windows = chunk_hours // stride
+                    # 窗口编号单调递减，按编号分组累加
+                    for window in np.unique(windows)[::-1]:
+                        if accumulator.window is not None and accumulator.window != window:
+                            emit(stride)
+                        accumulator.window = window
+                        group = windows == window
+                        accumulator.add(chunk_values[group], chunk_valid[group])
+        for stride in strides:
+            if accumulators[stride].window is not None:
+                emit(stride)
+    return paths
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+流式裁剪模块
+用于替代 4_CropVolume.py、6_FitToScene.py、7_PerfectCrop.py 中读入整个 RAW 文件、
+切片后再整块写出的裁剪方式
+
+原理：
+1. 裁剪范围（CropBox）与数据读取分开计算：
+   - explicit_box：按 {'x': (start, end), ...} 配置给出
+   - fit_box：按 Unity 场景的水平比例 (X / Z) 中心裁剪 x 或 y（6_FitToScene 的规则）
+   - perfect_box：按 Unity 场景的 X : Z : Y 比例中心裁剪三个轴（7_PerfectCrop 的规则）
+   - tight_box：分块扫描一遍，取非空（!= empty_value）体素的外包框
+2. stream_crop 从内存映射的源数据中按 z 方向分块，每块只切出选中的 z 帧与 y 行
+   （可带降采样步长），立即追加写入输出文件；每块不超过 chunk_bytes，
+   内存占用与源数据大小无关，吞吐量受限于磁盘带宽
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from volume_io import RawVolumeWriter
+
+# 半开区间 [z0, z1) x [y0, y1) x [x0, x1)，numpy 轴顺序 (z, y, x)
+CropBox = namedtuple('CropBox', ['z0', 'z1', 'y0', 'y1', 'x0', 'x1'])
+
+
+def box_slices(box, step=1):
+    """CropBox -> (z, y, x) 的切片元组"""
+    return (slice(box.z0, box.z1, step), slice(box.y0, box.y1, step), slice(box.x0, box.x1, step))
+
+
+def box_shape(box, step=1):
+    """裁剪（并按 step 降采样）后的形状 (z, y, x)"""
+    return tuple(len(range(0, hi - lo, step)) for lo, hi in
+                 ((box.z0, box.z1), (box.y0, box.y1), (box.x0, box.x1)))
+
+
+def explicit_box(shape, crop_config):
+    """
+    按配置裁剪
+
+    start / end 的含义与 numpy 切片相同：负数从末尾计，超出范围时截断到 [0, 维度]，
+    end 不大于 start 时该轴为空
+
+    Args:
+        shape: 源数据形状 (z, y, x)
+        crop_config: {'x': (start, end), 'y': ..., 'z': ...}，end 为 None 表示取到最后
+    """
+    bounds = []
+    for axis, n in zip(('z', 'y', 'x'), shape):
+        start, stop, _ = slice(*crop_config[axis]).indices(n)
+        bounds += [start, max(start, stop)]
+    return CropBox(*bounds)
+
+
+def fit_box(shape, unity_size):
+    """
+    按 Unity 场景的水平比例中心裁剪（z 不变）
+
+    Args:
+        shape: 源数据形状 (z, y, x)
+        unity_size: Unity 场景尺寸 (X, Y=高, Z)；数据 x 对应 Unity X，数据 y 对应 Unity Z
+    """
+    depth, height, width = shape
+    u_x, u_y, u_z = unity_size
+    target_ratio = u_x / u_z
+    if width / height > target_ratio:
+        # 数据太宽，裁掉 X 轴两边
+        new_width = int(height * target_ratio)
+        start_x = (width - new_width) // 2
+        return CropBox(0, depth, 0, height, start_x, start_x + new_width)
+    # 数据太长，裁掉 Y 轴两边
+    new_height = int(width / target_ratio)
+    start_y = (height - new_height) // 2
+    return CropBox(0, depth, start_y, start_y + new_height, 0, width)
+
+
+def perfect_box(shape, unity_size):
+    """
+    按 Unity 场景的 X : Z : Y 比例中心裁剪三个轴
+
+    以数据 z（对应 Unity Y）为基准；超出源数据范围时取能满足比例的最大尺寸。
+    """
+    raw_d, raw_h, raw_w = shape
+    u_x, u_y, u_z = unity_size
+    ratio_x = u_x / u_y
+    ratio_z = u_z / u_y
+
+    target_x = int(raw_d * ratio_x)
+    target_y = int(raw_d * ratio_z)
+    target_z = raw_d
+    if target_x > raw_w or target_y > raw_h:
+        scale = min(raw_w / ratio_x, raw_h / ratio_z, raw_d / 1.0)
+        target_x = int(scale * ratio_x)
+        target_y = int(scale * ratio_z)
+        target_z = int(scale)
+
+    start_z = (raw_d - target_z) // 2
+    start_y = (raw_h - target_y) // 2
+    start_x = (raw_w - target_x) // 2
+    return CropBox(start_z, start_z + target_z, start_y, start_y + target_y, start_x, start_x + target_x)
+
+
+def _chunk_frames(frame_elements, itemsize, chunk_bytes):
+    return max(1, chunk_bytes // max(frame_elements * itemsize, 1))
+
+
+def tight_box(volume, empty_value=0, chunk_bytes=1 << 26):
+    """
+    非空体素的外包框（按 z 分块扫描，每块不超过 chunk_bytes）
+
+    Args:
+        volume: (z, y, x) 数组或内存映射
+
+    Returns:
+        CropBox；全部为空时返回 None
+    """
+    depth, height, width = volume.shape
+    z_any = np.zeros(depth, dtype=bool)
+    y_any = np.zeros(height, dtype=bool)
+    x_any = np.zeros(width, dtype=bool)
+    frames = _chunk_frames(height * width, volume.dtype.itemsize, chunk_bytes)
+    for z0 in range(0, depth, frames):
+        filled = volume[z0:z0 + frames] != empty_value
+        z_any[z0:z0 + frames] = filled.any(axis=(1, 2))
+        y_any |= filled.any(axis=(0, 2))
+        x_any |= filled.any(axis=(0, 1))
+    if not z_any.any():
+        return None
+    bounds = []
+    for present in (z_any, y_any, x_any):
+        index = np.flatnonzero(present)
+        bounds += [int(index[0]), int(index[-1]) + 1]
+    return CropBox(*bounds)
+
+
+def stream_crop(source, box, raw_path, step=1, fmt=None, chunk_bytes=1 << 26):
+    """
+    从源数据中流式裁剪并写出 .raw / .ini
+
+    Args:
+        source: volume_io.RawVolume
+        box: CropBox
+        raw_path: 输出 .raw 路径
+        step: 三个轴的降采样步长
+        fmt: 输出格式，默认与源数据相同
+        chunk_bytes: 每块输出数据的大小上限
+
+    Returns:
+        输出形状 (z, y, x)
+    """
+    shape = box_shape(box, step)
+    depth, height, width = shape
+    if min(shape) <= 0:
+        raise ValueError(f"Empty crop box: {box}")
+    _, rows, columns = box_slices(box, step)
+    fmt = source.format if fmt is None else fmt
+    frames = _chunk_frames(height * width, source.dtype.itemsize, chunk_bytes)
+    with RawVolumeWriter(raw_path, (width, height, depth), fmt, source.endianness) as writer:
+        for k0 in range(0, depth, frames):
+            z0 = box.z0 + k0 * step
+            z1 = min(box.z0 + (k0 + frames) * step, box.z1)
+            writer.write(source.data[z0:z1:step, rows, columns])
+    return shape
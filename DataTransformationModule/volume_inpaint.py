@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+空值补全（inpainting）模块
+用于替代 8_FillAndCrop.py 中对整个三维体调用
+ndimage.distance_transform_edt(..., return_indices=True) 的做法：
+它会分配 3 倍体素数的 int64 索引（uint8 数据约为每个体素 24 字节），大网格上内存不足
+
+原理：
+1. 先分块扫描一遍，判断空值掩膜（== empty_value）是否沿某个轴不变
+   （如陆地掩膜不随时间变化）。若不变，最近的有效体素一定在同一条沿该轴的直线上，
+   只需对一个二维截面计算一次最近索引（int32），再沿该轴广播
+2. 否则按 z 方向 tile_size 帧的平板、平板内 tile_size x tile_size 的块处理：
+   每块向外扩展 halo 个体素后计算 int32 最近索引；块内最近距离不超过 halo 的体素，
+   扩展区域之外不可能有更近的有效体素，结果是精确的；否则 halo 加倍重算该块
+3. 数据从内存映射中按需读取，补全结果按 z 方向逐块写出，内存占用取决于块大小，与体数据大小无关；
+   掩膜沿 y 或 x 不变时来源帧可能在 z 方向很远，按来源帧逐帧读取
+4. method='diffusion' 时，以最近值为初值，在每帧的 (y, x) 平面内对空值体素做 Jacobi 迭代
+   （取上下左右四邻域的均值，有效体素不变），得到平滑过渡而不是最近值的分块台阶
+
+注意：与有效体素等距的空值体素，分块 / 广播时选中的有效体素可能与整体计算不同（距离相同）。
+"""
+
+import numpy as np
+from scipy import ndimage
+
+from volume_io import RawVolumeWriter
+
+INPAINT_METHODS = ('nearest', 'diffusion')
+
+
+def _chunk_frames(frame_elements, itemsize, chunk_bytes):
+    return max(1, chunk_bytes // max(frame_elements * itemsize, 1))
+
+
+def constant_axis(volume, empty_value=0, chunk_bytes=1 << 26):
+    """
+    分块扫描，找出空值掩膜不变的轴
+
+    Args:
+        volume: (z, y, x) 数组或内存映射
+
+    Returns:
+        (axis, empty_count)：axis 为 0 / 1 / 2（优先 z），都在变化时为 None；
+        empty_count 为空值体素数
+    """
+    depth, height, width = volume.shape
+    frames = _chunk_frames(height * width, volume.dtype.itemsize, chunk_bytes)
+    first = np.asarray(volume[0]) == empty_value
+    constant = [True, True, True]
+    empty_count = 0
+    for z0 in range(0, depth, frames):
+        empty = np.asarray(volume[z0:z0 + frames]) == empty_value
+        empty_count += int(np.count_nonzero(empty))
+        constant[0] = constant[0] and bool((empty == first).all())
+        constant[1] = constant[1] and bool((empty == empty[:, :1, :]).all())
+        constant[2] = constant[2] and bool((empty == empty[:, :, :1]).all())
+    axis = next((axis for axis in range(3) if constant[axis]), None)
+    return axis, empty_count
+
+
+def nearest_indices(empty):
+    """
+    每个体素最近的非空体素的 int32 索引（scipy 的 EDT 特征变换）
+
+    Returns:
+        (empty.ndim,) + empty.shape 的 int32 数组；没有非空体素时为 None
+    """
+    if empty.all():
+        return None
+    indices = np.empty((empty.ndim,) + empty.shape, dtype=np.int32)
+    ndimage.distance_transform_edt(empty, return_distances=False, return_indices=True, indices=indices)
+    return indices
+
+
+def _broadcast_chunks(volume, axis, empty_value, chunk_bytes):
+    """掩膜沿 axis 不变：二维截面的最近索引沿 axis 广播，产生 (z0, z1, 补全块, 空值掩膜)"""
+    depth, height, width = volume.shape
+    frames = _chunk_frames(height * width, volume.dtype.itemsize, chunk_bytes)
+    plane = np.asarray(volume[(slice(None),) * axis + (0,)]) == empty_value
+    first, second = nearest_indices(plane)
+    for z0 in range(0, depth, frames):
+        z1 = min(z0 + frames, depth)
+        values = np.asarray(volume[z0:z1])
+        if axis == 0:
+            # 截面为 (y, x)
+            filled = values[:, first, second]
+        else:
+            # 截面为 (z, x) 或 (z, y)：按来源帧分组，每次只读取一帧，
+            # 来源帧离本块很远（如开头连续的空帧）时也不会读入整段 z 范围
+            source_z, source_other = first[z0:z1], second[z0:z1]
+            filled = np.empty(values.shape, dtype=values.dtype)
+            for z in np.unique(source_z):
+                frame = values[z - z0] if z0 <= z < z1 else np.asarray(volume[z])
+                k, other = np.nonzero(source_z == z)
+                if axis == 1:
+                    filled[k, :, other] = frame[:, source_other[k, other]].T
+                else:
+                    filled[k, other, :] = frame[source_other[k, other], :]
+        yield z0, z1, filled, values == empty_value
+
+
+def _fill_tile(volume, core, empty_value, halo):
+    """
+    补全一个块：扩展 halo 后计算最近索引，块内有体素的最近距离超过 halo 时 halo 加倍重算
+
+    Args:
+        core: 块的 (z, y, x) 切片元组
+    """
+    shape = volume.shape
+    values = np.asarray(volume[core])
+    empty = values == empty_value
+    if not empty.any():
+        return values
+    while True:
+        outer = tuple(slice(max(s.start - halo, 0), min(s.stop + halo, n)) for s, n in zip(core, shape))
+        whole = all(o.start == 0 and o.stop == n for o, n in zip(outer, shape))
+        source = np.asarray(volume[outer])
+        indices = nearest_indices(source == empty_value)
+        if indices is not None:
+            # 块内体素在扩展区域中的坐标与其最近索引
+            inner = tuple(slice(s.start - o.start, s.stop - o.start) for s, o in zip(core, outer))
+            nearest = indices[(slice(None),) + inner]
+            if whole:
+                break
+            grid = np.indices(values.shape, dtype=np.int32)
+            offsets = np.array([i.start for i in inner], dtype=np.int32).reshape(3, 1, 1, 1)
+            distance2 = ((nearest - grid - offsets) ** 2).sum(axis=0)
+            if distance2[empty].max() <= halo * halo:
+                break
+        elif whole:
+            raise ValueError("No non-empty voxel to fill from")
+        halo *= 2
+    filled = values.copy()
+    filled[empty] = source[tuple(axis_index[empty] for axis_index in nearest)]
+    return filled
+
+
+def _tiled_chunks(volume, empty_value, tile_size, halo):
+    """掩膜在变化：按 tile_size 帧的平板分块补全，产生 (z0, z1, 补全块, 空值掩膜)"""
+    depth, height, width = volume.shape
+    for z0 in range(0, depth, tile_size):
+        z1 = min(z0 + tile_size, depth)
+        values = np.asarray(volume[z0:z1])
+        filled = np.empty(values.shape, dtype=values.dtype)
+        for y0 in range(0, height, tile_size):
+            for x0 in range(0, width, tile_size):
+                core = (slice(z0, z1), slice(y0, min(y0 + tile_size, height)), slice(x0, min(x0 + tile_size, width)))
+                filled[:, core[1], core[2]] = _fill_tile(volume, core, empty_value, halo)
+        yield z0, z1, filled, values == empty_value
+
+
+def diffuse_frames(filled, empty, iterations=100):
+    """
+    在每帧的 (y, x) 平面内对空值体素做 Jacobi 扩散（四邻域均值，边缘按复制延拓）
+
+    逐帧迭代，临时数组只有单帧大小。
+
+    Args:
+        filled: (k, y, x) 初值（最近值补全的结果）
+        empty: (k, y, x) 空值掩膜，只有这些体素会被更新
+        iterations: 迭代次数
+
+    Returns:
+        与 filled 同类型的数组，整数格式四舍五入
+    """
+    result = filled.copy()
+    for k in range(filled.shape[0]):
+        mask = empty[k]
+        if not mask.any():
+            continue
+        work = filled[k].astype(np.float32)
+        for _ in range(iterations):
+            padded = np.pad(work, 1, mode='edge')
+            average = (padded[:-2, 1:-1] + padded[2:, 1:-1] + padded[1:-1, :-2] + padded[1:-1, 2:]) * 0.25
+            work[mask] = average[mask]
+        if np.issubdtype(filled.dtype, np.integer):
+            np.rint(work, out=work)
+        result[k] = work
+    return result
+
+
+def inpaint_volume(volume, raw_path, method='nearest', empty_value=0, fmt=None, endianness='littleendian',
+                   tile_size=64, halo=16, iterations=100, chunk_bytes=1 << 26):
+    """
+    补全空值并流式写出 .raw / .ini
+
+    Args:
+        volume: (z, y, x) 数组或内存映射（如 RawVolume.data 的裁剪视图）
+        raw_path: 输出 .raw 路径
+        method: 'nearest'（最近的有效值）或 'diffusion'（最近值 + 平面内扩散）
+        empty_value: 需要补全的空值
+        fmt: 输出格式，默认取 volume 的类型名
+        tile_size: 掩膜变化时块的边长
+        halo: 块向外扩展的初始体素数
+        iterations: diffusion 的迭代次数
+        chunk_bytes: 掩膜不变时每次读取的数据大小上限
+
+    Returns:
+        {'axis': 掩膜不变的轴（None 为分块处理）, 'empty': 补全的体素数}
+    """
+    if method not in INPAINT_METHODS:
+        raise ValueError(f"Unknown inpaint method: {method}")
+    depth, height, width = volume.shape
+    fmt = volume.dtype.name if fmt is None else fmt
+    axis, empty_count = constant_axis(volume, empty_value, chunk_bytes)
+    if empty_count == volume.size:
+        raise ValueError("No non-empty voxel to fill from")
+    if axis is not None:
+        chunks = _broadcast_chunks(volume, axis, empty_value, chunk_bytes)
+    else:
+        chunks = _tiled_chunks(volume, empty_value, tile_size, halo)
+    with RawVolumeWriter(raw_path, (width, height, depth), fmt, endianness) as writer:
+        for _, _, filled, empty in chunks:
+            if method == 'diffusion':
+                filled = diffuse_frames(filled, empty, iterations)
+            writer.write(filled)
+    return {'axis': axis, 'empty': empty_count}
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+RAW 体数据读写模块
+用于替代 4_CropVolume.py、6_FitToScene.py、7_PerfectCrop.py、8_FillAndCrop.py、
+check_data_format.py、process_raw_boundary.py、diagnose_boundary.py 中
+各自解析 .ini、再用 np.fromfile 读入整个 RAW 文件的做法
+
+原理：
+1. .ini 的解析与 Unity 的 DatasetIniReader 一致：dimx / dimy / dimz / skip / format / endianness，
+   其余字段（如量化映射参数）原样保留
+2. 轴顺序与 Unity 一致：文件按 x 最快、z 最慢排列，numpy 视图为 (dimz, dimy, dimx)
+   （diagnose_boundary.py 与 process_raw_boundary.py 原来按 (x, y, z) reshape，轴是错的）
+3. RawVolume.data 是首次访问时才建立的只读内存映射（跳过 skip 字节，按 endianness 解释），
+   裁剪、切片只会读取用到的页面，不把整个文件读入内存
+4. RawVolumeWriter 按 z 方向的若干帧逐块追加写入，写完后校验体素数并写出 .ini
+
+格式：Unity 支持 int8 / int16 / int32 / uint8 / uint16 / uint32；float16 / float32 / float64
+也可以读写（如 quantize 的 float16 输出），但 Unity 无法导入。
+"""
+
+import os
+
+import numpy as np
+
+# .ini 中的 format -> numpy 类型代码（字节序由 endianness 决定）
+RAW_FORMATS = {
+    'int8': 'i1',
+    'int16': 'i2',
+    'int32': 'i4',
+    'uint8': 'u1',
+    'uint16': 'u2',
+    'uint32': 'u4',
+    'float16': 'f2',
+    'float32': 'f4',
+    'float64': 'f8',
+}
+
+# Unity 的 DatasetIniReader 能读取的格式
+UNITY_FORMATS = ('int8', 'int16', 'int32', 'uint8', 'uint16', 'uint32')
+
+# 旧脚本中出现过的格式别名
+FORMAT_ALIASES = {
+    'uchar': 'uint8',
+    'char': 'int8',
+    'ushort': 'uint16',
+    'short': 'int16',
+    'uint': 'uint32',
+    'int': 'int32',
+    'float': 'float32',
+    'double': 'float64',
+}
+
+ENDIANNESS = {'littleendian': '<', 'bigendian': '>'}
+
+
+def read_ini(ini_path):
+    """
+    解析 .ini（"key:value" 每行一个，也接受 "key=value"）
+
+    Returns:
+        字段名小写、值去掉首尾空白的 dict
+    """
+    params = {}
+    with open(ini_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            separator = ':' if ':' in line else '='
+            if separator in line:
+                key, value = line.split(separator, 1)
+                params[key.strip().lower()] = value.strip()
+    return params
+
+
+def write_ini(raw_path, dims, fmt='uint8', skip=0, endianness='littleendian', extra=None):
+    """
+    写出 raw_path + '.ini'
+
+    Args:
+        dims: (dimx, dimy, dimz)
+        fmt: .ini 中的 format
+        endianness: 'littleendian'（默认，不写入该字段）或 'bigendian'
+        extra: 附加字段的 dict（Unity 会忽略）
+    """
+    dimx, dimy, dimz = dims
+    ini = f'dimx:{dimx}\n' + f'dimy:{dimy}\n' + f'dimz:{dimz}\n' + f'skip:{skip}\n' + f'format:{fmt}\n'
+    if endianness != 'littleendian':
+        ini += f'endianness:{endianness}\n'
+    for key, value in (extra or {}).items():
+        ini += f'{key}:{value}\n'
+    with open(f'{raw_path}.ini', 'w') as f:
+        f.write(ini)
+    return f'{raw_path}.ini'
+
+
+def normalize_format(fmt):
+    """format 名称（含别名）-> RAW_FORMATS 中的名称"""
+    fmt = FORMAT_ALIASES.get(fmt.lower(), fmt.lower())
+    if fmt not in RAW_FORMATS:
+        raise ValueError(f"Unknown raw format: {fmt}")
+    return fmt
+
+
+def raw_dtype(fmt, endianness='littleendian'):
+    """format 与 endianness 对应的 numpy 类型"""
+    if endianness not in ENDIANNESS:
+        raise ValueError(f"Unknown endianness: {endianness}")
+    return np.dtype(RAW_FORMATS[normalize_format(fmt)]).newbyteorder(ENDIANNESS[endianness])
+
+
+def raw_path_for(ini_path):
+    """
+    .ini 对应的 .raw 路径：data.raw.ini -> data.raw；data.ini -> data.raw
+    """
+    base = os.path.splitext(ini_path)[0]
+    if os.path.exists(base) or base.endswith('.raw'):
+        return base
+    return base + '.raw'
+
+
+class RawVolume:
+    """
+    RAW 体数据（由 .ini 描述）
+
+    Attributes:
+        dims: (dimx, dimy, dimz)
+        shape: numpy 视图的形状 (dimz, dimy, dimx)
+        format / endianness / skip: .ini 中的字段
+        dtype: 文件中的 numpy 类型（带字节序）
+        params: .ini 的全部字段
+    """
+
+    def __init__(self, ini_path, raw_path=None):
+        self.ini_path = ini_path
+        self.raw_path = raw_path_for(ini_path) if raw_path is None else raw_path
+        self.params = read_ini(ini_path)
+        self.dims = tuple(int(self.params[key]) for key in ('dimx', 'dimy', 'dimz'))
+        self.skip = int(self.params.get('skip', 0))
+        self.format = normalize_format(self.params.get('format', 'uint8'))
+        self.endianness = self.params.get('endianness', 'littleendian').lower()
+        self.dtype = raw_dtype(self.format, self.endianness)
+        dimx, dimy, dimz = self.dims
+        self.shape = (dimz, dimy, dimx)
+        self._data = None
+
+    @property
+    def nbytes(self):
+        """体数据的字节数（不含 skip）"""
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    @property
+    def data(self):
+        """(dimz, dimy, dimx) 的只读内存映射，首次访问时建立"""
+        if self._data is None:
+            size = os.path.getsize(self.raw_path)
+            if size < self.skip + self.nbytes:
+                raise ValueError(f"{self.raw_path}: {size} bytes, expected {self.skip} + {self.nbytes}")
+            self._data = np.memmap(self.raw_path, dtype=self.dtype, mode='r',
+                                   offset=self.skip, shape=self.shape)
+        return self._data
+
+    def read(self, region=(), dtype=None):
+        """
+        把 data[region] 读入内存（本机字节序的新数组）
+
+        Args:
+            region: 切片元组，如 (slice(z0, z1), slice(y0, y1), slice(x0, x1))
+            dtype: 可选的目标类型，默认与文件相同
+        """
+        values = self.data[region]
+        return np.array(values, dtype=self.dtype.newbyteorder('=') if dtype is None else dtype)
+
+    def frames(self, chunk_frames=16):
+        """按 z 方向逐块遍历：产生 (z0, z1, data[z0:z1]) 的内存映射视图"""
+        for z0 in range(0, self.shape[0], chunk_frames):
+            z1 = min(z0 + chunk_frames, self.shape[0])
+            yield z0, z1, self.data[z0:z1]
+
+
+def open_volume(ini_path, raw_path=None):
+    """打开 .ini 描述的 RAW 体数据（不读取数据）"""
+    return RawVolume(ini_path, raw_path)
+
+
+class RawVolumeWriter:
+    """
+    流式写出 RAW 体数据：按 z 方向逐块追加，close 时校验体素数并写出 .ini
+
+    用法：
+        with RawVolumeWriter(raw_path, (dimx, dimy, dimz), 'uint8') as writer:
+            for block in blocks:          # 每块 (k, dimy, dimx)
+                writer.write(block)
+    """
+
+    def __init__(self, raw_path, dims, fmt='uint8', endianness='littleendian', extra=None):
+        self.raw_path = raw_path
+        self.dims = tuple(int(d) for d in dims)
+        self.format = normalize_format(fmt)
+        self.endianness = endianness
+        self.dtype = raw_dtype(self.format, endianness)
+        self.extra = extra
+        self.written = 0
+        self._file = open(raw_path, 'wb')
+
+    def write(self, block):
+        """追加一块数据（按内存顺序写出，类型不同时转换为文件类型）"""
+        block = np.asarray(block)
+        # 不连续的视图（如内存映射的裁剪 / 降采样）先复制为连续块，tofile 逐元素写出很慢
+        np.ascontiguousarray(block, dtype=self.dtype).tofile(self._file)
+        self.written += block.size
+        return self
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        dimx, dimy, dimz = self.dims
+        if self.written != dimx * dimy * dimz:
+            raise ValueError(f"{self.raw_path}: wrote {self.written} voxels, expected {dimx * dimy * dimz}")
+        write_ini(self.raw_path, self.dims, self.format, endianness=self.endianness, extra=self.extra)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            self._file = None
+
+
+def write_volume(volume, raw_path, fmt=None, endianness='littleendian', chunk_frames=16, extra=None):
+    """
+    把 (dimz, dimy, dimx) 数组（可以是内存映射或其视图）逐块写出为 .raw / .ini
+
+    Args:
+        fmt: 输出格式，默认取 volume 的类型名
+        chunk_frames: 每次写出的 z 帧数，内存映射的输入只会按块读取
+    """
+    dimz, dimy, dimx = volume.shape
+    fmt = volume.dtype.name if fmt is None else fmt
+    with RawVolumeWriter(raw_path, (dimx, dimy, dimz), fmt, endianness, extra) as writer:
+        for z0 in range(0, dimz, chunk_frames):
+            writer.write(volume[z0:z0 + chunk_frames])
+    return raw_path
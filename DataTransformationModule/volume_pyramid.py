@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+多分辨率（LOD）金字塔模块
+用于替代 6_FitToScene.py 中 [::2, ::2, ::2] 隔点抽取的降采样（会产生混叠，且只有一级）
+
+原理：
+1. 每一级按 factor x factor x factor 的块做池化：
+   - 'mean'：块均值（抗混叠），整数格式四舍五入
+   - 'max' / 'min'：块最大 / 最小值（保留峰值 / 谷值）
+   不能整除时边缘的块较小，按实际包含的体素计算
+2. empty_value 不为 None 时，等于 empty_value 的体素（如被裁切的陆地）不参与池化，
+   全部为空的块仍为 empty_value；均值不会被空值拉低
+3. 从内存映射的源数据按 z 方向分块读取，每块的帧数是所有 factor 最小公倍数的整数倍，
+   块不会跨越分块边界；所有级别在同一遍读取中生成，各自流式写出 .raw / .ini
+4. 块和、非空计数与块极值都可以逐级合并：factor 是上一级的整数倍时（2 -> 4 -> 8），
+   直接由上一级的中间量再归约，不必每一级都从原始分辨率计算
+5. 最后写出 JSON 清单：每一级的文件、尺寸与体素大小，供 Unity 先加载粗糙的级别
+"""
+
+import json
+import math
+import os
+from contextlib import ExitStack
+
+import numpy as np
+
+from volume_io import RawVolumeWriter
+
+POOL_METHODS = ('mean', 'max', 'min')
+
+
+def pooled_shape(shape, factor):
+    """池化后的形状（向上取整）"""
+    return tuple(-(-n // factor) for n in shape)
+
+
+def _reduce_blocks(ufunc, values, factor):
+    """沿三个轴按 factor 分块归约（边缘的块可以不满）"""
+    for axis in range(values.ndim):
+        values = ufunc.reduceat(values, np.arange(0, values.shape[axis], factor), axis=axis)
+    return values
+
+
+def _neutral(dtype, method):
+    """max / min 池化时空值的替代值（不影响结果的极值）"""
+    info = np.iinfo(dtype) if np.issubdtype(dtype, np.integer) else np.finfo(dtype)
+    return info.min if method == 'max' else info.max
+
+
+def _pool_state(values, factor, method, empty_value):
+    """
+    池化的中间量 (累加值, 非空计数)：均值为块和（float64），max / min 为块极值；
+    两者都可以继续按更大的块归约（见 _coarsen_state）
+    """
+    valid = None if empty_value is None else values != empty_value
+    if method == 'mean':
+        source = values if valid is None else np.where(valid, values, 0)
+        accumulated = _reduce_blocks(np.add, source.astype(np.float64), factor)
+    else:
+        source = values if valid is None else np.where(valid, values, _neutral(values.dtype, method))
+        accumulated = _reduce_blocks(np.maximum if method == 'max' else np.minimum, source, factor)
+    counts = None if valid is None else _reduce_blocks(np.add, valid.astype(np.int64), factor)
+    return accumulated, counts
+
+
+def _coarsen_state(state, factor, method):
+    """把 k 倍池化的中间量再按 factor 归约，得到 k * factor 倍的中间量"""
+    accumulated, counts = state
+    ufunc = {'mean': np.add, 'max': np.maximum, 'min': np.minimum}[method]
+    accumulated = _reduce_blocks(ufunc, accumulated, factor)
+    return accumulated, None if counts is None else _reduce_blocks(np.add, counts, factor)
+
+
+def _finish_state(state, shape, factor, method, dtype, empty_value):
+    """由中间量得到池化结果（shape 为池化前的形状）"""
+    accumulated, counts = state
+    if method == 'mean':
+        if counts is None:
+            # 每块的体素数：三个轴上块长度的外积（边缘的块较小）
+            cz, cy, cx = (np.minimum(factor, n - np.arange(0, n, factor)) for n in shape)
+            pooled = accumulated / (cz[:, None, None] * cy[None, :, None] * cx[None, None, :])
+        else:
+            pooled = np.full(accumulated.shape, empty_value, dtype=np.float64)
+            np.divide(accumulated, counts, out=pooled, where=counts > 0)
+        if np.issubdtype(dtype, np.integer):
+            np.rint(pooled, out=pooled)
+        return pooled.astype(dtype)
+    pooled = accumulated.astype(dtype)
+    if counts is not None:
+        # 全部为空的块设回空值
+        pooled[counts == 0] = empty_value
+    return pooled
+
+
+def pool_blocks(values, factor, method='mean', empty_value=None):
+    """
+    把 (z, y, x) 数组按 factor 分块池化
+
+    Args:
+        values: (z, y, x) 数组
+        factor: 块边长
+        method: 'mean' / 'max' / 'min'
+        empty_value: 不参与池化的空值；None 表示所有体素都参与
+
+    Returns:
+        与 values 同类型的 pooled_shape(values.shape, factor) 数组
+    """
+    if method not in POOL_METHODS:
+        raise ValueError(f"Unknown pool method: {method}")
+    if factor == 1:
+        return values.copy()
+    state = _pool_state(values, factor, method, empty_value)
+    return _finish_state(state, values.shape, factor, method, values.dtype, empty_value)
+
+
+def build_pyramid(source, out_dir, name, factors=(2, 4, 8), method='mean', empty_value=None,
+                  chunk_bytes=1 << 26):
+    """
+    一遍读取源数据，生成所有级别的 .raw / .ini 与清单
+
+    Args:
+        source: volume_io.RawVolume
+        out_dir: 输出目录
+        name: 输出文件名前缀，第 k 级为 {name}_lod{factor}.raw
+        factors: 各级的降采样倍数
+        method: 'mean' / 'max' / 'min'
+        empty_value: 不参与池化的空值（见 pool_blocks）
+        chunk_bytes: 每次读取的源数据大小上限（按所有 factor 的最小公倍数帧数取整）
+
+    Returns:
+        清单（dict），同时写入 {name}_pyramid.json
+    """
+    if method not in POOL_METHODS:
+        raise ValueError(f"Unknown pool method: {method}")
+    factors = sorted(set(int(f) for f in factors if f > 1))
+    depth, height, width = source.shape
+    step = math.lcm(*factors)
+    frame_bytes = height * width * source.dtype.itemsize
+    chunk_frames = step * max(1, chunk_bytes // (frame_bytes * step))
+
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    levels = [{'factor': 1, 'file': os.path.relpath(source.raw_path, out_dir),
+               'dims': list(source.dims), 'voxel_size': 1}]
+    with ExitStack() as stack:
+        writers = []
+        for factor in factors:
+            d, h, w = pooled_shape(source.shape, factor)
+            raw_path = os.path.join(out_dir, f'{name}_lod{factor}.raw')
+            writers.append(stack.enter_context(
+                RawVolumeWriter(raw_path, (w, h, d), source.format, source.endianness)))
+            levels.append({'factor': factor, 'file': os.path.basename(raw_path),
+                           'dims': [w, h, d], 'voxel_size': factor})
+
+        for z0 in range(0, depth, chunk_frames):
+            slab = source.read((slice(z0, z0 + chunk_frames),))
+            state, previous = None, 1
+            for factor, writer in zip(factors, writers):
+                if state is not None and factor % previous == 0:
+                    state = _coarsen_state(state, factor // previous, method)
+                else:
+                    state = _pool_state(slab, factor, method, empty_value)
+                previous = factor
+                writer.write(_finish_state(state, slab.shape, factor, method, slab.dtype, empty_value))
+
+    manifest = {
+        'source': os.path.relpath(source.ini_path, out_dir),
+        'format': source.format,
+        'method': method,
+        'empty_value': empty_value,
+        'levels': levels,
+    }
+    with open(os.path.join(out_dir, f'{name}_pyramid.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest